@@ -0,0 +1,113 @@
+"""Benchmark the effect of the I/O hints on hashing and copying.
+
+Creates a set of files, then hashes and copies them with the different
+``DTOOL_IO_HINTS`` and ``DTOOL_IO_DROP_CACHE`` settings. Reports the
+throughput and the growth of the page cache ("Cached" in /proc/meminfo,
+Linux only) caused by each run.
+
+Usage::
+
+    python benchmarks/bench_io_hints.py --num-files 64 --file-size-mb 16
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from dtoolcore.filehasher import md5sum_hexdigest
+from dtoolcore.utils import copy_file, drop_from_page_cache
+
+SETTINGS = [
+    ("no hints", "false", "false"),
+    ("sequential", "true", "false"),
+    ("sequential + drop cache", "true", "true"),
+]
+
+
+def page_cache_kb():
+    """Return size of the page cache in kB, or None if unknown."""
+    try:
+        with open("/proc/meminfo") as fh:
+            for line in fh:
+                if line.startswith("Cached:"):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    return None
+
+
+def create_files(directory, num_files, file_size):
+    fpaths = []
+    block = os.urandom(1024 * 1024)
+    for i in range(num_files):
+        fpath = os.path.join(directory, "item_{}.bin".format(i))
+        with open(fpath, "wb") as fh:
+            remaining = file_size
+            while remaining > 0:
+                fh.write(block[:remaining])
+                remaining -= len(block)
+            drop_from_page_cache(fh)
+        fpaths.append(fpath)
+    return fpaths
+
+
+def evict(fpaths):
+    for fpath in fpaths:
+        with open(fpath, "rb") as fh:
+            drop_from_page_cache(fh)
+
+
+def run(label, func, fpaths, total_bytes):
+    evict(fpaths)
+    cached_before = page_cache_kb()
+    start = time.time()
+    for fpath in fpaths:
+        func(fpath)
+    elapsed = time.time() - start
+    cached_after = page_cache_kb()
+    growth = "n/a"
+    if cached_before is not None:
+        growth = "{:.1f} MB".format((cached_after - cached_before) / 1024.0)
+    print("{:<12} {:<26} {:>8.1f} MB/s  page cache growth: {}".format(
+        label,
+        os.environ["DTOOL_IO_HINTS"] + "/" + os.environ["DTOOL_IO_DROP_CACHE"],
+        total_bytes / elapsed / 1024.0 / 1024.0,
+        growth
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-files", type=int, default=32)
+    parser.add_argument("--file-size-mb", type=int, default=16)
+    parser.add_argument("--directory", default=None)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(dir=args.directory)
+    dest_directory = os.path.join(directory, "dest")
+    os.mkdir(dest_directory)
+    try:
+        file_size = args.file_size_mb * 1024 * 1024
+        fpaths = create_files(directory, args.num_files, file_size)
+        total_bytes = file_size * args.num_files
+
+        def copy(fpath):
+            dest = os.path.join(dest_directory, os.path.basename(fpath))
+            copy_file(fpath, dest)
+
+        for label, hints, drop_cache in SETTINGS:
+            os.environ["DTOOL_IO_HINTS"] = hints
+            os.environ["DTOOL_IO_DROP_CACHE"] = drop_cache
+            print(label)
+            run("hash", md5sum_hexdigest, fpaths, total_bytes)
+            run("copy", copy, fpaths, total_bytes)
+            evict([os.path.join(dest_directory, f)
+                   for f in os.listdir(dest_directory)])
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Benchmark the JSON codecs on large manifests.
+
+Generates a manifest with the given number of items, then encodes, writes,
+reads and decodes it with each installed codec, the same way the
+``DiskStorageBroker`` stores manifests. One million items give a manifest of
+about 200 MB.
+
+Usage::
+
+    python benchmarks/bench_json_codec.py --num-items 1000000
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from dtoolcore.jsoncodec import get_json_codec, list_json_codecs
+from dtoolcore.utils import generate_identifier
+
+
+def generate_manifest(num_items):
+    items = {}
+    for i in range(num_items):
+        relpath = "data/plate_{}/well_{}.tif".format(i // 384, i % 384)
+        items[generate_identifier(relpath)] = {
+            "relpath": relpath,
+            "size_in_bytes": 1024 * 1024 + i,
+            "hash": "{:032x}".format(i * 2654435761),
+            "utc_timestamp": 1700000000.0 + i / 10.0,
+        }
+    return {
+        "dtoolcore_version": "3.20.0",
+        "hash_function": "md5sum_hexdigest",
+        "items": items,
+    }
+
+
+def timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return result, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-items", type=int, default=1000000)
+    parser.add_argument("--directory", default=None)
+    args = parser.parse_args()
+
+    manifest = generate_manifest(args.num_items)
+    directory = tempfile.mkdtemp(dir=args.directory)
+    fpath = os.path.join(directory, "manifest.json")
+    try:
+        print("{:<8} {:>10} {:>10} {:>10} {:>10} {:>10}".format(
+            "codec", "size MB", "dumps s", "write s", "read s", "loads s"
+        ))
+        for name in list_json_codecs():
+            codec = get_json_codec(name)
+            text, dumps_time = timed(codec.dumps, manifest, 2, True)
+
+            def write():
+                with open(fpath, "w") as fh:
+                    fh.write(text)
+
+            def read():
+                with open(fpath) as fh:
+                    return fh.read()
+
+            _, write_time = timed(write)
+            read_text, read_time = timed(read)
+            decoded, loads_time = timed(codec.loads, read_text)
+            assert len(decoded["items"]) == args.num_items
+
+            print("{:<8} {:>10.1f} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f}".format(  # NOQA
+                name,
+                os.path.getsize(fpath) / 1024.0 / 1024.0,
+                dumps_time,
+                write_time,
+                read_time,
+                loads_time
+            ))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
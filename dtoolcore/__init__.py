@@ -3,17 +3,22 @@
 """
 
 import os
+import contextlib
 
 import datetime
 import logging
 import multiprocessing as mp
 import shutil
 import tempfile
+import threading
 import uuid
 
 from collections import defaultdict
 
 import dtoolcore.utils
+import dtoolcore.merkle
+import dtoolcore.overlaycolumn
+import dtoolcore.overlayindex
 
 logger = logging.getLogger(__name__)
 
@@ -54,9 +59,9 @@ def _get_identifier_and_item_properties(d):
     return key, value
 
 
-def _generate_storage_broker_lookup():
-    """Return dictionary of available storage brokers."""
-    logger.debug("In _generate_storage_broker_lookup...")
+def _load_storage_broker_entry_points():
+    """Return dictionary of the storage brokers registered as entry points."""
+    logger.debug("In _load_storage_broker_entry_points...")
     storage_broker_lookup = dict()
 
     from importlib.metadata import entry_points
@@ -71,22 +76,84 @@ def _generate_storage_broker_lookup():
     for entrypoint in entrypoints:
         StorageBroker = entrypoint.load()
         key = StorageBroker.key
-        logger.debug("_gnerate_stroage_broker_lookup.key: {}".format(key))
+        logger.debug("_load_storage_broker_entry_points.key: {}".format(key))
         storage_broker_lookup[key] = StorageBroker
-    logger.debug("_generate_storage_broker_lookup.return: {}".format(
+    logger.debug("_load_storage_broker_entry_points.return: {}".format(
         storage_broker_lookup
     ))
     return storage_broker_lookup
 
 
+# The storage broker lookup is built from the entry points once per process,
+# because scanning entry points walks all installed distributions.
+_STORAGE_BROKER_LOOKUP = None
+_REGISTERED_STORAGE_BROKERS = dict()
+_STORAGE_BROKER_LOOKUP_LOCK = threading.Lock()
+
+
+def _generate_storage_broker_lookup():
+    """Return dictionary of available storage brokers.
+
+    The entry points are only scanned the first time this function is called,
+    see :func:`dtoolcore.refresh_storage_broker_lookup`.
+    """
+    global _STORAGE_BROKER_LOOKUP
+    with _STORAGE_BROKER_LOOKUP_LOCK:
+        if _STORAGE_BROKER_LOOKUP is None:
+            storage_broker_lookup = _load_storage_broker_entry_points()
+            storage_broker_lookup.update(_REGISTERED_STORAGE_BROKERS)
+            _STORAGE_BROKER_LOOKUP = storage_broker_lookup
+        return _STORAGE_BROKER_LOOKUP
+
+
+def refresh_storage_broker_lookup():
+    """Scan the entry points for storage brokers again.
+
+    Use this after installing a storage broker plugin in a running process.
+    Storage brokers registered using
+    :func:`dtoolcore.register_storage_broker` are kept.
+
+    :returns: dictionary of available storage brokers keyed by URI scheme
+    """
+    global _STORAGE_BROKER_LOOKUP
+    with _STORAGE_BROKER_LOOKUP_LOCK:
+        _STORAGE_BROKER_LOOKUP = None
+    return dict(_generate_storage_broker_lookup())
+
+
+def register_storage_broker(StorageBroker):
+    """Make a storage broker class available without an entry point.
+
+    The storage broker is registered for the URI scheme given by its
+    ``key`` attribute, replacing any storage broker already registered for
+    that scheme.
+
+    :param StorageBroker: storage broker class
+    """
+    with _STORAGE_BROKER_LOOKUP_LOCK:
+        _REGISTERED_STORAGE_BROKERS[StorageBroker.key] = StorageBroker
+        if _STORAGE_BROKER_LOOKUP is not None:
+            _STORAGE_BROKER_LOOKUP[StorageBroker.key] = StorageBroker
+
+
 def _get_storage_broker(uri, config_path):
     """Helper function to enable use lookup of appropriate storage brokers."""
     logger.debug("In _get_storage_broker...")
     uri = dtoolcore.utils.sanitise_uri(uri)
+    return _get_storage_broker_from_sanitised_uri(uri, config_path)
+
+
+def _get_storage_broker_class(uri):
+    """Return storage broker class for a URI that has been sanitised."""
     storage_broker_lookup = _generate_storage_broker_lookup()
     logger.debug("_get_storage_broker.calling.utils.generous_parse_uri")
     parsed_uri = dtoolcore.utils.generous_parse_uri(uri)
-    StorageBroker = storage_broker_lookup[parsed_uri.scheme]
+    return storage_broker_lookup[parsed_uri.scheme]
+
+
+def _get_storage_broker_from_sanitised_uri(uri, config_path):
+    """Return storage broker for a URI that has been sanitised."""
+    StorageBroker = _get_storage_broker_class(uri)
     storage_broker = StorageBroker(uri, config_path)
     logger.debug("_get_storage_broker.return: {}".format(storage_broker))
     return storage_broker
@@ -112,6 +179,20 @@ def _is_dataset(uri, config_path):
     return storage_broker.has_admin_metadata()
 
 
+def _consolidated_metadata_enabled(config_path):
+    """Return True if consolidated metadata is written on freeze.
+
+    Controlled by ``DTOOL_CONSOLIDATED_METADATA`` (default false).
+    """
+    return dtoolcore.utils.config_value_is_true(
+        dtoolcore.utils.get_config_value(
+            "DTOOL_CONSOLIDATED_METADATA",
+            config_path,
+            default=False
+        )
+    )
+
+
 def generate_admin_metadata(name, creator_username=None):
     """Return admin metadata as a dictionary."""
     logger.debug("In generate_admin_metadata...")
@@ -176,7 +257,8 @@ def create_proto_dataset(
     name,
     base_uri,
     readme_content="",
-    creator_username=None
+    creator_username=None,
+    config_path=None
 ):
     """Return :class:`dtoolcore.ProtoDataSet` instance.
 
@@ -184,10 +266,15 @@ def create_proto_dataset(
     :param base_uri: base URI for proto dataset
     :param readme_content: content of README as a string
     :param creator_username: creator username
+    :param config_path: path to dtool configuration file
     """
     logger.debug("In create_proto_dataset...")
     admin_metadata = generate_admin_metadata(name, creator_username)
-    proto_dataset = generate_proto_dataset(admin_metadata, base_uri)
+    proto_dataset = generate_proto_dataset(
+        admin_metadata,
+        base_uri,
+        config_path
+    )
     proto_dataset.create()
     proto_dataset.put_readme(readme_content)
     return proto_dataset
@@ -238,6 +325,10 @@ def _copy_create_proto_dataset(
     admin_metadata = src_dataset._admin_metadata
     admin_metadata["type"] = "protodataset"
 
+    # The link mode describes how the items of the source were stored, not
+    # how they will be stored in the copy.
+    admin_metadata.pop("link_mode", None)
+
     proto_dataset = generate_proto_dataset(
         admin_metadata=admin_metadata,
         base_uri=dest_base_uri,
@@ -253,7 +344,15 @@ def _copy_create_proto_dataset(
     return proto_dataset
 
 
-def _copy_content(src_dataset, dest_proto_dataset, progressbar=None):
+def _copy_content(
+    src_dataset,
+    dest_proto_dataset,
+    progressbar=None,
+    num_threads=None,
+    progress_callback=None,
+    link=False,
+    reference_dataset=None
+):
 
     # When using ``dtoolcore.copy`` there should be no handles in the
     # destination proto dataset so this funciton will return an empty
@@ -261,7 +360,8 @@ def _copy_content(src_dataset, dest_proto_dataset, progressbar=None):
     # When using ``dtoolcore.copy_resume`` there may be handles in the
     # destination proto dataset. We therefore need to get the properties
     # of the item associated with the handle so that we can use the size
-    # to ensure that the item has been copied across successfully.
+    # to ensure that the item has been copied across successfully. This is
+    # only needed for storage brokers that do not keep an item journal.
     def get_dest_sizes(dest_proto_dataset):
         sizes = {}
         for handle in dest_proto_dataset._storage_broker.iter_item_handles():
@@ -270,11 +370,33 @@ def _copy_content(src_dataset, dest_proto_dataset, progressbar=None):
             sizes[identifier] = size
         return sizes
 
-    dest_sizes = get_dest_sizes(dest_proto_dataset)
+    dest_storage_broker = dest_proto_dataset._storage_broker
+
+    # Storage brokers that keep an item journal record items that have been
+    # copied and verified. This allows resuming without walking the
+    # destination and without trusting items with the right size but
+    # incomplete content.
+    journal = dest_storage_broker.get_item_journal()
+    if journal is None:
+        dest_sizes = get_dest_sizes(dest_proto_dataset)
+    else:
+        dest_sizes = {}
     dest_identifiers = set(dest_sizes.keys())
+
+    verify_hash = src_dataset._manifest["hash_function"] \
+        == dest_storage_broker.hasher.name
+
+    to_copy = []
     for identifier in src_dataset.identifiers:
         src_properties = src_dataset.item_properties(identifier)
 
+        if journal is not None and identifier in journal:
+            journal_size = journal[identifier]["size_in_bytes"]
+            if journal_size == src_properties["size_in_bytes"]:
+                if progressbar:
+                    progressbar.update(1)
+                continue
+
         # We don't want to redo the copy of the item if it has already been
         # done successfully.
         if identifier in dest_identifiers:
@@ -285,33 +407,213 @@ def _copy_content(src_dataset, dest_proto_dataset, progressbar=None):
                     progressbar.update(1)
                 continue
 
-        src_abspath = src_dataset.item_content_abspath(identifier)
-        relpath = src_properties["relpath"]
-        dest_proto_dataset.put_item(src_abspath, relpath)
-        if progressbar:
-            progressbar.item_show_func = lambda x: relpath
-            progressbar.update(1)
+        to_copy.append(identifier)
+
+    # Copy the largest items first so that the copy does not finish with a
+    # single large item being transferred while the other workers are idle.
+    to_copy.sort(
+        key=lambda i: src_dataset.item_properties(i)["size_in_bytes"],
+        reverse=True
+    )
+
+    # Items with the same content in the reference dataset are taken from
+    # there rather than from the source. Items of the frozen reference dataset
+    # are immutable so they can be linked.
+    reference_lookup = {}
+    if reference_dataset is not None:
+        reference_lookup = _reference_lookup(src_dataset, reference_dataset)
+
+    # Fetching the content (which may involve a download for remote storage
+    # brokers) and putting it into the destination are pipelined. At most
+    # a bounded number of fetched items wait to be written at any time.
+    num_threads = dtoolcore.utils.get_num_threads(num_threads)
+
+    relpath_to_identifier = {
+        src_dataset.item_properties(i)["relpath"]: i for i in to_copy
+    }
+    progress_lock = threading.Lock()
+
+    def fetch_from_reference(identifier):
+        abspath = reference_dataset.item_content_abspath(
+            reference_lookup[identifier]
+        )
+        return abspath, src_dataset.item_properties(identifier)["relpath"]
+
+    def fetch_from_source(identifier):
+        abspath = src_dataset.item_content_abspath(identifier)
+        return abspath, src_dataset.item_properties(identifier)["relpath"]
+
+    def reused_item_properties(handle, src_properties):
+        # A hardlinked item has the content of the immutable item it was
+        # linked to and an item taken from the reference dataset has the
+        # content recorded in its manifest, so the hash is taken from the
+        # manifest rather than calculated again.
+        properties = {
+            "relpath": dest_storage_broker.get_relpath(handle),
+            "size_in_bytes": dest_storage_broker.get_size_in_bytes(handle),
+            "utc_timestamp": dest_storage_broker.get_utc_timestamp(handle),
+            "hash": src_properties["hash"],
+        }
+        if properties["size_in_bytes"] != src_properties["size_in_bytes"]:
+            raise DtoolCoreCopyError(
+                "Size of reused item {} does not match source".format(
+                    properties["relpath"]
+                )
+            )
+        return properties
+
+    def journaled_item_properties(identifier, handle):
+        # Some storage brokers, e.g. the DedupDiskStorageBroker, journal the
+        # hash calculated while storing the item. Entries from an earlier,
+        # interrupted copy are only used if the item has not changed since.
+        entry = dest_storage_broker.get_item_journal_entry(identifier)
+        if entry is None:
+            return None
+        if entry["size_in_bytes"] \
+                != dest_storage_broker.get_size_in_bytes(handle) \
+                or entry["utc_timestamp"] \
+                != dest_storage_broker.get_utc_timestamp(handle):
+            return None
+        return entry
+
+    def stored(relpath, handle):
+        identifier = relpath_to_identifier[relpath]
+        src_properties = src_dataset.item_properties(identifier)
+        if journal is not None:
+            properties = journaled_item_properties(identifier, handle)
+            journaled = properties is not None
+            if not journaled:
+                reused = identifier in reference_lookup \
+                    or dest_storage_broker.is_linked(handle)
+                if verify_hash and reused:
+                    properties = reused_item_properties(
+                        handle,
+                        src_properties
+                    )
+                else:
+                    properties = dest_storage_broker.item_properties(handle)
+            if verify_hash and properties["hash"] != src_properties["hash"]:
+                raise DtoolCoreCopyError(
+                    "Hash of copied item {} does not match source".format(
+                        relpath
+                    )
+                )
+            if not journaled:
+                dest_storage_broker.add_item_journal_entry(
+                    identifier,
+                    properties
+                )
+
+        # Storage brokers may call this function from worker threads.
+        with progress_lock:
+            if progressbar:
+                progressbar.item_show_func = lambda x: relpath
+                progressbar.update(1)
+
+    def copied(num_bytes):
+        # Called from worker threads as the content is stored.
+        with progress_lock:
+            progress_callback(num_bytes)
+
+    stages = [
+        (
+            fetch_from_reference,
+            [i for i in to_copy if i in reference_lookup],
+            True
+        ),
+        (
+            fetch_from_source,
+            [i for i in to_copy if i not in reference_lookup],
+            link
+        ),
+    ]
+    for fetch, identifiers, link_items in stages:
+        if not identifiers:
+            continue
+        fetched_items = dtoolcore.utils.threaded_imap_unordered(
+            fetch,
+            identifiers,
+            num_threads
+        )
+        dest_proto_dataset.put_items(
+            fetched_items,
+            link=link_items,
+            callback=stored,
+            num_threads=num_threads,
+            progress_callback=copied if progress_callback else None
+        )
 
     dest_proto_dataset.put_readme(src_dataset.get_readme_content())
 
-    for tag in src_dataset.list_tags():
-        dest_proto_dataset.put_tag(tag)
+    with dest_proto_dataset.metadata_batch():
+        dest_proto_dataset.put_tags(src_dataset.list_tags())
+
+        for overlay_name in src_dataset.list_overlay_names():
+            overlay = src_dataset.get_overlay(overlay_name)
+            dest_proto_dataset._put_overlay(overlay_name, overlay)
 
-    for overlay_name in src_dataset.list_overlay_names():
-        overlay = src_dataset.get_overlay(overlay_name)
-        dest_proto_dataset._put_overlay(overlay_name, overlay)
+        dest_proto_dataset.put_annotations(src_dataset.get_annotations())
 
-    for annotation_name in src_dataset.list_annotation_names():
-        annotation = src_dataset.get_annotation(annotation_name)
-        dest_proto_dataset.put_annotation(annotation_name, annotation)
 
+def _reference_lookup(src_dataset, reference_dataset):
+    """Return dictionary mapping source to reference identifiers.
 
-def copy(src_uri, dest_base_uri, config_path=None, progressbar=None):
+    Only items with the same hash and size in both datasets are included.
+    The lookup is empty if the datasets use different hash functions.
+    """
+    src_hash_function = src_dataset._manifest["hash_function"]
+    reference_hash_function = reference_dataset._manifest["hash_function"]
+    if src_hash_function != reference_hash_function:
+        logger.warning(
+            "Hash functions of {} and reference {} differ ({} != {})".format(
+                src_dataset.uri,
+                reference_dataset.uri,
+                src_hash_function,
+                reference_hash_function
+            )
+        )
+        return {}
+
+    content_to_reference = {}
+    for identifier in reference_dataset.identifiers:
+        properties = reference_dataset.item_properties(identifier)
+        key = (properties["hash"], properties["size_in_bytes"])
+        content_to_reference[key] = identifier
+
+    lookup = {}
+    for identifier in src_dataset.identifiers:
+        properties = src_dataset.item_properties(identifier)
+        key = (properties["hash"], properties["size_in_bytes"])
+        if key in content_to_reference:
+            lookup[identifier] = content_to_reference[key]
+    return lookup
+
+
+def copy(
+    src_uri,
+    dest_base_uri,
+    config_path=None,
+    progressbar=None,
+    num_threads=None,
+    progress_callback=None,
+    link=False
+):
     """Copy a dataset to another location.
 
+    Items are copied concurrently, largest first.
+
+    Items of frozen datasets are immutable, so if link is True the items are
+    hardlinked into the destination when it is on the same file system as
+    the source, see :meth:`dtoolcore.ProtoDataSet.put_item`.
+
     :param src_uri: URI of dataset to be copied
     :param dest_base_uri: base of URI for copy target
     :param config_path: path to dtool configuration file
+    :param num_threads: number of threads used to copy items, see
+                        :func:`dtoolcore.utils.get_num_threads`
+    :param progress_callback: function called with the number of bytes
+                              copied as the content of the items is stored
+    :param link: hardlink items rather than copying them where possible
     :returns: URI of new dataset
     """
     logger.debug("Copy {} -> {}".format(src_uri, dest_base_uri))
@@ -323,22 +625,44 @@ def copy(src_uri, dest_base_uri, config_path=None, progressbar=None):
         config_path,
         progressbar
     )
-    _copy_content(dataset, proto_dataset, progressbar)
+    _copy_content(
+        dataset,
+        proto_dataset,
+        progressbar,
+        num_threads,
+        progress_callback,
+        link
+    )
     proto_dataset.freeze(progressbar=progressbar)
 
     return proto_dataset.uri
 
 
-def copy_resume(src_uri, dest_base_uri, config_path=None, progressbar=None):
+def copy_resume(
+    src_uri,
+    dest_base_uri,
+    config_path=None,
+    progressbar=None,
+    num_threads=None,
+    progress_callback=None,
+    link=False
+):
     """Resume coping a dataset to another location.
 
-    Items that have been copied to the destination and have the same size
-    as in the source dataset are skipped. All other items are copied across
-    and the dataset is frozen.
+    Items recorded in the item journal of the destination, i.e. items that
+    have been copied and verified, are skipped. For storage brokers that do
+    not keep an item journal, items that have the same size as in the source
+    dataset are skipped. All other items are copied across and the dataset
+    is frozen, reusing the hashes recorded in the item journal.
 
     :param src_uri: URI of dataset to be copied
     :param dest_base_uri: base of URI for copy target
     :param config_path: path to dtool configuration file
+    :param num_threads: number of threads used to copy items, see
+                        :func:`dtoolcore.utils.get_num_threads`
+    :param progress_callback: function called with the number of bytes
+                              copied as the content of the items is stored
+    :param link: hardlink items rather than copying them where possible
     :returns: URI of new dataset
     """
     logger.debug("Copy resume {} -> {}".format(src_uri, dest_base_uri))
@@ -349,7 +673,14 @@ def copy_resume(src_uri, dest_base_uri, config_path=None, progressbar=None):
 
     proto_dataset = ProtoDataSet.from_uri(dest_uri)
 
-    _copy_content(dataset, proto_dataset, progressbar)
+    _copy_content(
+        dataset,
+        proto_dataset,
+        progressbar,
+        num_threads,
+        progress_callback,
+        link
+    )
 
     # jlh, 2021/09/06: Do we need conditional checks here?  # As I understand
     # the mechanism, copying only works for frozen source datasets. When the
@@ -369,13 +700,74 @@ def copy_resume(src_uri, dest_base_uri, config_path=None, progressbar=None):
     return proto_dataset.uri
 
 
+def sync(
+    src_uri,
+    dest_base_uri,
+    reference_uri=None,
+    config_path=None,
+    progressbar=None,
+    num_threads=None,
+    progress_callback=None
+):
+    """Copy a dataset reusing the items already present in a reference dataset.
+
+    Items whose hash and size match an item in the reference dataset, for
+    example a previous version of the dataset already present at the
+    destination, are hardlinked or copied from the reference dataset where
+    possible. Only the remaining items are transferred from the source. The
+    hash functions of the source and reference datasets must match for any
+    items to be reused.
+
+    :param src_uri: URI of dataset to be copied
+    :param dest_base_uri: base of URI for copy target
+    :param reference_uri: URI of dataset with items that can be reused
+    :param config_path: path to dtool configuration file
+    :param num_threads: number of threads used to copy items, see
+                        :func:`dtoolcore.utils.get_num_threads`
+    :param progress_callback: function called with the number of bytes
+                              copied as the content of the items is stored
+    :returns: URI of new dataset
+    """
+    logger.debug("Sync {} -> {} (reference {})".format(
+        src_uri,
+        dest_base_uri,
+        reference_uri
+    ))
+    dataset = DataSet.from_uri(src_uri, config_path)
+
+    reference_dataset = None
+    if reference_uri is not None:
+        reference_dataset = DataSet.from_uri(reference_uri, config_path)
+
+    proto_dataset = _copy_create_proto_dataset(
+        dataset,
+        dest_base_uri,
+        config_path,
+        progressbar
+    )
+    _copy_content(
+        dataset,
+        proto_dataset,
+        progressbar,
+        num_threads,
+        progress_callback,
+        reference_dataset=reference_dataset
+    )
+    proto_dataset.freeze(progressbar=progressbar)
+
+    return proto_dataset.uri
+
+
 def _iter_datasets_in_base_uri(base_uri, dataset_cls):
     base_uri = dtoolcore.utils.sanitise_uri(base_uri)
     config_path = dtoolcore.utils.DEFAULT_CONFIG_PATH
-    StorageBroker = _get_storage_broker(base_uri, config_path)
-    for uri in StorageBroker.list_dataset_uris(base_uri, config_path):
+    StorageBroker = _get_storage_broker_class(base_uri)
+    for uri in StorageBroker.iter_dataset_uris(base_uri, config_path):
+        # The URIs come from the storage broker, so they do not need to be
+        # sanitised or looked up again.
+        storage_broker = StorageBroker(uri, config_path)
         try:
-            dataset = dataset_cls.from_uri(uri)
+            dataset = dataset_cls.from_broker(uri, storage_broker, config_path)
             yield dataset
         except DtoolCoreTypeError:
             pass
@@ -419,32 +811,156 @@ class DtoolCoreBrokenStagingPromise(IOError):
     pass
 
 
+class DtoolCoreCopyError(IOError):
+    pass
+
+
+class _MetadataBatch(object):
+    """Metadata writes buffered by :meth:`_BaseDataSet.metadata_batch`."""
+
+    def __init__(self):
+        self.annotations = {}
+        self.deleted_annotations = set()
+        self.tags = set()
+        self.deleted_tags = set()
+        self.overlays = {}
+        self.overlay_columns = {}
+        self.identifiers = None
+        self.metadata_changed = False
+
+    def put_annotation(self, annotation_name, annotation):
+        self.annotations[annotation_name] = annotation
+        self.deleted_annotations.discard(annotation_name)
+
+    def delete_annotation(self, annotation_name):
+        self.annotations.pop(annotation_name, None)
+        self.deleted_annotations.add(annotation_name)
+
+    def put_tag(self, tag):
+        self.tags.add(tag)
+        self.deleted_tags.discard(tag)
+
+    def delete_tag(self, tag):
+        self.tags.discard(tag)
+        self.deleted_tags.add(tag)
+
+    def put_overlay(self, overlay_name, overlay):
+        self.overlays[overlay_name] = overlay
+        self.overlay_columns.pop(overlay_name, None)
+
+
 class _BaseDataSet(object):
     """Base class for datasets."""
 
-    def __init__(self, uri, admin_metadata, config_path=None):
+    #: Value of "type" in the administrative metadata of the dataset class.
+    _admin_metadata_type = None
+
+    def __init__(self, uri, admin_metadata, config_path=None,
+                 storage_broker=None):
 
         logger.debug("Initialising _BaseDataSet...")
-        uri = dtoolcore.utils.sanitise_uri(uri)
+        if storage_broker is None:
+            uri = dtoolcore.utils.sanitise_uri(uri)
+            storage_broker = _get_storage_broker_from_sanitised_uri(
+                uri,
+                config_path
+            )
 
         self._admin_metadata = admin_metadata
-        self._storage_broker = _get_storage_broker(uri, config_path)
+        self._storage_broker = storage_broker
         self._uri = uri
+        self._config_path = config_path
+        self._consolidated_metadata = None
+        self._metadata_batch = None
 
     @classmethod
     def _from_uri_with_typecheck(cls, uri, config_path, type_name):
+        uri = dtoolcore.utils.sanitise_uri(uri)
+        storage_broker = _get_storage_broker_from_sanitised_uri(
+            uri,
+            config_path
+        )
+
         # Make sure that the URI refers to a dataset.
-        if not _is_dataset(uri, config_path):
+        if not storage_broker.has_admin_metadata():
             raise(DtoolCoreTypeError("{} is not a dataset".format(uri)))
 
-        # Get the admin metadata out of the URI and type check.
-        admin_metadata = _admin_metadata_from_uri(uri, config_path)
+        admin_metadata, consolidated = cls._read_admin_metadata(
+            storage_broker
+        )
+        return cls._from_admin_metadata_with_typecheck(
+            uri,
+            admin_metadata,
+            config_path,
+            storage_broker,
+            type_name,
+            consolidated
+        )
+
+    @classmethod
+    def _read_admin_metadata(cls, storage_broker):
+        """Return admin metadata and consolidated metadata, if used."""
+        return storage_broker.get_admin_metadata(), None
+
+    @classmethod
+    def _from_admin_metadata_with_typecheck(cls, uri, admin_metadata,
+                                            config_path, storage_broker,
+                                            type_name, consolidated=None):
         if admin_metadata['type'] != type_name:
             raise DtoolCoreTypeError(
                 "{} is not a {}".format(uri, cls.__name__))
+        dataset = cls(uri, admin_metadata, config_path, storage_broker)
+        dataset._consolidated_metadata = consolidated
+        return dataset
 
-        # Instantiate and return.
-        return cls(uri, admin_metadata, config_path)
+    @classmethod
+    def from_broker(cls, uri, storage_broker, config_path=None):
+        """
+        Return an existing dataset using an existing storage broker.
+
+        The administrative metadata is read once using the storage broker.
+
+        :param uri: sanitised URI of the dataset, as generated by the storage
+                    broker
+        :param storage_broker: storage broker instance for the URI
+        :param config_path: path to the dtool configuration file
+        :raises: DtoolCoreTypeError if the dataset is of another type
+        :returns: instance of the class
+        """
+        admin_metadata, consolidated = cls._read_admin_metadata(
+            storage_broker
+        )
+        return cls._from_admin_metadata_with_typecheck(
+            uri,
+            admin_metadata,
+            config_path,
+            storage_broker,
+            cls._admin_metadata_type,
+            consolidated
+        )
+
+    @classmethod
+    def from_admin_metadata(cls, uri, admin_metadata, config_path=None,
+                            storage_broker=None):
+        """
+        Return an existing dataset from administrative metadata already read.
+
+        Nothing is read from the storage.
+
+        :param uri: sanitised URI of the dataset
+        :param admin_metadata: administrative metadata of the dataset
+        :param config_path: path to the dtool configuration file
+        :param storage_broker: optional storage broker instance for the URI
+        :raises: DtoolCoreTypeError if the dataset is of another type
+        :returns: instance of the class
+        """
+        return cls._from_admin_metadata_with_typecheck(
+            uri,
+            admin_metadata,
+            config_path,
+            storage_broker,
+            cls._admin_metadata_type
+        )
 
     @property
     def base_uri(self):
@@ -489,6 +1005,7 @@ class _BaseDataSet(object):
         self._admin_metadata['name'] = new_name
         if self._storage_broker.has_admin_metadata():
             self._storage_broker.put_admin_metadata(self._admin_metadata)
+            self._update_consolidated_metadata()
 
     def get_readme_content(self):
         """
@@ -497,33 +1014,132 @@ class _BaseDataSet(object):
         :returns: content of README as a string
         """
         logger.debug("Get readme content {}".format(self))
+        consolidated = self._current_consolidated_metadata()
+        if consolidated is not None and consolidated["readme"] is not None:
+            return consolidated["readme"]
         return self._storage_broker.get_readme_content()
 
-    def _put_overlay(self, overlay_name, overlay):
-        """Store overlay so that it is accessible by the given name.
+    def _current_consolidated_metadata(self):
+        """Return the consolidated metadata read when the dataset was opened.
 
-        :param overlay_name: name of the overlay
-        :param overlay: overlay must be a dictionary where the keys are
-                        identifiers in the dataset
-        :raises: DtoolCoreTypeError if the overlay is not a dictionary,
-                 DtoolCoreValueError if identifiers in overlay and dataset do
-                 not match
-                 DtoolCoreInvalidNameError if the overlay name is invalid
+        The fingerprint of the snapshot is checked when the dataset is
+        opened; the snapshot is then used for the lifetime of the instance,
+        like the manifest. Updates through the instance drop it.
         """
-        logger.debug("Put readme content {}".format(self))
+        return self._consolidated_metadata
+
+    def _update_consolidated_metadata(self):
+        """Account for a metadata update in the consolidated metadata."""
+        pass
+
+    @contextlib.contextmanager
+    def metadata_batch(self):
+        """Context manager buffering metadata writes until it exits.
+
+        Annotations, tags and overlays put or deleted inside the context are
+        validated straight away, but only written to the storage when the
+        context exits, concurrently where the storage broker supports it.
+        Overlays are validated against an identifier set that is generated
+        once for the whole batch and the consolidated metadata snapshot, if
+        the dataset has one, is regenerated once. Nothing is written if the
+        context exits with an exception.
+
+        Reads inside the context return the metadata as it was before the
+        batch. Nested batches are part of the outermost batch.
 
+        Usage::
+
+            with dataset.metadata_batch():
+                for name, value in annotations.items():
+                    dataset.put_annotation(name, value)
+                dataset.put_tag("reviewed")
+        """
+        if self._metadata_batch is not None:
+            yield self
+            return
+
+        batch = _MetadataBatch()
+        self._metadata_batch = batch
+        try:
+            yield self
+        finally:
+            self._metadata_batch = None
+        self._commit_metadata_batch(batch)
+
+    def _commit_metadata_batch(self, batch):
+        """Write the metadata buffered in the batch to the storage."""
+        logger.debug("Commit metadata batch {}".format(self))
+        if batch.deleted_annotations:
+            self._storage_broker.delete_annotations(
+                sorted(batch.deleted_annotations)
+            )
+        if batch.annotations:
+            self._storage_broker.put_annotations(batch.annotations)
+        if batch.deleted_tags:
+            self._storage_broker.delete_tags(sorted(batch.deleted_tags))
+        if batch.tags:
+            self._storage_broker.put_tags(sorted(batch.tags))
+        if batch.overlays:
+            self._storage_broker.put_overlays(batch.overlays)
+        # Columns record the state of the overlay they were built from, so
+        # they are written after the overlays.
+        for overlay_name, column in batch.overlay_columns.items():
+            self._storage_broker.put_overlay_column(
+                overlay_name,
+                column.typecode,
+                column.to_bytes()
+            )
+
+    def _identifier_set(self):
+        """Return set of item identifiers, cached for a metadata batch."""
+        batch = self._metadata_batch
+        if batch is None:
+            return set(self._identifiers())
+        if batch.identifiers is None:
+            batch.identifiers = set(self._identifiers())
+        return batch.identifiers
+
+    def _check_overlay(self, overlay_name, overlay):
+        """Raise if the overlay cannot be stored under the given name."""
         if not dtoolcore.utils.name_is_valid(overlay_name):
             raise(DtoolCoreInvalidNameError())
 
         if not isinstance(overlay, dict):
             raise DtoolCoreTypeError("Overlay must be dict")
 
-        if set(self._identifiers()) != set(overlay.keys()):
+        if self._identifier_set() != overlay.keys():
             raise DtoolCoreValueError(
                 "Overlay keys must be dataset identifiers"
             )
 
-        self._storage_broker.put_overlay(overlay_name, overlay)
+    def _put_overlay(self, overlay_name, overlay):
+        """Store overlay so that it is accessible by the given name.
+
+        :param overlay_name: name of the overlay
+        :param overlay: overlay must be a dictionary where the keys are
+                        identifiers in the dataset
+        :raises: DtoolCoreTypeError if the overlay is not a dictionary,
+                 DtoolCoreValueError if identifiers in overlay and dataset do
+                 not match
+                 DtoolCoreInvalidNameError if the overlay name is invalid
+        """
+        logger.debug("Put readme content {}".format(self))
+        self._check_overlay(overlay_name, overlay)
+        if self._metadata_batch is not None:
+            self._metadata_batch.put_overlay(overlay_name, overlay)
+        else:
+            self._storage_broker.put_overlay(overlay_name, overlay)
+        self._update_consolidated_metadata()
+
+    def _journal_entry_is_current(self, handle, entry):
+        """Return True if the item has not changed since it was journaled."""
+        return (
+            entry["relpath"] == self._storage_broker.get_relpath(handle)
+            and entry["size_in_bytes"]
+            == self._storage_broker.get_size_in_bytes(handle)
+            and entry["utc_timestamp"]
+            == self._storage_broker.get_utc_timestamp(handle)
+        )
 
     def generate_manifest(self, progressbar=None):
         """Return manifest generated from knowledge about contents."""
@@ -540,6 +1156,25 @@ class _BaseDataSet(object):
             default=1
         ))
 
+        # Items recorded in the item journal, for example by a copy, have
+        # verified properties and do not need to be hashed again, unless they
+        # have been modified since.
+        journal = self._storage_broker.get_item_journal() or {}
+        handles = []
+        for handle in self._storage_broker.iter_item_handles():
+            key = dtoolcore.utils.generate_identifier(handle)
+            entry = journal.get(key)
+            if entry is not None and self._journal_entry_is_current(
+                handle,
+                entry
+            ):
+                items[key] = entry
+                if progressbar:
+                    progressbar.item_show_func = lambda x: entry["relpath"]
+                    progressbar.update(1)
+            else:
+                handles.append(handle)
+
         # Using multiprocessing only makes sense for some storage brokers.
         _mp_support = self._storage_broker.key == "file"  \
             or self._storage_broker.key == "symlink"
@@ -556,7 +1191,6 @@ class _BaseDataSet(object):
             pool = mp.Pool(num_processes)
 
             # Create data structure to pass into the processing pool.
-            handles = self._storage_broker.iter_item_handles()
             to_process = [(self, h) for h in handles]
 
             # Process items in parallel.
@@ -573,7 +1207,7 @@ class _BaseDataSet(object):
                     progressbar.update(1)
 
         else:
-            for handle in self._storage_broker.iter_item_handles():
+            for handle in handles:
                 key = dtoolcore.utils.generate_identifier(handle)
                 value = self._storage_broker.item_properties(handle)
                 items[key] = value
@@ -596,6 +1230,12 @@ class _BaseDataSet(object):
         :raises: DtoolCoreKeyError if the annotation does not exist
         :returns: annotation
         """
+        consolidated = self._current_consolidated_metadata()
+        if consolidated is not None:
+            try:
+                return consolidated["annotations"][annotation_name]
+            except KeyError:
+                raise(DtoolCoreKeyError())
         if annotation_name not in self.list_annotation_names():
             raise(DtoolCoreKeyError())
         return self._storage_broker.get_annotation(annotation_name)
@@ -611,11 +1251,71 @@ class _BaseDataSet(object):
         logger.debug("Put annotation {} {}".format(annotation_name, self))
         if not dtoolcore.utils.name_is_valid(annotation_name):
             raise(DtoolCoreInvalidNameError())
-        self._storage_broker.put_annotation(annotation_name, annotation)
+        if self._metadata_batch is not None:
+            self._metadata_batch.put_annotation(annotation_name, annotation)
+        else:
+            self._storage_broker.put_annotation(annotation_name, annotation)
+        self._update_consolidated_metadata()
+
+    def get_annotations(self, names=None):
+        """Return dictionary of annotations keyed by name.
+
+        The annotations are read in one batch, concurrently where the storage
+        broker supports it.
+
+        :param names: iterable of annotation names, defaults to all the
+                      annotations of the dataset
+        :raises: DtoolCoreKeyError if an annotation does not exist
+        :returns: dictionary of annotations
+        """
+        logger.debug("Get annotations {}".format(self))
+        if names is not None:
+            names = list(names)
+        consolidated = self._current_consolidated_metadata()
+        if consolidated is not None:
+            annotations = consolidated["annotations"]
+            if names is not None:
+                annotations = dict(
+                    (n, annotations[n]) for n in names if n in annotations
+                )
+            annotations = dict(annotations)
+        else:
+            annotations = self._storage_broker.get_annotations(names)
+        if names is not None:
+            missing = set(names) - set(annotations)
+            if missing:
+                raise(DtoolCoreKeyError(sorted(missing)))
+        return annotations
+
+    def put_annotations(self, annotations):
+        """Store several annotations.
+
+        All annotation names are validated before any annotation is stored.
+
+        :param annotations: dictionary of JSON serialisable annotations keyed
+                            by name
+        :raises: DtoolCoreInvalidNameError if an annotation name is invalid
+        """
+        logger.debug("Put annotations {}".format(self))
+        for annotation_name in annotations:
+            if not dtoolcore.utils.name_is_valid(annotation_name):
+                raise(DtoolCoreInvalidNameError())
+        if self._metadata_batch is not None:
+            for annotation_name, annotation in annotations.items():
+                self._metadata_batch.put_annotation(
+                    annotation_name,
+                    annotation
+                )
+        else:
+            self._storage_broker.put_annotations(annotations)
+        self._update_consolidated_metadata()
 
     def list_annotation_names(self):
         """Return list of annotation names."""
         logger.debug("List annotation names {}".format(self))
+        consolidated = self._current_consolidated_metadata()
+        if consolidated is not None:
+            return sorted(consolidated["annotations"])
         return sorted(self._storage_broker.list_annotation_names())
 
     def delete_annotation(self, annotation_name):
@@ -625,7 +1325,11 @@ class _BaseDataSet(object):
         :raises: DtoolCoreInvalidNameError if the annotation name
                  is invalid
         """
-        self._storage_broker.delete_annotation(annotation_name)
+        if self._metadata_batch is not None:
+            self._metadata_batch.delete_annotation(annotation_name)
+        else:
+            self._storage_broker.delete_annotation(annotation_name)
+        self._update_consolidated_metadata()
 
     def put_tag(self, tag):
         """Annotate the dataset with a tag.
@@ -640,7 +1344,11 @@ class _BaseDataSet(object):
         if not dtoolcore.utils.name_is_valid(tag):
             raise(DtoolCoreInvalidNameError())
 
-        self._storage_broker.put_tag(tag)
+        if self._metadata_batch is not None:
+            self._metadata_batch.put_tag(tag)
+        else:
+            self._storage_broker.put_tag(tag)
+        self._update_consolidated_metadata()
 
     def delete_tag(self, tag):
         """Delete a tag from a dataset.
@@ -648,10 +1356,52 @@ class _BaseDataSet(object):
         :param tag: tag
         :raises: DtoolCoreKeyError if the tag does not exist
         """
-        self._storage_broker.delete_tag(tag)
+        if self._metadata_batch is not None:
+            self._metadata_batch.delete_tag(tag)
+        else:
+            self._storage_broker.delete_tag(tag)
+        self._update_consolidated_metadata()
+
+    def put_tags(self, tags):
+        """Annotate the dataset with several tags.
+
+        All tags are validated before any tag is stored.
+
+        :param tags: iterable of tags
+        :raises: DtoolCoreInvalidNameError if a tag is invalid
+        :raises: DtoolCoreValueError if a tag is not a string
+        """
+        tags = list(tags)
+        for tag in tags:
+            if not isinstance(tag, str):
+                raise(DtoolCoreValueError())
+            if not dtoolcore.utils.name_is_valid(tag):
+                raise(DtoolCoreInvalidNameError())
+        if self._metadata_batch is not None:
+            for tag in tags:
+                self._metadata_batch.put_tag(tag)
+        else:
+            self._storage_broker.put_tags(tags)
+        self._update_consolidated_metadata()
+
+    def delete_tags(self, tags):
+        """Delete several tags from a dataset.
+
+        :param tags: iterable of tags
+        """
+        tags = list(tags)
+        if self._metadata_batch is not None:
+            for tag in tags:
+                self._metadata_batch.delete_tag(tag)
+        else:
+            self._storage_broker.delete_tags(tags)
+        self._update_consolidated_metadata()
 
     def list_tags(self):
         """Return the dataset's tags as a list."""
+        consolidated = self._current_consolidated_metadata()
+        if consolidated is not None:
+            return list(consolidated["tags"])
         return self._storage_broker.list_tags()
 
 
@@ -660,13 +1410,69 @@ class DataSet(_BaseDataSet):
     Class for reading the contents of a dataset.
     """
 
-    def __init__(self, uri, admin_metadata, config_path=None):
-        super(DataSet, self).__init__(uri, admin_metadata, config_path)
+    _admin_metadata_type = "dataset"
+
+    def __init__(self, uri, admin_metadata, config_path=None,
+                 storage_broker=None):
+        super(DataSet, self).__init__(
+            uri,
+            admin_metadata,
+            config_path,
+            storage_broker
+        )
         self._manifest_cache = None
+        self._overlay_index_cache = {}
+        self._sorted_identifiers_cache = None
 
     def _identifiers(self):
         return self._manifest["items"].keys()
 
+    @classmethod
+    def _read_admin_metadata(cls, storage_broker):
+        # Use the consolidated metadata snapshot if it is up to date, so that
+        # the other metadata does not need to be read separately.
+        consolidated = storage_broker.get_consolidated_metadata()
+        if consolidated is not None:
+            return consolidated["admin_metadata"], consolidated
+        return storage_broker.get_admin_metadata(), None
+
+    def _update_consolidated_metadata(self):
+        # Regenerating the snapshot requires reading all the metadata, so
+        # single updates delete it rather than leaving a stale file behind;
+        # the metadata is then read from the storage until the snapshot is
+        # created again using update_consolidated_metadata.
+        if self._metadata_batch is not None:
+            self._metadata_batch.metadata_changed = True
+            return
+        self._consolidated_metadata = None
+        self._storage_broker.delete_consolidated_metadata()
+
+    def _commit_metadata_batch(self, batch):
+        super(DataSet, self)._commit_metadata_batch(batch)
+        # Indexes built inside the batch reflect the overlays before it.
+        for overlay_name in batch.overlays:
+            self._overlay_index_cache.pop(overlay_name, None)
+        # Datasets without a snapshot are left without one.
+        if batch.metadata_changed:
+            self._consolidated_metadata = \
+                self._storage_broker.update_consolidated_metadata(
+                    create=False
+                )
+
+    def update_consolidated_metadata(self):
+        """Regenerate the consolidated metadata snapshot of the dataset.
+
+        The snapshot is written when a dataset is frozen if
+        ``DTOOL_CONSOLIDATED_METADATA`` is true and regenerated by
+        :meth:`dtoolcore.DataSet.metadata_batch`. Updates outside a metadata
+        batch delete it, in which case the metadata is read from the storage
+        instead. This method can be used to create it again, or to create it
+        for datasets frozen without one.
+        """
+        logger.debug("Update consolidated metadata {}".format(self))
+        self._consolidated_metadata = \
+            self._storage_broker.update_consolidated_metadata()
+
     @classmethod
     def from_uri(cls, uri, config_path=None):
         """
@@ -676,7 +1482,11 @@ class DataSet(_BaseDataSet):
                      :class:`dtoolcore.DataSet` is stored
         :returns: :class:`dtoolcore.DataSet`
         """
-        return cls._from_uri_with_typecheck(uri, config_path, "dataset")
+        return cls._from_uri_with_typecheck(
+            uri,
+            config_path,
+            cls._admin_metadata_type
+        )
 
     @property
     def identifiers(self):
@@ -714,8 +1524,27 @@ class DataSet(_BaseDataSet):
     def list_overlay_names(self):
         """Return list of overlay names."""
         logger.debug("List overlay names {}".format(self))
+        consolidated = self._current_consolidated_metadata()
+        if consolidated is not None:
+            return sorted(consolidated["overlay_names"])
         return sorted(self._storage_broker.list_overlay_names())
 
+    def verify(self, mode="full", **kwargs):
+        """Yield tuples for items whose content does not match the manifest.
+
+        Tuple structure:
+        (identifier, problem, expected, actual)
+
+        See :func:`dtoolcore.compare.verify` for details of the modes and
+        keyword arguments.
+
+        :param mode: one of "quick", "sampled" or "full"
+        :returns: iterator over tuples describing problems
+        """
+        logger.debug("Verify {} {}".format(mode, self))
+        import dtoolcore.compare
+        return dtoolcore.compare.verify(self, mode=mode, **kwargs)
+
     def get_overlay(self, overlay_name):
         """Return overlay as a dictionary.
 
@@ -727,19 +1556,149 @@ class DataSet(_BaseDataSet):
             raise(DtoolCoreKeyError())
         return self._storage_broker.get_overlay(overlay_name)
 
-    def put_overlay(self, overlay_name, overlay):
+    def put_overlay(self, overlay_name, overlay, columnar=False):
         """Store overlay so that it is accessible by the given name.
 
+        If columnar is True the overlay values are also stored as a binary
+        column where the storage broker supports it, see
+        :meth:`dtoolcore.DataSet.get_overlay_column`.
+
         :param overlay_name: name of the overlay
         :param overlay: overlay must be a dictionary where the keys are
                         identifiers in the dataset
+        :param columnar: also store the values as a binary column, which
+                         requires all values to be numbers or booleans
         :raises: DtoolCoreTypeError if the overlay is not a dictionary,
                  DtoolCoreValueError if identifiers in overlay and dataset do
                  not match
                  DtoolCoreInvalidNameError if the overlay name is invalid
         """
         logger.debug("Put overlay {} {}".format(overlay_name, self))
+        column = None
+        if columnar:
+            # Check that the values can be stored as a column before
+            # storing anything.
+            self._check_overlay(overlay_name, overlay)
+            column = dtoolcore.overlaycolumn.OverlayColumn.from_overlay(
+                overlay,
+                self._sorted_identifiers()
+            )
         self._put_overlay(overlay_name, overlay)
+        self._overlay_index_cache.pop(overlay_name, None)
+        if column is not None and self._metadata_batch is not None:
+            self._metadata_batch.overlay_columns[overlay_name] = column
+        elif column is not None:
+            self._storage_broker.put_overlay_column(
+                overlay_name,
+                column.typecode,
+                column.to_bytes()
+            )
+
+    def _sorted_identifiers(self):
+        """Return sorted list of identifiers shared by overlay columns."""
+        if self._sorted_identifiers_cache is None:
+            self._sorted_identifiers_cache = sorted(self.identifiers)
+        return self._sorted_identifiers_cache
+
+    def get_overlay_column(self, overlay_name):
+        """Return overlay values as an array backed column.
+
+        The values are stored in an :class:`array.array` in the order of the
+        sorted item identifiers rather than as one Python object per item.
+        The persisted column is used if it is up to date, otherwise the
+        column is built from the overlay and persisted where the storage
+        broker supports it.
+
+        :param overlay_name: name of the overlay
+        :raises: DtoolCoreKeyError if the overlay does not exist,
+                 DtoolCoreTypeError if the values are not all numbers or all
+                 booleans
+        :returns: :class:`dtoolcore.overlaycolumn.OverlayColumn`
+        """
+        logger.debug("Get overlay column {} {}".format(overlay_name, self))
+        if overlay_name not in self.list_overlay_names():
+            raise(DtoolCoreKeyError())
+
+        identifiers = self._sorted_identifiers()
+        persisted = self._storage_broker.get_overlay_column(overlay_name)
+        if persisted is not None:
+            return dtoolcore.overlaycolumn.OverlayColumn.from_bytes(
+                identifiers,
+                persisted["typecode"],
+                persisted["data"],
+                persisted["byteorder"]
+            )
+
+        overlay = self._storage_broker.get_overlay(overlay_name)
+        column = dtoolcore.overlaycolumn.OverlayColumn.from_overlay(
+            overlay,
+            identifiers
+        )
+        self._storage_broker.put_overlay_column(
+            overlay_name,
+            column.typecode,
+            column.to_bytes()
+        )
+        return column
+
+    def _get_overlay_index(self, overlay_name):
+        """Return overlay index, building and persisting it if needed."""
+        index = self._overlay_index_cache.get(overlay_name)
+        if index is not None:
+            return index
+
+        index_dict = self._storage_broker.get_overlay_index(overlay_name)
+        if index_dict is not None:
+            index = dtoolcore.overlayindex.OverlayIndex.from_dict(index_dict)
+        else:
+            overlay = self.get_overlay(overlay_name)
+            index = dtoolcore.overlayindex.OverlayIndex.from_overlay(overlay)
+            self._storage_broker.put_overlay_index(
+                overlay_name,
+                index.to_dict()
+            )
+        self._overlay_index_cache[overlay_name] = index
+        return index
+
+    def select(self, conditions=None, **kwargs):
+        """Return identifiers of the items matching all the conditions.
+
+        Conditions are given as a dictionary or as keyword arguments mapping
+        overlay names to conditions. A condition is a value that the overlay
+        value must be equal to or an instance of
+        :class:`dtoolcore.overlayindex.Eq`, :class:`dtoolcore.overlayindex.In`
+        or :class:`dtoolcore.overlayindex.Range`, e.g.::
+
+            from dtoolcore.overlayindex import In
+            dataset.select(is_read1=True, plate=In([3, 4]))
+
+        The conditions are answered using indexes of the overlays, which are
+        built on first use and persisted where the storage broker supports
+        it.
+
+        :param conditions: dictionary of conditions keyed by overlay name
+        :raises: DtoolCoreKeyError if an overlay does not exist
+        :returns: set of item identifiers
+        """
+        conditions = dict(conditions or {})
+        conditions.update(kwargs)
+
+        selected = None
+        for overlay_name, condition in conditions.items():
+            condition = dtoolcore.overlayindex.as_condition(condition)
+            identifiers = condition.select(
+                self._get_overlay_index(overlay_name)
+            )
+            if selected is None:
+                selected = identifiers
+            else:
+                selected &= identifiers
+            if not selected:
+                break
+
+        if selected is None:
+            return set(self.identifiers)
+        return selected
 
     def put_readme(self, content):
         """
@@ -750,6 +1709,7 @@ class DataSet(_BaseDataSet):
         :param content: string to put into the README
         """
         self._storage_broker.update_readme(content)
+        self._update_consolidated_metadata()
 
 
 class ProtoDataSet(_BaseDataSet):
@@ -757,6 +1717,8 @@ class ProtoDataSet(_BaseDataSet):
     Class for building up a dataset.
     """
 
+    _admin_metadata_type = "protodataset"
+
     @classmethod
     def from_uri(cls, uri, config_path=None):
         """
@@ -766,7 +1728,11 @@ class ProtoDataSet(_BaseDataSet):
                      :class:`dtoolcore.ProtoDataSet` is stored
         :returns: :class:`dtoolcore.ProtoDataSet`
         """
-        return cls._from_uri_with_typecheck(uri, config_path, "protodataset")
+        return cls._from_uri_with_typecheck(
+            uri,
+            config_path,
+            cls._admin_metadata_type
+        )
 
     def _identifiers(self):
         """Return iterable of dataset item identifiers."""
@@ -790,18 +1756,103 @@ class ProtoDataSet(_BaseDataSet):
         logger.debug("Put readme {}".format(self))
         self._storage_broker.put_readme(content)
 
-    def put_item(self, fpath, relpath):
+    def put_item(self, fpath, relpath, link=False):
         """
         Put an item into the dataset.
 
+        If link is True the item shares storage with the file at fpath where
+        the storage broker supports it, e.g. as a hardlink when using the
+        :class:`dtoolcore.storagebroker.DiskStorageBroker` on a single file
+        system. The file at fpath must then not be modified. If the item is
+        linked, the use of link mode is recorded as "link_mode" in the
+        administrative metadata.
+
         :param fpath: path to the item on disk
         :param relpath: relative path name given to the item in the dataset as
                         a handle, i.e. a Unix-like relpath
+        :param link: share storage with fpath rather than copying the content
         :returns: the handle given to the item
         """
         logger.debug("Put item with handle {} {}".format(relpath, self))
+        if link:
+            handle = self._storage_broker.link_item(fpath, relpath)
+            if self._storage_broker.is_linked(handle):
+                self._put_link_mode()
+            return handle
         return self._storage_broker.put_item(fpath, relpath)
 
+    def put_items(self, items, link=False, callback=None, num_threads=None,
+                  progress_callback=None):
+        """
+        Put several items into the dataset.
+
+        Depending on the storage broker the items may be stored concurrently.
+
+        :param items: iterable of (fpath, relpath) tuples, see
+                      :meth:`dtoolcore.ProtoDataSet.put_item`
+        :param link: share storage with the fpaths rather than copying the
+                     content, see :meth:`dtoolcore.ProtoDataSet.put_item`
+        :param callback: function called with the relpath and handle of each
+                         item once it has been stored, possibly from a worker
+                         thread
+        :param num_threads: number of threads, see
+                            :func:`dtoolcore.utils.get_num_threads`
+        :param progress_callback: function called with the number of bytes
+                                  stored, possibly from a worker thread and
+                                  several times per item for large items
+        :returns: list of the handles given to the items
+        """
+        logger.debug("Put items {}".format(self))
+        linked = []
+
+        def stored(relpath, handle):
+            if link and self._storage_broker.is_linked(handle):
+                linked.append(handle)
+            if callback:
+                callback(relpath, handle)
+
+        try:
+            return self._storage_broker.put_items(
+                items,
+                link=link,
+                callback=stored,
+                num_threads=num_threads,
+                progress_callback=progress_callback
+            )
+        finally:
+            # Also record the items linked before a failure, so that the
+            # link mode is known when the copy is resumed.
+            if linked:
+                self._put_link_mode()
+
+    def _put_link_mode(self):
+        """Record the use of link mode in the administrative metadata.
+
+        The administrative metadata is written straight away rather than on
+        freeze, so that the link mode is not lost if the dataset is opened
+        again before it is frozen, e.g. by :func:`dtoolcore.copy_resume`.
+        """
+        if self._admin_metadata.get("link_mode") == "hardlink":
+            return
+        self._admin_metadata["link_mode"] = "hardlink"
+        self._storage_broker.put_admin_metadata(self._admin_metadata)
+
+    def put_item_from_stream(self, stream, relpath):
+        """
+        Put an item with content read from a stream into the dataset.
+
+        Storage brokers that support it write the content directly into the
+        dataset without an intermediate temporary file.
+
+        :param stream: binary file-like object or bytes
+        :param relpath: relative path name given to the item in the dataset as
+                        a handle, i.e. a Unix-like relpath
+        :returns: the handle given to the item
+        """
+        logger.debug("Put item from stream with handle {} {}".format(
+            relpath, self))
+        return self._storage_broker.put_item_from_stream(stream, relpath)
+
     def add_item_metadata(self, handle, key, value):
         """
         Add metadata to a specific item in the :class:`dtoolcore.ProtoDataSet`.
@@ -838,14 +1889,16 @@ class ProtoDataSet(_BaseDataSet):
 
         # Generate and persist the manifest.
         manifest = self.generate_manifest(progressbar=progressbar)
+        dtoolcore.merkle.add_merkle_digests(manifest)
         self._storage_broker.put_manifest(manifest)
 
         # Generate and persist overlays from any item metadata that has been
         # added.
 
         overlays = self._generate_overlays()
-        for overlay_name, overlay in overlays.items():
-            self._put_overlay(overlay_name, overlay)
+        with self.metadata_batch():
+            for overlay_name, overlay in overlays.items():
+                self._put_overlay(overlay_name, overlay)
 
         # Change the type of the dataset from "protodataset" to "dataset"
         # in the administrative metadata.
@@ -865,6 +1918,10 @@ class ProtoDataSet(_BaseDataSet):
         # Clean up using the storage broker's post freeze hook.
         self._storage_broker.post_freeze_hook()
 
+        # Write the consolidated metadata snapshot of the frozen dataset.
+        if _consolidated_metadata_enabled(self._config_path):
+            self._storage_broker.update_consolidated_metadata()
+
     def freeze_with_manifest(self, manifest, frozen_at=None):
         """
         Convert :class:`dtoolcore.ProtoDataSet` to :class:`dtoolcore.DataSet`
@@ -882,6 +1939,9 @@ class ProtoDataSet(_BaseDataSet):
         Note: This method does NOT verify that the hashes match - it trusts
         the client-provided hashes in the manifest.
 
+        The Merkle root and directory digests of the provided items are added
+        to the stored manifest, see :mod:`dtoolcore.merkle`.
+
         :param manifest: dict with structure::
 
             {
@@ -942,14 +2002,18 @@ class ProtoDataSet(_BaseDataSet):
         # Call the storage broker pre_freeze hook.
         self._storage_broker.pre_freeze_hook()
 
-        # Use provided manifest instead of computing
+        # Use provided manifest instead of computing, adding the Merkle
+        # digests of the provided items.
+        manifest = dict(manifest)
+        dtoolcore.merkle.add_merkle_digests(manifest)
         self._storage_broker.put_manifest(manifest)
 
         # Generate and persist overlays from any item metadata that has been
         # added.
         overlays = self._generate_overlays()
-        for overlay_name, overlay in overlays.items():
-            self._put_overlay(overlay_name, overlay)
+        with self.metadata_batch():
+            for overlay_name, overlay in overlays.items():
+                self._put_overlay(overlay_name, overlay)
 
         # Change the type of the dataset from "protodataset" to "dataset"
         # in the administrative metadata.
@@ -969,6 +2033,10 @@ class ProtoDataSet(_BaseDataSet):
         # Clean up using the storage broker's post freeze hook.
         self._storage_broker.post_freeze_hook()
 
+        # Write the consolidated metadata snapshot of the frozen dataset.
+        if _consolidated_metadata_enabled(self._config_path):
+            self._storage_broker.update_consolidated_metadata()
+
 
 class DataSetCreator(object):
     """Context manager for creating a dataset.
@@ -1018,7 +2086,7 @@ class DataSetCreator(object):
                 raise(DtoolCoreBrokenStagingPromise(
                     "No such file: {}".format(abspath)
                 ))
-            self.proto_dataset.put_item(abspath, relpath)
+        self.proto_dataset.put_items(self._to_stage)
 
         # If everything has been successful freeze the dataset.
         if exception_type is None:
@@ -1095,6 +2163,17 @@ class DataSetCreator(object):
         """
         return self.proto_dataset.put_item(fpath, relpath)
 
+    def put_item_from_stream(self, stream, relpath):
+        """
+        Put an item with content read from a stream into the dataset.
+
+        :param stream: binary file-like object or bytes
+        :param relpath: relative path name given to the item in the dataset as
+                        a handle
+        :returns: the handle given to the item
+        """
+        return self.proto_dataset.put_item_from_stream(stream, relpath)
+
     def add_item_metadata(self, handle, key, value):
         """
         Add metadata to a specific item in the :class:`dtoolcore.ProtoDataSet`.
@@ -1135,6 +2214,24 @@ class DataSetCreator(object):
         """
         self.proto_dataset.put_tag(tag)
 
+    def put_annotations(self, annotations):
+        """Store several annotations.
+
+        :param annotations: dictionary of JSON serialisable annotations keyed
+                            by name
+        :raises: DtoolCoreInvalidNameError if an annotation name is invalid
+        """
+        self.proto_dataset.put_annotations(annotations)
+
+    def put_tags(self, tags):
+        """Annotate the dataset with several tags.
+
+        :param tags: iterable of tags
+        :raises: DtoolCoreInvalidNameError if a tag is invalid
+        :raises: DtoolCoreValueError if a tag is not a string
+        """
+        self.proto_dataset.put_tags(tags)
+
 
 class DerivedDataSetCreator(DataSetCreator):
     """Context manager for creating a derived dataset.
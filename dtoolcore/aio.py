@@ -0,0 +1,629 @@
+"""Asyncio interface to datasets.
+
+The classes in this module wrap :class:`dtoolcore.DataSet` and
+:class:`dtoolcore.ProtoDataSet` so that they can be used from within an
+event loop without blocking it. Blocking operations, e.g. directory walks,
+hashing and parsing of metadata, are run in a bounded thread pool executor
+shared by all datasets in the process. The size of the executor is
+configured using ``DTOOL_NUM_THREADS``, see
+:func:`dtoolcore.utils.get_num_threads`.
+
+A storage broker can provide a natively asynchronous implementation of a
+method by defining a coroutine method with the same name prefixed by
+``async_``, e.g. ``async_get_item_abspath``. These are awaited directly
+rather than being run in the executor. Otherwise the methods of the wrapped
+dataset are run in the executor, so that they behave exactly like the
+synchronous ones.
+"""
+
+import asyncio
+import functools
+import itertools
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+import dtoolcore
+import dtoolcore.utils
+
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_executor(config_path=None):
+    """Return the executor used for running blocking operations.
+
+    :param config_path: path to the dtool configuration file
+    :returns: :class:`concurrent.futures.ThreadPoolExecutor`
+    """
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            num_threads = dtoolcore.utils.get_num_threads(
+                config_path=config_path
+            )
+            _EXECUTOR = ThreadPoolExecutor(
+                max_workers=max(1, num_threads),
+                thread_name_prefix="dtoolcore-aio"
+            )
+        return _EXECUTOR
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking function in the executor and return its result.
+
+    :param func: function to call
+    :returns: return value of the function
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(),
+        functools.partial(func, *args, **kwargs)
+    )
+
+
+def _has_native(storage_broker, method_name):
+    """Return True if the storage broker has a native async variant."""
+    return getattr(storage_broker, "async_" + method_name, None) is not None
+
+
+async def _call_broker(storage_broker, method_name, *args, **kwargs):
+    """Call a storage broker method preferring its native async variant."""
+    native = getattr(storage_broker, "async_" + method_name, None)
+    if native is not None:
+        return await native(*args, **kwargs)
+    method = getattr(storage_broker, method_name)
+    return await run_blocking(method, *args, **kwargs)
+
+
+async def _iter_blocking(iterable, chunk_size=1):
+    """Yield the values of a blocking iterable without blocking the loop.
+
+    Chunks of values are taken from the iterable in the executor, so values
+    are yielded as they become available rather than after the iteration
+    has finished.
+    """
+    iterator = iter(iterable)
+
+    def next_chunk():
+        return list(itertools.islice(iterator, chunk_size))
+
+    while True:
+        chunk = await run_blocking(next_chunk)
+        if not chunk:
+            return
+        for value in chunk:
+            yield value
+
+
+async def _bounded_as_completed(coroutine_func, args_iterable, concurrency):
+    """Yield results of coroutines run with bounded concurrency.
+
+    Results are yielded in order of completion.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(args):
+        async with semaphore:
+            return await coroutine_func(*args)
+
+    pending = set()
+    for args in args_iterable:
+        # Do not create more tasks than can run at once, so that iterating
+        # over many items does not create many idle tasks.
+        if len(pending) >= concurrency:
+            done, pending = await asyncio.wait(
+                pending,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                yield task.result()
+        pending.add(asyncio.ensure_future(run(args)))
+
+    while pending:
+        done, pending = await asyncio.wait(
+            pending,
+            return_when=asyncio.FIRST_COMPLETED
+        )
+        for task in done:
+            yield task.result()
+
+
+def _default_concurrency(concurrency):
+    if concurrency is None:
+        return max(1, dtoolcore.utils.get_num_threads())
+    return concurrency
+
+
+class _AsyncBaseDataSet(object):
+    """Base class for the asynchronous dataset wrappers."""
+
+    def __init__(self, dataset, config_path=None):
+        self._dataset = dataset
+        self._config_path = config_path
+
+    def __repr__(self):
+        return "<{} uri={}>".format(self.__class__.__name__, self.uri)
+
+    @property
+    def dataset(self):
+        """Return the wrapped synchronous dataset."""
+        return self._dataset
+
+    @property
+    def _storage_broker(self):
+        return self._dataset._storage_broker
+
+    @property
+    def base_uri(self):
+        """Return the base URI of the dataset."""
+        return self._dataset.base_uri
+
+    @property
+    def uri(self):
+        """Return the URI of the dataset."""
+        return self._dataset.uri
+
+    @property
+    def uuid(self):
+        """Return the UUID of the dataset."""
+        return self._dataset.uuid
+
+    @property
+    def name(self):
+        """Return the name of the dataset."""
+        return self._dataset.name
+
+    @property
+    def admin_metadata(self):
+        """Return the administrative metadata of the dataset."""
+        return self._dataset.admin_metadata
+
+    async def update_name(self, new_name):
+        """Update the name of the dataset.
+
+        :param new_name: new name of the dataset
+        """
+        await run_blocking(self._dataset.update_name, new_name)
+
+    async def get_readme_content(self):
+        """Return the content of the README describing the dataset."""
+        if _has_native(self._storage_broker, "get_readme_content"):
+            return await _call_broker(
+                self._storage_broker,
+                "get_readme_content"
+            )
+        return await run_blocking(self._dataset.get_readme_content)
+
+    async def get_annotation(self, annotation_name):
+        """Return annotation.
+
+        :param annotation_name: name of the annotation
+        :raises: DtoolCoreKeyError if the annotation does not exist
+        :returns: annotation
+        """
+        return await run_blocking(
+            self._dataset.get_annotation,
+            annotation_name
+        )
+
+    async def put_annotation(self, annotation_name, annotation):
+        """Store annotation so that it is accessible by the given name.
+
+        :param annotation_name: name of the annotation
+        :param annotation: JSON serialisable value or data structure
+        :raises: DtoolCoreInvalidNameError if the annotation name is invalid
+        """
+        await run_blocking(
+            self._dataset.put_annotation,
+            annotation_name,
+            annotation
+        )
+
+    async def get_annotations(self, names=None):
+        """Return dictionary of annotations keyed by name.
+
+        :param names: iterable of annotation names, defaults to all the
+                      annotations of the dataset
+        :raises: DtoolCoreKeyError if an annotation does not exist
+        :returns: dictionary of annotations
+        """
+        return await run_blocking(self._dataset.get_annotations, names)
+
+    async def put_annotations(self, annotations):
+        """Store several annotations.
+
+        :param annotations: dictionary of annotations keyed by name
+        :raises: DtoolCoreInvalidNameError if an annotation name is invalid
+        """
+        await run_blocking(self._dataset.put_annotations, annotations)
+
+    async def list_annotation_names(self):
+        """Return sorted list of annotation names."""
+        if _has_native(self._storage_broker, "list_annotation_names"):
+            return sorted(await _call_broker(
+                self._storage_broker,
+                "list_annotation_names"
+            ))
+        return await run_blocking(self._dataset.list_annotation_names)
+
+    async def delete_annotation(self, annotation_name):
+        """Delete annotation.
+
+        :param annotation_name: name of the annotation
+        """
+        await run_blocking(self._dataset.delete_annotation, annotation_name)
+
+    async def put_tag(self, tag):
+        """Annotate the dataset with a tag.
+
+        :param tag: tag
+        :raises: DtoolCoreInvalidNameError if the tag is invalid
+        """
+        await run_blocking(self._dataset.put_tag, tag)
+
+    async def delete_tag(self, tag):
+        """Delete tag from the dataset.
+
+        :param tag: tag
+        """
+        await run_blocking(self._dataset.delete_tag, tag)
+
+    async def put_tags(self, tags):
+        """Annotate the dataset with several tags.
+
+        :param tags: iterable of tags
+        :raises: DtoolCoreInvalidNameError if a tag is invalid
+        """
+        await run_blocking(self._dataset.put_tags, list(tags))
+
+    async def delete_tags(self, tags):
+        """Delete several tags from the dataset.
+
+        :param tags: iterable of tags
+        """
+        await run_blocking(self._dataset.delete_tags, list(tags))
+
+    async def list_tags(self):
+        """Return the dataset's list of tags."""
+        if _has_native(self._storage_broker, "list_tags"):
+            return await _call_broker(self._storage_broker, "list_tags")
+        return await run_blocking(self._dataset.list_tags)
+
+
+class AsyncDataSet(_AsyncBaseDataSet):
+    """Asynchronous interface to a :class:`dtoolcore.DataSet`.
+
+    Use :meth:`dtoolcore.aio.AsyncDataSet.from_uri` to open a dataset. The
+    manifest is loaded when the dataset is opened, so that item properties
+    can be accessed without blocking.
+    """
+
+    @classmethod
+    async def from_uri(cls, uri, config_path=None):
+        """Return an existing :class:`dtoolcore.aio.AsyncDataSet` from a URI.
+
+        :param uri: unique resource identifier where the existing
+                     :class:`dtoolcore.DataSet` is stored
+        :param config_path: path to the dtool configuration file
+        :returns: :class:`dtoolcore.aio.AsyncDataSet`
+        """
+        dataset = await run_blocking(
+            dtoolcore.DataSet.from_uri,
+            uri,
+            config_path
+        )
+        async_dataset = cls(dataset, config_path)
+        dataset._manifest_cache = await _call_broker(
+            dataset._storage_broker,
+            "get_manifest"
+        )
+        return async_dataset
+
+    @property
+    def identifiers(self):
+        """Return iterable of dataset item identifiers."""
+        return self._dataset.identifiers
+
+    def item_properties(self, identifier):
+        """Return properties of the item with the given identifier.
+
+        :param identifier: item identifier
+        :returns: dictionary of item properties from the manifest
+        """
+        return self._dataset.item_properties(identifier)
+
+    async def iter_manifest_entries(self):
+        """Yield (identifier, item properties) tuples from the manifest."""
+        for i, (identifier, properties) in enumerate(
+                self._dataset._manifest["items"].items()):
+            # Give other tasks a chance to run when iterating over large
+            # manifests.
+            if i % 1000 == 0:
+                await asyncio.sleep(0)
+            yield identifier, properties
+
+    async def item_content_abspath(self, identifier):
+        """Return absolute path at which item content can be accessed.
+
+        :param identifier: item identifier
+        :returns: absolute path from which the item content can be accessed
+        """
+        return await _call_broker(
+            self._storage_broker,
+            "get_item_abspath",
+            identifier
+        )
+
+    async def iter_item_content_abspaths(self, identifiers=None,
+                                         concurrency=None):
+        """Yield (identifier, abspath) tuples for the items in the dataset.
+
+        The items are fetched concurrently and yielded in order of
+        completion.
+
+        :param identifiers: identifiers of the items to fetch, defaults to all
+                            items in the dataset
+        :param concurrency: maximum number of items fetched at once, defaults
+                            to :func:`dtoolcore.utils.get_num_threads`
+        """
+        if identifiers is None:
+            identifiers = list(self.identifiers)
+
+        async def fetch(identifier):
+            abspath = await self.item_content_abspath(identifier)
+            return identifier, abspath
+
+        async for result in _bounded_as_completed(
+                fetch,
+                ((i,) for i in identifiers),
+                _default_concurrency(concurrency)):
+            yield result
+
+    async def list_overlay_names(self):
+        """Return sorted list of overlay names."""
+        if _has_native(self._storage_broker, "list_overlay_names"):
+            return sorted(await _call_broker(
+                self._storage_broker,
+                "list_overlay_names"
+            ))
+        return await run_blocking(self._dataset.list_overlay_names)
+
+    async def get_overlay(self, overlay_name):
+        """Return overlay as a dictionary.
+
+        :param overlay_name: name of the overlay
+        :raises: DtoolCoreKeyError if the overlay does not exist
+        :returns: overlay as a dictionary
+        """
+        if not _has_native(self._storage_broker, "get_overlay"):
+            return await run_blocking(self._dataset.get_overlay, overlay_name)
+        if overlay_name not in await self.list_overlay_names():
+            raise dtoolcore.DtoolCoreKeyError()
+        return await _call_broker(
+            self._storage_broker,
+            "get_overlay",
+            overlay_name
+        )
+
+    async def put_overlay(self, overlay_name, overlay):
+        """Store overlay so that it is accessible by the given name.
+
+        :param overlay_name: name of the overlay
+        :param overlay: overlay must be a dictionary where the keys are
+                        identifiers in the dataset
+        :raises: DtoolCoreTypeError if the overlay is not a dictionary,
+                 DtoolCoreValueError if identifiers in overlay and dataset do
+                 not match
+        """
+        await run_blocking(self._dataset.put_overlay, overlay_name, overlay)
+
+    async def put_readme(self, content):
+        """Update the README of the dataset and backup the previous README.
+
+        :param content: string to put into the README
+        """
+        await run_blocking(self._dataset.put_readme, content)
+
+    async def verify(self, mode="full", **kwargs):
+        """Yield problems found when verifying the dataset as they are found.
+
+        See :meth:`dtoolcore.DataSet.verify`.
+
+        :raises: DtoolCoreValueError if the mode or its arguments are invalid
+        """
+        problems = self._dataset.verify(mode=mode, **kwargs)
+        async for problem in _iter_blocking(problems):
+            yield problem
+
+
+class AsyncProtoDataSet(_AsyncBaseDataSet):
+    """Asynchronous interface to a :class:`dtoolcore.ProtoDataSet`."""
+
+    @classmethod
+    async def from_uri(cls, uri, config_path=None):
+        """Return an existing :class:`dtoolcore.aio.AsyncProtoDataSet`.
+
+        :param uri: unique resource identifier where the existing
+                     :class:`dtoolcore.ProtoDataSet` is stored
+        :param config_path: path to the dtool configuration file
+        :returns: :class:`dtoolcore.aio.AsyncProtoDataSet`
+        """
+        proto_dataset = await run_blocking(
+            dtoolcore.ProtoDataSet.from_uri,
+            uri,
+            config_path
+        )
+        return cls(proto_dataset, config_path)
+
+    @classmethod
+    async def create(cls, name, base_uri, readme_content="",
+                     creator_username=None, config_path=None):
+        """Create a proto dataset.
+
+        See :func:`dtoolcore.create_proto_dataset`.
+
+        :returns: :class:`dtoolcore.aio.AsyncProtoDataSet`
+        """
+        proto_dataset = await run_blocking(
+            dtoolcore.create_proto_dataset,
+            name,
+            base_uri,
+            readme_content,
+            creator_username,
+            config_path
+        )
+        return cls(proto_dataset, config_path)
+
+    async def iter_item_handles(self):
+        """Yield the handles of the items in the proto dataset.
+
+        The handles are yielded while the storage is still being listed.
+        """
+        native = getattr(self._storage_broker, "async_iter_item_handles", None)
+        if native is not None:
+            async for handle in native():
+                yield handle
+            return
+        async for handle in _iter_blocking(
+                self._storage_broker.iter_item_handles(),
+                chunk_size=1000):
+            yield handle
+
+    async def put_readme(self, content):
+        """Put README content into the dataset.
+
+        :param content: string to put into the README
+        """
+        await _call_broker(self._storage_broker, "put_readme", content)
+
+    async def put_item(self, fpath, relpath, link=False):
+        """Put an item into the dataset.
+
+        See :meth:`dtoolcore.ProtoDataSet.put_item`.
+
+        :returns: the handle given to the item
+        """
+        if link:
+            return await run_blocking(
+                self._dataset.put_item,
+                fpath,
+                relpath,
+                link=True
+            )
+        return await _call_broker(
+            self._storage_broker,
+            "put_item",
+            fpath,
+            relpath
+        )
+
+    async def put_items(self, items, link=False, concurrency=None):
+        """Put several items into the dataset concurrently.
+
+        :param items: iterable of (fpath, relpath) tuples
+        :param link: share storage with the fpaths rather than copying the
+                     content, see :meth:`dtoolcore.ProtoDataSet.put_item`
+        :param concurrency: maximum number of items stored at once, defaults
+                            to :func:`dtoolcore.utils.get_num_threads`
+        :returns: list of the handles given to the items
+        """
+        items = list(items)
+
+        async def put(index, fpath, relpath):
+            handle = await self.put_item(fpath, relpath, link=link)
+            return index, handle
+
+        handles = [None] * len(items)
+        async for index, handle in _bounded_as_completed(
+                put,
+                ((i, f, r) for i, (f, r) in enumerate(items)),
+                _default_concurrency(concurrency)):
+            handles[index] = handle
+        return handles
+
+    async def put_item_from_stream(self, stream, relpath):
+        """Put an item with content read from a stream into the dataset.
+
+        The stream is read in the executor, so it must be a blocking binary
+        file-like object or bytes.
+
+        :param stream: binary file-like object or bytes
+        :param relpath: relative path name given to the item in the dataset as
+                        a handle
+        :returns: the handle given to the item
+        """
+        return await _call_broker(
+            self._storage_broker,
+            "put_item_from_stream",
+            stream,
+            relpath
+        )
+
+    async def add_item_metadata(self, handle, key, value):
+        """Add metadata to a specific item in the proto dataset.
+
+        :param handle: handle representing the relative path of the item in the
+                       proto dataset
+        :param key: metadata key
+        :param value: metadata value
+        """
+        await _call_broker(
+            self._storage_broker,
+            "add_item_metadata",
+            handle,
+            key,
+            value
+        )
+
+    async def freeze(self, progressbar=None):
+        """Convert the proto dataset into a dataset.
+
+        :returns: :class:`dtoolcore.aio.AsyncDataSet`
+        """
+        await run_blocking(self._dataset.freeze, progressbar=progressbar)
+        return await AsyncDataSet.from_uri(
+            self.uri,
+            config_path=self._config_path
+        )
+
+
+async def copy(src_uri, dest_base_uri, config_path=None, progressbar=None,
+               num_threads=None, progress_callback=None, link=False):
+    """Copy a dataset to another location without blocking the event loop.
+
+    See :func:`dtoolcore.copy`.
+
+    :returns: URI of the new dataset
+    """
+    return await run_blocking(
+        dtoolcore.copy,
+        src_uri,
+        dest_base_uri,
+        config_path=config_path,
+        progressbar=progressbar,
+        num_threads=num_threads,
+        progress_callback=progress_callback,
+        link=link
+    )
+
+
+async def copy_resume(src_uri, dest_base_uri, config_path=None,
+                      progressbar=None, num_threads=None,
+                      progress_callback=None, link=False):
+    """Resume copying a dataset without blocking the event loop.
+
+    See :func:`dtoolcore.copy_resume`.
+
+    :returns: URI of the new dataset
+    """
+    return await run_blocking(
+        dtoolcore.copy_resume,
+        src_uri,
+        dest_base_uri,
+        config_path=config_path,
+        progressbar=progressbar,
+        num_threads=num_threads,
+        progress_callback=progress_callback,
+        link=link
+    )
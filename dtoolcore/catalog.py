@@ -0,0 +1,369 @@
+"""Local SQLite index of the datasets in base URIs.
+
+Finding the datasets with a particular tag or annotation otherwise means
+reading the metadata of every dataset in a base URI. A
+:class:`dtoolcore.catalog.Catalog` stores the administrative metadata, tags,
+annotations, number of items and total size of the datasets in a SQLite
+database, so that such queries do not touch the storage.
+
+The catalog is brought up to date using
+:meth:`dtoolcore.catalog.Catalog.refresh`. Only the datasets whose metadata
+fingerprint, see
+:meth:`dtoolcore.storagebroker.BaseStorageBroker.get_metadata_fingerprint`,
+has changed since the last refresh are read again.
+
+The default location of the database can be configured using
+``DTOOL_CATALOG_PATH``.
+"""
+
+import os
+import json
+import sqlite3
+import logging
+
+import dtoolcore
+import dtoolcore.utils
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATALOG_PATH = os.path.expanduser("~/.cache/dtool/catalog.sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    uri TEXT PRIMARY KEY,
+    base_uri TEXT NOT NULL,
+    uuid TEXT,
+    name TEXT,
+    type TEXT,
+    creator_username TEXT,
+    created_at REAL,
+    frozen_at REAL,
+    admin_metadata TEXT,
+    number_of_items INTEGER,
+    size_in_bytes INTEGER,
+    fingerprint TEXT
+);
+CREATE INDEX IF NOT EXISTS datasets_base_uri ON datasets (base_uri);
+CREATE TABLE IF NOT EXISTS tags (
+    uri TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (uri, tag)
+);
+CREATE INDEX IF NOT EXISTS tags_tag ON tags (tag);
+CREATE TABLE IF NOT EXISTS annotations (
+    uri TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (uri, name)
+);
+CREATE INDEX IF NOT EXISTS annotations_name_value ON annotations (name, value);
+"""
+
+
+def _encode_value(value):
+    """Return annotation value in the form stored in the catalog."""
+    return json.dumps(value, sort_keys=True)
+
+
+def _read_dataset_record(StorageBroker, uri, config_path, known_fingerprint):
+    """Return dictionary with the metadata to index or None if unchanged."""
+    storage_broker = StorageBroker(uri, config_path)
+    fingerprint = storage_broker.get_metadata_fingerprint()
+    if fingerprint is not None and fingerprint == known_fingerprint:
+        return None
+
+    # Frozen datasets with an up to date consolidated metadata snapshot can
+    # be indexed using a single read.
+    consolidated = storage_broker.get_consolidated_metadata()
+    if consolidated is not None:
+        return {
+            "uri": uri,
+            "admin_metadata": consolidated["admin_metadata"],
+            "tags": consolidated["tags"],
+            "annotations": consolidated["annotations"],
+            "number_of_items": consolidated["number_of_items"],
+            "size_in_bytes": consolidated["size_in_bytes"],
+            "fingerprint": fingerprint,
+        }
+
+    admin_metadata = storage_broker.get_admin_metadata()
+    annotations = storage_broker.get_annotations()
+    number_of_items = None
+    size_in_bytes = None
+    if admin_metadata.get("type") == "dataset":
+        items = storage_broker.get_manifest()["items"]
+        number_of_items = len(items)
+        size_in_bytes = sum(p["size_in_bytes"] for p in items.values())
+
+    return {
+        "uri": uri,
+        "admin_metadata": admin_metadata,
+        "tags": storage_broker.list_tags(),
+        "annotations": annotations,
+        "number_of_items": number_of_items,
+        "size_in_bytes": size_in_bytes,
+        "fingerprint": fingerprint,
+    }
+
+
+class Catalog(object):
+    """SQLite index of the datasets in one or more base URIs.
+
+    :param db_path: path to the SQLite database, defaults to the value of
+                    ``DTOOL_CATALOG_PATH``
+    :param config_path: path to the dtool configuration file
+    """
+
+    def __init__(self, db_path=None, config_path=None):
+        if db_path is None:
+            db_path = dtoolcore.utils.get_config_value(
+                "DTOOL_CATALOG_PATH",
+                config_path=config_path,
+                default=DEFAULT_CATALOG_PATH
+            )
+        if db_path != ":memory:":
+            dtoolcore.utils.mkdir_parents(
+                os.path.dirname(os.path.abspath(db_path))
+            )
+        self.db_path = db_path
+        self.config_path = config_path
+        self._connection = sqlite3.connect(db_path)
+        self._connection.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close the database connection."""
+        self._connection.close()
+
+    def refresh(self, base_uri, num_threads=None):
+        """Bring the entries for the datasets in the base URI up to date.
+
+        Datasets whose metadata fingerprint is unchanged are not read.
+        Datasets that no longer exist are removed from the catalog. Datasets
+        whose metadata cannot be read, e.g. because it is being written, are
+        logged and skipped; their existing entries are kept.
+
+        :param base_uri: base URI to index
+        :param num_threads: number of threads used to read metadata, see
+                            :func:`dtoolcore.utils.get_num_threads`
+        :returns: dictionary with the number of "added", "updated",
+                  "removed", "unchanged" and "failed" datasets
+        """
+        base_uri = dtoolcore.utils.sanitise_uri(base_uri)
+        StorageBroker = dtoolcore._get_storage_broker_class(base_uri)
+        num_threads = dtoolcore.utils.get_num_threads(
+            num_threads,
+            self.config_path
+        )
+
+        known = dict(self._connection.execute(
+            "SELECT uri, fingerprint FROM datasets WHERE base_uri = ?",
+            (base_uri,)
+        ).fetchall())
+
+        seen = set()
+        failed = set()
+
+        def read(uri):
+            seen.add(uri)
+            try:
+                record = _read_dataset_record(
+                    StorageBroker,
+                    uri,
+                    self.config_path,
+                    known.get(uri)
+                )
+            except Exception as exc:
+                # A single unreadable dataset must not abort the refresh.
+                logger.warning("Failed to read {}: {}".format(uri, exc))
+                failed.add(uri)
+                record = None
+            return uri, record
+
+        counts = {
+            "added": 0,
+            "updated": 0,
+            "removed": 0,
+            "unchanged": 0,
+            "failed": 0,
+        }
+        with self._connection:
+            for uri, record in dtoolcore.utils.threaded_imap_unordered(
+                    read,
+                    StorageBroker.iter_dataset_uris(
+                        base_uri,
+                        self.config_path
+                    ),
+                    num_threads):
+                if uri in failed:
+                    counts["failed"] += 1
+                    continue
+                if record is None:
+                    counts["unchanged"] += 1
+                    continue
+                if record["uri"] in known:
+                    counts["updated"] += 1
+                else:
+                    counts["added"] += 1
+                self._store(base_uri, record)
+
+            for uri in set(known) - seen:
+                self._remove(uri)
+                counts["removed"] += 1
+
+        logger.debug("Catalog.refresh {}: {}".format(base_uri, counts))
+        return counts
+
+    def _remove(self, uri):
+        for table in ("datasets", "tags", "annotations"):
+            self._connection.execute(
+                "DELETE FROM {} WHERE uri = ?".format(table),
+                (uri,)
+            )
+
+    def _store(self, base_uri, record):
+        uri = record["uri"]
+        admin_metadata = record["admin_metadata"]
+        self._remove(uri)
+        self._connection.execute(
+            "INSERT INTO datasets VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                uri,
+                base_uri,
+                admin_metadata.get("uuid"),
+                admin_metadata.get("name"),
+                admin_metadata.get("type"),
+                admin_metadata.get("creator_username"),
+                admin_metadata.get("created_at"),
+                admin_metadata.get("frozen_at"),
+                json.dumps(admin_metadata),
+                record["number_of_items"],
+                record["size_in_bytes"],
+                record["fingerprint"],
+            )
+        )
+        self._connection.executemany(
+            "INSERT INTO tags VALUES (?, ?)",
+            [(uri, tag) for tag in record["tags"]]
+        )
+        self._connection.executemany(
+            "INSERT INTO annotations VALUES (?, ?, ?)",
+            [
+                (uri, name, _encode_value(value))
+                for name, value in record["annotations"].items()
+            ]
+        )
+
+    def list_dataset_uris(self, base_uri=None):
+        """Return sorted list of the URIs in the catalog.
+
+        :param base_uri: only return URIs in this base URI
+        :returns: list of URIs
+        """
+        return self.find(base_uri=base_uri)
+
+    def find(self, tags=None, annotations=None, base_uri=None,
+             type_name=None):
+        """Return sorted list of the URIs of matching datasets.
+
+        :param tags: iterable of tags that the datasets must all have
+        :param annotations: dictionary of annotation names and values that
+                            the datasets must all have
+        :param base_uri: only return datasets in this base URI
+        :param type_name: only return datasets of this type, i.e. "dataset"
+                          or "protodataset"
+        :returns: list of URIs
+        """
+        clauses = []
+        params = []
+        if base_uri is not None:
+            clauses.append("base_uri = ?")
+            params.append(dtoolcore.utils.sanitise_uri(base_uri))
+        if type_name is not None:
+            clauses.append("type = ?")
+            params.append(type_name)
+        for tag in tags or []:
+            clauses.append(
+                "uri IN (SELECT uri FROM tags WHERE tag = ?)"
+            )
+            params.append(tag)
+        for name, value in (annotations or {}).items():
+            clauses.append(
+                "uri IN (SELECT uri FROM annotations "
+                "WHERE name = ? AND value = ?)"
+            )
+            params.extend([name, _encode_value(value)])
+
+        query = "SELECT uri FROM datasets"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY uri"
+        return [row[0] for row in self._connection.execute(query, params)]
+
+    def find_by_tag(self, tag, base_uri=None):
+        """Return sorted list of the URIs of datasets with the tag.
+
+        :param tag: tag
+        :param base_uri: only return datasets in this base URI
+        :returns: list of URIs
+        """
+        return self.find(tags=[tag], base_uri=base_uri)
+
+    def find_by_annotation(self, annotation_name, value, base_uri=None):
+        """Return sorted list of the URIs of datasets with the annotation.
+
+        :param annotation_name: name of the annotation
+        :param value: value of the annotation
+        :param base_uri: only return datasets in this base URI
+        :returns: list of URIs
+        """
+        return self.find(
+            annotations={annotation_name: value},
+            base_uri=base_uri
+        )
+
+    def get_dataset_info(self, uri):
+        """Return the indexed information about a dataset.
+
+        :param uri: dataset URI
+        :raises: DtoolCoreKeyError if the dataset is not in the catalog
+        :returns: dictionary with the keys "uri", "base_uri",
+                  "admin_metadata", "tags", "annotations", "number_of_items"
+                  and "size_in_bytes"
+        """
+        uri = dtoolcore.utils.sanitise_uri(uri)
+        row = self._connection.execute(
+            "SELECT base_uri, admin_metadata, number_of_items, size_in_bytes "
+            "FROM datasets WHERE uri = ?",
+            (uri,)
+        ).fetchone()
+        if row is None:
+            raise dtoolcore.DtoolCoreKeyError(
+                "{} is not in the catalog".format(uri)
+            )
+        base_uri, admin_metadata, number_of_items, size_in_bytes = row
+        tags = sorted(r[0] for r in self._connection.execute(
+            "SELECT tag FROM tags WHERE uri = ?",
+            (uri,)
+        ))
+        annotations = dict(
+            (name, json.loads(value))
+            for name, value in self._connection.execute(
+                "SELECT name, value FROM annotations WHERE uri = ?",
+                (uri,)
+            )
+        )
+        return {
+            "uri": uri,
+            "base_uri": base_uri,
+            "admin_metadata": json.loads(admin_metadata),
+            "tags": tags,
+            "annotations": annotations,
+            "number_of_items": number_of_items,
+            "size_in_bytes": size_in_bytes,
+        }
@@ -1,5 +1,20 @@
 """Module with helper functions for comparing datasets."""
 
+import os
+import logging
+import random
+
+import dtoolcore.filehasher
+import dtoolcore.merkle
+import dtoolcore.utils
+
+from dtoolcore import DtoolCoreValueError
+
+logger = logging.getLogger(__name__)
+
+VERIFY_MODES = ("quick", "sampled", "full")
+DIFF_CONTENT_MODES = ("rehash", "manifest")
+
 
 def diff_identifiers(a, b):
     """Return list of tuples where identifiers in datasets differ.
@@ -50,30 +65,622 @@ def diff_sizes(a, b, progressbar=None):
     return difference
 
 
-def diff_content(a, reference, progressbar=None):
-    """Return list of tuples where content differ.
+def iter_diff_content(
+    a,
+    reference,
+    mode="rehash",
+    num_threads=None,
+    executor=None,
+    progressbar=None
+):
+    """Yield tuples where content differ.
 
     Tuple structure:
     (identifier, hash in a, hash in reference)
 
     Assumes list of identifiers in a and b are identical.
 
-    Storage broker of reference used to generate hash for files in a.
+    Modes:
+
+    - "rehash": hash the content of the items in a using the hasher of the
+      storage broker of reference, concurrently
+    - "manifest": compare the hashes stored in the manifests without reading
+      any item content, which requires both datasets to use the same hash
+      function
+
+    Differences are yielded as soon as they are found, so the order of the
+    results is not deterministic in "rehash" mode.
 
     :param a: first :class:`dtoolcore.DataSet`
-    :param b: second :class:`dtoolcore.DataSet`
-    :returns: list of tuples for all items with different content
+    :param reference: reference :class:`dtoolcore.DataSet`
+    :param mode: one of "rehash" or "manifest"
+    :param num_threads: number of threads used in "rehash" mode, see
+                        :func:`dtoolcore.utils.get_num_threads`
+    :param executor: :class:`concurrent.futures.ThreadPoolExecutor` used to
+                     hash the items in "rehash" mode instead of a pool of
+                     num_threads threads
+    :returns: iterator over tuples for all items with different content
+    :raises: DtoolCoreValueError if the mode is unknown or the hash
+             functions differ in "manifest" mode
     """
-    difference = []
+    if mode not in DIFF_CONTENT_MODES:
+        raise DtoolCoreValueError("Unknown diff content mode: {}".format(mode))
 
-    for i in a.identifiers:
-        fpath = a.item_content_abspath(i)
-        calc_hash = reference._storage_broker.hasher(fpath)
-        ref_hash = reference.item_properties(i)["hash"]
+    ref_manifest = reference._manifest
+
+    if mode == "manifest":
+        a_manifest = a._manifest
+        if a_manifest["hash_function"] != ref_manifest["hash_function"]:
+            raise DtoolCoreValueError(
+                "Hash functions differ ({} != {})".format(
+                    a_manifest["hash_function"],
+                    ref_manifest["hash_function"]
+                )
+            )
+        for i, properties in a_manifest["items"].items():
+            ref_hash = ref_manifest["items"][i]["hash"]
+            if properties["hash"] != ref_hash:
+                yield (i, properties["hash"], ref_hash)
+            if progressbar:
+                progressbar.update(1)
+        return
+
+    hasher = reference._storage_broker.hasher
+
+    def rehash(identifier):
+        return identifier, hasher(a.item_content_abspath(identifier))
+
+    for i, calc_hash in dtoolcore.utils.threaded_imap_unordered(
+        rehash,
+        a.identifiers,
+        dtoolcore.utils.get_num_threads(num_threads),
+        executor=executor
+    ):
+        ref_hash = ref_manifest["items"][i]["hash"]
         if calc_hash != ref_hash:
-            info = (i, calc_hash, ref_hash)
-            difference.append(info)
+            yield (i, calc_hash, ref_hash)
         if progressbar:
             progressbar.update(1)
 
-    return difference
+
+def diff_content(
+    a,
+    reference,
+    progressbar=None,
+    mode="rehash",
+    num_threads=None,
+    executor=None
+):
+    """Return list of tuples where content differ.
+
+    Tuple structure:
+    (identifier, hash in a, hash in reference)
+
+    Assumes list of identifiers in a and b are identical.
+
+    Storage broker of reference used to generate hash for files in a. See
+    :func:`dtoolcore.compare.iter_diff_content` for the modes and for
+    streaming the differences as they are found.
+
+    :param a: first :class:`dtoolcore.DataSet`
+    :param b: second :class:`dtoolcore.DataSet`
+    :param mode: one of "rehash" or "manifest"
+    :param num_threads: number of threads used in "rehash" mode
+    :param executor: executor used to hash the items in "rehash" mode
+    :returns: list of tuples for all items with different content, sorted
+              by identifier
+    """
+    return sorted(iter_diff_content(
+        a,
+        reference,
+        mode=mode,
+        num_threads=num_threads,
+        executor=executor,
+        progressbar=progressbar
+    ))
+
+
+def iter_sorted_items(dataset):
+    """Yield (identifier, properties) tuples of the items sorted by identifier.
+
+    The manifest is a single JSON document, so it is read as a whole and its
+    identifiers are sorted in memory: peak memory is proportional to the
+    size of the manifest. Only the tuples are yielded lazily.
+
+    :param dataset: :class:`dtoolcore.DataSet`
+    :returns: iterator over (identifier, item properties) tuples
+    """
+    items = dataset._manifest["items"]
+    for identifier in sorted(items):
+        yield identifier, items[identifier]
+
+
+def _checked_sorted(items, label):
+    """Yield items, raising if the identifiers are not strictly ascending."""
+    previous = None
+    for identifier, properties in items:
+        if previous is not None and identifier <= previous:
+            raise DtoolCoreValueError(
+                "Items of {} are not sorted by identifier: {} after {}".format(
+                    label,
+                    identifier,
+                    previous
+                )
+            )
+        previous = identifier
+        yield identifier, properties
+
+
+def merge_diff(a_items, b_items, compare_hashes=True):
+    """Yield differences between two streams of items sorted by identifier.
+
+    Tuple structure:
+    (identifier, difference, value in a, value in b)
+
+    Where difference is one of:
+
+    - "missing": the item is only present in one of the streams, the values
+      are the relpath of the item or None if it is absent
+    - "relpath": the relpaths differ
+    - "size": the sizes in bytes differ
+    - "hash": the hashes differ
+
+    The streams are consumed in a single pass and only the current item of
+    each stream is held in memory.
+
+    :param a_items: iterable of (identifier, properties) tuples sorted by
+                    identifier, see :func:`dtoolcore.compare.iter_sorted_items`
+    :param b_items: iterable of (identifier, properties) tuples sorted by
+                    identifier
+    :param compare_hashes: whether to compare the item hashes
+    :returns: iterator over tuples describing differences
+    :raises: DtoolCoreValueError if a stream is not sorted by identifier
+    """
+    a_iter = _checked_sorted(a_items, "a")
+    b_iter = _checked_sorted(b_items, "b")
+    a_item = next(a_iter, None)
+    b_item = next(b_iter, None)
+
+    while a_item is not None or b_item is not None:
+        if b_item is None or (a_item is not None and a_item[0] < b_item[0]):
+            yield (a_item[0], "missing", a_item[1]["relpath"], None)
+            a_item = next(a_iter, None)
+            continue
+        if a_item is None or b_item[0] < a_item[0]:
+            yield (b_item[0], "missing", None, b_item[1]["relpath"])
+            b_item = next(b_iter, None)
+            continue
+
+        identifier, a_props = a_item
+        b_props = b_item[1]
+        keys = ["relpath", "size_in_bytes"]
+        if compare_hashes:
+            keys.append("hash")
+        for key in keys:
+            if a_props[key] != b_props[key]:
+                difference = "size" if key == "size_in_bytes" else key
+                yield (identifier, difference, a_props[key], b_props[key])
+        a_item = next(a_iter, None)
+        b_item = next(b_iter, None)
+
+
+def iter_diff(a, b, progressbar=None):
+    """Yield differences between the items of two datasets.
+
+    Single pass alternative to :func:`dtoolcore.compare.diff_identifiers`,
+    :func:`dtoolcore.compare.diff_sizes` and the "manifest" mode of
+    :func:`dtoolcore.compare.diff_content`, see
+    :func:`dtoolcore.compare.merge_diff` for the tuple structure. Hashes are
+    only compared if both datasets use the same hash function.
+
+    The items are read using :func:`dtoolcore.compare.iter_sorted_items`,
+    so peak memory is still proportional to the size of the manifests; only
+    the comparison itself is done in bounded memory. Callers that can
+    provide item streams already sorted by identifier, e.g. from an index,
+    can compare them in bounded memory using
+    :func:`dtoolcore.compare.merge_diff` directly.
+
+    :param a: first :class:`dtoolcore.DataSet`
+    :param b: second :class:`dtoolcore.DataSet`
+    :returns: iterator over tuples describing differences
+    """
+    compare_hashes = (
+        a._manifest["hash_function"] == b._manifest["hash_function"]
+    )
+    if not compare_hashes:
+        logger.warning(
+            "Hash functions of {} and {} differ, not comparing hashes".format(
+                a.uri,
+                b.uri
+            )
+        )
+
+    def counted(items):
+        for item in items:
+            yield item
+            if progressbar:
+                progressbar.update(1)
+
+    for difference in merge_diff(
+        counted(iter_sorted_items(a)),
+        iter_sorted_items(b),
+        compare_hashes
+    ):
+        yield difference
+
+
+def _merkle_tree(dataset):
+    """Return the stored Merkle tree, calculating it for older datasets."""
+    manifest = dataset._manifest
+    tree = dtoolcore.merkle.StoredMerkleTree.from_manifest(manifest)
+    if tree is None:
+        tree = dtoolcore.merkle.MerkleTree.from_manifest(manifest)
+    return tree
+
+
+def _merkle_root(dataset):
+    """Return the stored Merkle root, calculating it for older datasets."""
+    manifest = dataset._manifest
+    if "merkle_root" in manifest:
+        return manifest["merkle_root"]
+    return dtoolcore.merkle.merkle_root(manifest)
+
+
+def _check_same_hash_function(a, b):
+    a_hash_function = a._manifest["hash_function"]
+    b_hash_function = b._manifest["hash_function"]
+    if a_hash_function != b_hash_function:
+        raise DtoolCoreValueError(
+            "Hash functions differ ({} != {})".format(
+                a_hash_function,
+                b_hash_function
+            )
+        )
+
+
+def merkle_roots_equal(a, b):
+    """Return True if the two datasets hold identical items.
+
+    Compares the Merkle roots stored in the manifests, see
+    :mod:`dtoolcore.merkle`. The roots of datasets frozen before Merkle
+    roots were stored are calculated from their manifests.
+
+    :param a: first :class:`dtoolcore.DataSet`
+    :param b: second :class:`dtoolcore.DataSet`
+    :returns: True if the relpaths, sizes and hashes of all items are equal
+    :raises: DtoolCoreValueError if the datasets use different hash
+             functions
+    """
+    _check_same_hash_function(a, b)
+    return _merkle_root(a) == _merkle_root(b)
+
+
+def diff_subtrees(a, b):
+    """Yield tuples for the items and directories that differ.
+
+    Tuple structure:
+    (path, digest in a, digest in b)
+
+    The Merkle trees of the datasets are compared top down, only descending
+    into directories whose digests differ. The directory digests stored in
+    the manifests are used, so item digests are only calculated for the
+    directories that differ; the trees of datasets frozen before directory
+    digests were stored are calculated from their manifests. Paths of
+    directories end with "/". Directories only present in one of the
+    datasets are yielded as a whole, with None as the digest in the other
+    dataset.
+
+    :param a: first :class:`dtoolcore.DataSet`
+    :param b: second :class:`dtoolcore.DataSet`
+    :returns: iterator over tuples describing differences
+    :raises: DtoolCoreValueError if the datasets use different hash
+             functions
+    """
+    _check_same_hash_function(a, b)
+    if _merkle_root(a) == _merkle_root(b):
+        return
+
+    a_tree = _merkle_tree(a)
+    b_tree = _merkle_tree(b)
+    pending = [""]
+    while pending:
+        directory = pending.pop()
+        a_children = a_tree.children(directory)
+        b_children = b_tree.children(directory)
+        for name in sorted(set(a_children) | set(b_children)):
+            a_kind, a_digest = a_children.get(name, (None, None))
+            b_kind, b_digest = b_children.get(name, (None, None))
+            if a_digest == b_digest:
+                continue
+            path = directory + "/" + name if directory else name
+            if a_kind == b_kind == dtoolcore.merkle.DIRECTORY:
+                pending.append(path)
+                continue
+            if a_kind == dtoolcore.merkle.DIRECTORY and b_kind is None \
+                    or b_kind == dtoolcore.merkle.DIRECTORY and a_kind is None:
+                path = path + "/"
+            yield (path, a_digest, b_digest)
+
+
+def _iter_directory_files(path):
+    """Yield (relpath, abspath, stat result) tuples of the files in path.
+
+    Symbolic links to files are followed, symbolic links to directories are
+    not, as when items are listed by the
+    :class:`dtoolcore.storagebroker.DiskStorageBroker`.
+    """
+    pending = [(path, "")]
+    while pending:
+        directory, prefix = pending.pop()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                relpath = prefix + entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append((entry.path, relpath + "/"))
+                elif entry.is_file():
+                    yield relpath, entry.path, entry.stat()
+
+
+def _mtime_matches(stat, utc_timestamp):
+    """Return True if the modification time is the timestamp.
+
+    Manifest timestamps have microsecond resolution.
+    """
+    return abs(stat.st_mtime_ns / 1000.0 - utc_timestamp * 1e6) < 1
+
+
+def diff_directory(
+    dataset,
+    path,
+    num_threads=None,
+    hash_cache=None,
+    trust_mtime=False,
+    progressbar=None
+):
+    """Yield tuples for files in a directory that differ from dataset items.
+
+    Tuple structure:
+    (relpath, difference)
+
+    Where difference is one of "new" (only in the directory), "changed"
+    (different size or content) or "removed" (only in the dataset).
+
+    Files with the size of the item are hashed concurrently using the hash
+    function recorded in the manifest, unless their hash is found in the
+    hash_cache. If trust_mtime is True, files whose modification time is the
+    item's ``utc_timestamp``, e.g. hard links to the items or copies
+    preserving their timestamps, are considered unchanged without reading
+    them. "new" and "changed" files are yielded as they are found, "removed"
+    items once the whole directory has been scanned.
+
+    :param dataset: :class:`dtoolcore.DataSet`
+    :param path: path to the directory
+    :param num_threads: number of threads used for hashing, see
+                        :func:`dtoolcore.utils.get_num_threads`
+    :param hash_cache: optional :class:`dtoolcore.hashcache.HashCache` used
+                       to look up and store the hashes of files
+    :param trust_mtime: consider files with the size and modification time
+                        of the item unchanged without hashing them
+    :raises: DtoolCoreValueError if the hash function of the dataset cannot
+             be calculated for local files
+    :returns: iterator over tuples describing differences
+    """
+    manifest = dataset._manifest
+    hash_function = manifest["hash_function"]
+    hasher = dtoolcore.filehasher.get_file_hasher(hash_function)
+    if hasher is None:
+        raise DtoolCoreValueError(
+            "Cannot hash files using '{}'".format(hash_function)
+        )
+    remaining = dict(
+        (properties["relpath"], properties)
+        for properties in manifest["items"].values()
+    )
+
+    # Files are classified in the calling thread, where the hash cache can
+    # be used; only files whose content needs checking are hashed in the
+    # worker threads. Candidates are (relpath, fpath, stat, difference,
+    # expected hash) tuples, with a difference of None if undecided.
+    def classify():
+        for relpath, fpath, stat in _iter_directory_files(path):
+            if progressbar:
+                progressbar.update(1)
+            properties = remaining.pop(relpath, None)
+            if properties is None:
+                yield relpath, fpath, stat, "new", None
+                continue
+            if stat.st_size != properties["size_in_bytes"]:
+                yield relpath, fpath, stat, "changed", None
+                continue
+            if trust_mtime and \
+                    _mtime_matches(stat, properties["utc_timestamp"]):
+                continue
+            cached_hash = None
+            if hash_cache is not None:
+                cached_hash = hash_cache.get(fpath, stat, hash_function)
+            if cached_hash is None:
+                yield relpath, fpath, stat, None, properties["hash"]
+            elif cached_hash != properties["hash"]:
+                yield relpath, fpath, stat, "changed", None
+
+    def check(candidate):
+        if candidate[3] is not None:
+            return candidate, None
+        return candidate, hasher(candidate[1])
+
+    try:
+        for candidate, calc_hash in dtoolcore.utils.threaded_imap_unordered(
+                check,
+                classify(),
+                dtoolcore.utils.get_num_threads(num_threads)):
+            relpath, fpath, stat, difference, expected_hash = candidate
+            if difference is None:
+                if hash_cache is not None:
+                    hash_cache.put(fpath, stat, hash_function, calc_hash)
+                if calc_hash == expected_hash:
+                    continue
+                difference = "changed"
+            yield relpath, difference
+    finally:
+        if hash_cache is not None:
+            hash_cache.commit()
+
+    for relpath in sorted(remaining):
+        yield relpath, "removed"
+
+
+def _sample_identifiers(dataset, fraction=None, max_bytes=None, seed=None):
+    """Return randomly sampled list of identifiers.
+
+    :param dataset: :class:`dtoolcore.DataSet`
+    :param fraction: fraction of items to sample
+    :param max_bytes: upper limit on the total size of the sampled items
+    :param seed: seed for the random number generator
+    :returns: list of identifiers
+    """
+    rng = random.Random(seed)
+    identifiers = sorted(dataset.identifiers)
+    rng.shuffle(identifiers)
+
+    if fraction is not None:
+        num_items = int(round(len(identifiers) * fraction))
+        if fraction > 0:
+            num_items = max(1, num_items)
+        identifiers = identifiers[:num_items]
+
+    if max_bytes is not None:
+        sampled = []
+        total = 0
+        for i in identifiers:
+            size = dataset.item_properties(i)["size_in_bytes"]
+            if total + size <= max_bytes:
+                sampled.append(i)
+                total += size
+        identifiers = sampled
+
+    return identifiers
+
+
+def _verify_item(dataset, identifier, check_hash):
+    """Return list of tuples describing problems with a single item."""
+    properties = dataset.item_properties(identifier)
+    missing = [(identifier, "missing", properties["relpath"], None)]
+
+    if not check_hash:
+        # Only metadata is needed, so the item content is not fetched.
+        try:
+            size_in_bytes, utc_timestamp = \
+                dataset._storage_broker.get_item_stat(
+                    identifier,
+                    properties["relpath"]
+                )
+        except (IOError, OSError, KeyError):
+            return missing
+    else:
+        try:
+            fpath = dataset.item_content_abspath(identifier)
+            size_in_bytes = os.stat(fpath).st_size
+        except (IOError, OSError, KeyError):
+            return missing
+
+    problems = []
+    if size_in_bytes != properties["size_in_bytes"]:
+        problems.append(
+            (identifier, "size", properties["size_in_bytes"], size_in_bytes)
+        )
+
+    if check_hash:
+        calc_hash = dataset._storage_broker.hasher(fpath)
+        if calc_hash != properties["hash"]:
+            problems.append(
+                (identifier, "hash", properties["hash"], calc_hash)
+            )
+    elif abs(utc_timestamp - properties["utc_timestamp"]) > 1e-3:
+        problems.append((
+            identifier,
+            "utc_timestamp",
+            properties["utc_timestamp"],
+            utc_timestamp
+        ))
+
+    return problems
+
+
+def verify(
+    dataset,
+    mode="full",
+    fraction=None,
+    max_bytes=None,
+    seed=None,
+    num_threads=None,
+    progressbar=None
+):
+    """Yield tuples for items whose content does not match the manifest.
+
+    Tuple structure:
+    (identifier, problem, expected, actual)
+
+    Where problem is one of "missing", "size", "utc_timestamp" or "hash".
+
+    Modes:
+
+    - "quick": check existence, size and modification time of all items
+    - "sampled": check existence, size and hash of a random sample of the
+      items, limited by ``fraction`` and/or ``max_bytes``
+    - "full": check existence, size and hash of all items
+
+    Items are checked concurrently and problems are yielded as soon as they
+    are found, so the order of the results is not deterministic. The
+    modification time check is only meaningful for storage brokers that give
+    direct access to the item content, like the
+    :class:`dtoolcore.storagebroker.DiskStorageBroker`.
+
+    :param dataset: :class:`dtoolcore.DataSet`
+    :param mode: one of "quick", "sampled" or "full"
+    :param fraction: fraction of items to check in "sampled" mode
+    :param max_bytes: maximum number of bytes to hash in "sampled" mode
+    :param seed: seed for the random sampling
+    :param num_threads: number of threads, see
+                        :func:`dtoolcore.utils.get_num_threads`
+    :returns: iterator over tuples describing problems
+    :raises: DtoolCoreValueError if the mode is unknown or the sampled mode
+             lacks a fraction or byte budget
+    """
+    if mode not in VERIFY_MODES:
+        raise DtoolCoreValueError("Unknown verify mode: {}".format(mode))
+
+    if mode == "sampled":
+        if fraction is None and max_bytes is None:
+            raise DtoolCoreValueError(
+                "Sampled verification requires fraction or max_bytes"
+            )
+        identifiers = _sample_identifiers(dataset, fraction, max_bytes, seed)
+    else:
+        identifiers = dataset.identifiers
+
+    # The arguments are checked above, when verify is called; the items are
+    # only checked once the returned iterator is consumed.
+    return _iter_verify(
+        dataset,
+        identifiers,
+        mode != "quick",
+        dtoolcore.utils.get_num_threads(num_threads),
+        progressbar
+    )
+
+
+def _iter_verify(dataset, identifiers, check_hash, num_threads,
+                 progressbar=None):
+    """Yield problems of the items, checked concurrently."""
+    def verify_item(identifier):
+        return _verify_item(dataset, identifier, check_hash)
+
+    for problems in dtoolcore.utils.threaded_imap_unordered(
+        verify_item,
+        identifiers,
+        num_threads
+    ):
+        for problem in problems:
+            yield problem
+        if progressbar:
+            progressbar.update(1)
@@ -2,6 +2,12 @@
 
 import hashlib
 
+from dtoolcore.utils import (
+    get_io_hints,
+    open_for_sequential_read,
+    drop_from_page_cache,
+)
+
 
 class FileHasher(object):
     """Class for associating hash functions with names."""
@@ -13,6 +19,20 @@ class FileHasher(object):
     def __call__(self, filename):
         return self.func(filename)
 
+    def hashlib_hasher(self):
+        """Return hashlib object for calculating the hash incrementally.
+
+        The hex digest of the returned object is the same as the value
+        returned when calling the file hasher on a file with the same content.
+
+        :returns: hashlib object or None if the hash function can not be
+                  calculated incrementally
+        """
+        constructor = _INCREMENTAL_HASH_FUNCTIONS.get(self.name)
+        if constructor is None:
+            return None
+        return constructor()
+
 
 def _hash_the_file(hasher, filename):
     """Helper function for creating hash functions.
@@ -21,11 +41,14 @@ def _hash_the_file(hasher, filename):
     for more usage details.
     """
     BUF_SIZE = 65536
-    with open(filename, 'rb') as f:
+    sequential, drop_cache = get_io_hints()
+    with open_for_sequential_read(filename, io_hints=sequential) as f:
         buf = f.read(BUF_SIZE)
         while len(buf) > 0:
             hasher.update(buf)
             buf = f.read(BUF_SIZE)
+        if drop_cache:
+            drop_from_page_cache(f)
     return hasher
 
 
@@ -87,3 +110,24 @@ def md5sum_digest(filename):
     """
     hasher = hashlib.md5()
     return hashsum_digest(hasher, filename)
+
+
+# Hex digest hash functions that can also be calculated incrementally, e.g.
+# on content streamed into a dataset.
+_INCREMENTAL_HASH_FUNCTIONS = {
+    sha1sum_hexdigest.__name__: hashlib.sha1,
+    sha256sum_hexdigest.__name__: hashlib.sha256,
+    md5sum_hexdigest.__name__: hashlib.md5,
+}
+
+
+def get_file_hasher(name):
+    """Return the file hasher for a hash function recorded in a manifest.
+
+    :param name: name of the hash function, e.g. "md5sum_hexdigest"
+    :returns: :class:`dtoolcore.filehasher.FileHasher` or None if there is
+              no file hash function with the name
+    """
+    if name not in _INCREMENTAL_HASH_FUNCTIONS:
+        return None
+    return FileHasher(globals()[name])
@@ -0,0 +1,117 @@
+"""Persistent cache of file hashes.
+
+Hashing large files is expensive, so
+:func:`dtoolcore.compare.diff_directory` can store the hashes it calculates
+in a :class:`dtoolcore.hashcache.HashCache`. Cached hashes are keyed by the
+absolute path and hash function and are only used while the size and
+modification time of the file are unchanged.
+
+The default location of the SQLite database can be configured using
+``DTOOL_HASH_CACHE_PATH``.
+"""
+
+import os
+import sqlite3
+
+import dtoolcore.utils
+
+DEFAULT_HASH_CACHE_PATH = os.path.expanduser(
+    "~/.cache/dtool/hash_cache.sqlite"
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    path TEXT NOT NULL,
+    hash_function TEXT NOT NULL,
+    size_in_bytes INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    PRIMARY KEY (path, hash_function)
+);
+"""
+
+
+class HashCache(object):
+    """SQLite cache of file hashes.
+
+    The cache is not thread safe, it should be used from the thread that
+    created it.
+
+    :param db_path: path to the SQLite database, defaults to the value of
+                    ``DTOOL_HASH_CACHE_PATH``
+    :param config_path: path to the dtool configuration file
+    """
+
+    def __init__(self, db_path=None, config_path=None):
+        if db_path is None:
+            db_path = dtoolcore.utils.get_config_value(
+                "DTOOL_HASH_CACHE_PATH",
+                config_path=config_path,
+                default=DEFAULT_HASH_CACHE_PATH
+            )
+        if db_path != ":memory:":
+            dtoolcore.utils.mkdir_parents(
+                os.path.dirname(os.path.abspath(db_path))
+            )
+        self.db_path = db_path
+        self._connection = sqlite3.connect(db_path)
+        self._connection.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    def close(self):
+        """Commit pending changes and close the database connection."""
+        self.commit()
+        self._connection.close()
+
+    def commit(self):
+        """Commit the hashes stored since the last commit."""
+        self._connection.commit()
+
+    def get(self, fpath, stat_result, hash_function):
+        """Return the cached hash of a file or None.
+
+        :param fpath: path to the file
+        :param stat_result: current :func:`os.stat` result of the file
+        :param hash_function: name of the hash function
+        :returns: hash or None if there is no hash for the current size and
+                  modification time of the file
+        """
+        row = self._connection.execute(
+            "SELECT size_in_bytes, mtime_ns, hash FROM hashes "
+            "WHERE path = ? AND hash_function = ?",
+            (os.path.abspath(fpath), hash_function)
+        ).fetchone()
+        if row is None:
+            return None
+        size_in_bytes, mtime_ns, file_hash = row
+        if size_in_bytes != stat_result.st_size \
+                or mtime_ns != stat_result.st_mtime_ns:
+            return None
+        return file_hash
+
+    def put(self, fpath, stat_result, hash_function, file_hash):
+        """Store the hash of a file.
+
+        The hash is written to the database on the next :meth:`commit`.
+
+        :param fpath: path to the file
+        :param stat_result: :func:`os.stat` result of the file when it was
+                            hashed
+        :param hash_function: name of the hash function
+        :param file_hash: hash of the file
+        """
+        self._connection.execute(
+            "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)",
+            (
+                os.path.abspath(fpath),
+                hash_function,
+                stat_result.st_size,
+                stat_result.st_mtime_ns,
+                file_hash,
+            )
+        )
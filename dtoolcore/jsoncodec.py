@@ -0,0 +1,253 @@
+"""Codecs for encoding and decoding dataset metadata as JSON.
+
+The storage brokers encode and decode the manifest, overlays, annotations and
+other metadata using a :class:`dtoolcore.jsoncodec.JSONCodec`. The codec is
+selected using the ``DTOOL_JSON_CODEC`` setting:
+
+- ``json`` (default): the :mod:`json` module of the standard library
+- ``orjson``: the `orjson <https://github.com/ijl/orjson>`_ package, which is
+  several times faster on large manifests
+- ``auto``: the fastest codec that is installed
+
+Further codecs can be made available by packages using the
+``dtool.json_codecs`` entry point group. If the configured codec is not
+installed a warning is logged and the standard library codec is used.
+
+All codecs read what the others write and escape non-ASCII characters like
+the standard library, so the files do not depend on the locale encoding and
+the setting can differ between the machines accessing a dataset. See
+``benchmarks/bench_json_codec.py`` for a comparison of the codecs on large
+manifests.
+"""
+
+import json
+import logging
+import re
+import threading
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from dtoolcore.utils import get_config_value, get_memoised_config
+
+logger = logging.getLogger(__name__)
+
+#: Name of the codec used if ``DTOOL_JSON_CODEC`` is not set.
+DEFAULT_JSON_CODEC = "json"
+
+# Codecs tried in order when ``DTOOL_JSON_CODEC`` is "auto".
+_AUTO_PREFERENCE = ["orjson", "json"]
+
+_NON_ASCII = re.compile(r"[^\x00-\x7f]")
+
+
+def _escape_non_ascii_char(match):
+    code_point = ord(match.group(0))
+    if code_point < 0x10000:
+        return "\\u{:04x}".format(code_point)
+    # Characters outside the basic multilingual plane are written as a
+    # surrogate pair.
+    code_point -= 0x10000
+    return "\\u{:04x}\\u{:04x}".format(
+        0xd800 | (code_point >> 10),
+        0xdc00 | (code_point & 0x3ff)
+    )
+
+
+def _escape_non_ascii(text):
+    """Return JSON text with non-ASCII characters escaped.
+
+    Non-ASCII characters can only occur in strings, where they are replaced
+    by the escape sequences that :func:`json.dumps` writes.
+    """
+    if text.isascii():
+        return text
+    return _NON_ASCII.sub(_escape_non_ascii_char, text)
+
+
+class JSONCodec(object):
+    """Base class for JSON codecs."""
+
+    #: Name of the codec used in the ``DTOOL_JSON_CODEC`` setting.
+    name = None
+
+    @classmethod
+    def is_available(cls):
+        """Return True if the codec can be used in this environment."""
+        return True
+
+    def dumps(self, obj, indent=None, sort_keys=False):
+        """Return obj encoded as a JSON string.
+
+        :param obj: JSON serialisable value or data structure
+        :param indent: number of spaces used to indent nested structures,
+                       None for compact output on a single line
+        :param sort_keys: sort the keys of dictionaries
+        :returns: JSON string
+        """
+        raise(NotImplementedError())
+
+    def loads(self, text):
+        """Return the value encoded in the JSON string.
+
+        :param text: JSON string
+        :raises: ValueError if the text is not valid JSON
+        """
+        raise(NotImplementedError())
+
+
+class StdlibJSONCodec(JSONCodec):
+    """Codec using the :mod:`json` module of the standard library."""
+
+    name = "json"
+
+    def dumps(self, obj, indent=None, sort_keys=False):
+        return json.dumps(obj, indent=indent, sort_keys=sort_keys)
+
+    def loads(self, text):
+        return json.loads(text)
+
+
+class OrjsonJSONCodec(JSONCodec):
+    """Codec using the orjson package.
+
+    orjson writes non-ASCII characters as UTF-8, so they are escaped
+    afterwards to match the output of the standard library. Values that
+    orjson does not support, e.g. integers larger than 64 bit or ``NaN`` in
+    existing files, are handled by falling back to the standard library.
+    """
+
+    name = "orjson"
+
+    _stdlib = StdlibJSONCodec()
+
+    @classmethod
+    def is_available(cls):
+        return orjson is not None
+
+    def dumps(self, obj, indent=None, sort_keys=False):
+        if indent not in (None, 2):
+            # orjson only supports indenting by two spaces.
+            return self._stdlib.dumps(obj, indent, sort_keys)
+        option = orjson.OPT_NON_STR_KEYS
+        if indent is not None:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            text = orjson.dumps(obj, option=option).decode("utf-8")
+        except orjson.JSONEncodeError:
+            return self._stdlib.dumps(obj, indent, sort_keys)
+        return _escape_non_ascii(text)
+
+    def loads(self, text):
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            return self._stdlib.loads(text)
+
+
+_BUILTIN_JSON_CODECS = {
+    StdlibJSONCodec.name: StdlibJSONCodec,
+    OrjsonJSONCodec.name: OrjsonJSONCodec,
+}
+
+# Codec instances are shared, the lookup including the entry points is built
+# once per process.
+_JSON_CODEC_LOOKUP = None
+_JSON_CODECS = dict()
+_JSON_CODEC_LOCK = threading.Lock()
+
+# DTOOL_JSON_CODEC settings keyed by configuration file path.
+_JSON_CODEC_SETTINGS = dict()
+
+
+def _load_json_codec_entry_points():
+    """Return dictionary of the codecs registered as entry points."""
+    from importlib.metadata import entry_points
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        entrypoints = eps.select(group="dtool.json_codecs")
+    else:
+        entrypoints = eps.get("dtool.json_codecs", [])
+
+    lookup = dict()
+    for entrypoint in entrypoints:
+        codec_cls = entrypoint.load()
+        lookup[codec_cls.name] = codec_cls
+    return lookup
+
+
+def _get_json_codec_lookup():
+    global _JSON_CODEC_LOOKUP
+    with _JSON_CODEC_LOCK:
+        if _JSON_CODEC_LOOKUP is None:
+            lookup = _load_json_codec_entry_points()
+            lookup.update(_BUILTIN_JSON_CODECS)
+            _JSON_CODEC_LOOKUP = lookup
+        return _JSON_CODEC_LOOKUP
+
+
+def _read_json_codec_setting(config_path):
+    return get_config_value(
+        "DTOOL_JSON_CODEC",
+        config_path,
+        default=DEFAULT_JSON_CODEC
+    )
+
+
+def list_json_codecs():
+    """Return sorted list of the names of the codecs that can be used."""
+    return sorted(
+        name for name, codec_cls in _get_json_codec_lookup().items()
+        if codec_cls.is_available()
+    )
+
+
+def get_json_codec(name=None, config_path=None):
+    """Return the JSON codec used for dataset metadata.
+
+    :param name: name of the codec, defaults to the ``DTOOL_JSON_CODEC``
+                 setting
+    :param config_path: path to the dtool configuration file
+    :raises: DtoolCoreValueError if there is no codec with the name
+    :returns: :class:`dtoolcore.jsoncodec.JSONCodec`
+    """
+    import dtoolcore
+
+    if name is None:
+        name = get_memoised_config(
+            _JSON_CODEC_SETTINGS,
+            config_path,
+            ("DTOOL_JSON_CODEC",),
+            _read_json_codec_setting
+        )
+
+    lookup = _get_json_codec_lookup()
+    if name == "auto":
+        name = [n for n in _AUTO_PREFERENCE if lookup[n].is_available()][0]
+
+    if name not in lookup:
+        raise dtoolcore.DtoolCoreValueError(
+            "Unknown JSON codec '{}', available codecs: {}".format(
+                name,
+                ", ".join(list_json_codecs())
+            )
+        )
+
+    codec_cls = lookup[name]
+    if not codec_cls.is_available():
+        logger.warning(
+            "JSON codec '{}' is not installed, using '{}'".format(
+                name,
+                DEFAULT_JSON_CODEC
+            )
+        )
+        codec_cls = lookup[DEFAULT_JSON_CODEC]
+
+    with _JSON_CODEC_LOCK:
+        if codec_cls.name not in _JSON_CODECS:
+            _JSON_CODECS[codec_cls.name] = codec_cls()
+        return _JSON_CODECS[codec_cls.name]
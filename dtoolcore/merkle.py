@@ -0,0 +1,216 @@
+"""Merkle trees over the items of a dataset.
+
+The items of a dataset are arranged in a tree following the directories in
+their relpaths. Each item has a digest of its name, hash and size and each
+directory has a digest of the sorted names and digests of its children, so
+the digest of the root directory, the Merkle root, changes if any item is
+added, removed, renamed or has different content.
+
+The Merkle root is stored as ``merkle_root`` and the digests of all
+directories as ``merkle_directories`` in the manifest when a dataset is
+frozen. Two datasets using the same hash function hold identical items if
+and only if their Merkle roots are equal, see
+:func:`dtoolcore.compare.merkle_roots_equal`. The directories that differ
+can be found using :func:`dtoolcore.compare.diff_subtrees`, which reads the
+stored directory digests and only calculates the digests of the items in
+directories that differ.
+
+All digests are SHA-256 hex digests calculated from the manifest, no item
+content is read.
+"""
+
+import hashlib
+
+#: Kinds of the nodes in the tree.
+FILE = "file"
+DIRECTORY = "directory"
+
+
+def _item_digest(name, item_hash, size_in_bytes):
+    text = "{}\0{}\0{}".format(name, item_hash, size_in_bytes)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _directory_digest(children):
+    hasher = hashlib.sha256()
+    for name in sorted(children):
+        kind, digest = children[name]
+        line = "{}\0{}\0{}\n".format(kind, name, digest)
+        hasher.update(line.encode("utf-8"))
+    return hasher.hexdigest()
+
+
+class MerkleTree(object):
+    """Merkle tree over the items of a dataset.
+
+    Directories are identified by their path relative to the root of the
+    dataset, using "/" as separator; the root directory is "".
+
+    :param children: dictionary mapping directory paths to dictionaries of
+                     (kind, digest) tuples keyed by child name
+    """
+
+    def __init__(self, children):
+        self._children = children
+
+    @classmethod
+    def from_items(cls, items):
+        """Return tree built from item entries.
+
+        :param items: iterable of (relpath, hash, size_in_bytes) tuples
+        :returns: :class:`dtoolcore.merkle.MerkleTree`
+        """
+        directories = {"": {}}
+        for relpath, item_hash, size_in_bytes in items:
+            parts = relpath.split("/")
+            for i in range(1, len(parts)):
+                directories.setdefault("/".join(parts[:i]), {})
+            parent = "/".join(parts[:-1])
+            directories[parent][parts[-1]] = (
+                FILE,
+                _item_digest(parts[-1], item_hash, size_in_bytes)
+            )
+
+        # Calculate the directory digests bottom up, deepest first.
+        subdirectories = [p for p in directories if p != ""]
+        for path in sorted(subdirectories, key=lambda p: p.count("/"),
+                           reverse=True):
+            parent, _, name = path.rpartition("/")
+            directories[parent][name] = (
+                DIRECTORY,
+                _directory_digest(directories[path])
+            )
+        return cls(directories)
+
+    @classmethod
+    def from_manifest(cls, manifest):
+        """Return tree built from the items of a manifest.
+
+        :param manifest: manifest dictionary
+        :returns: :class:`dtoolcore.merkle.MerkleTree`
+        """
+        return cls.from_items(
+            (p["relpath"], p["hash"], p["size_in_bytes"])
+            for p in manifest["items"].values()
+        )
+
+    @property
+    def root(self):
+        """Return the digest of the root directory."""
+        return self.digest("")
+
+    def digest(self, path):
+        """Return the digest of a directory.
+
+        :param path: directory path, "" for the root directory
+        :raises: KeyError if there is no such directory
+        """
+        return _directory_digest(self._children[path])
+
+    def children(self, path):
+        """Return dictionary of (kind, digest) tuples keyed by child name.
+
+        :param path: directory path, "" for the root directory
+        :raises: KeyError if there is no such directory
+        """
+        return dict(self._children[path])
+
+    def directory_digests(self):
+        """Return dictionary of the digests of all directories by path."""
+        return dict((path, self.digest(path)) for path in self._children)
+
+
+class StoredMerkleTree(object):
+    """Merkle tree using the directory digests stored in a manifest.
+
+    Provides the interface of :class:`dtoolcore.merkle.MerkleTree` without
+    calculating the digests of all items up front: directory digests are
+    read from the manifest and item digests are only calculated for the
+    directories whose children are listed.
+
+    :param directory_digests: dictionary of directory digests by path
+    :param items: iterable of (relpath, hash, size_in_bytes) tuples
+    """
+
+    def __init__(self, directory_digests, items):
+        self._digests = directory_digests
+        self._subdirectories = {}
+        for path in directory_digests:
+            if path:
+                parent, _, name = path.rpartition("/")
+                self._subdirectories.setdefault(parent, []).append(name)
+        self._items = {}
+        for relpath, item_hash, size_in_bytes in items:
+            parent, _, name = relpath.rpartition("/")
+            self._items.setdefault(parent, []).append(
+                (name, item_hash, size_in_bytes)
+            )
+
+    @classmethod
+    def from_manifest(cls, manifest):
+        """Return tree using the digests stored in a manifest.
+
+        :param manifest: manifest dictionary
+        :returns: :class:`dtoolcore.merkle.StoredMerkleTree` or None if the
+                  manifest has no stored directory digests
+        """
+        if "merkle_directories" not in manifest:
+            return None
+        return cls(
+            manifest["merkle_directories"],
+            (
+                (p["relpath"], p["hash"], p["size_in_bytes"])
+                for p in manifest["items"].values()
+            )
+        )
+
+    @property
+    def root(self):
+        """Return the digest of the root directory."""
+        return self.digest("")
+
+    def digest(self, path):
+        """Return the digest of a directory.
+
+        :param path: directory path, "" for the root directory
+        :raises: KeyError if there is no such directory
+        """
+        return self._digests[path]
+
+    def children(self, path):
+        """Return dictionary of (kind, digest) tuples keyed by child name.
+
+        :param path: directory path, "" for the root directory
+        :raises: KeyError if there is no such directory
+        """
+        if path not in self._digests:
+            raise KeyError(path)
+        children = {}
+        for name in self._subdirectories.get(path, []):
+            subdirectory = path + "/" + name if path else name
+            children[name] = (DIRECTORY, self._digests[subdirectory])
+        for name, item_hash, size_in_bytes in self._items.get(path, []):
+            children[name] = (
+                FILE,
+                _item_digest(name, item_hash, size_in_bytes)
+            )
+        return children
+
+
+def add_merkle_digests(manifest):
+    """Store the Merkle root and directory digests in a manifest.
+
+    :param manifest: manifest dictionary, updated in place
+    """
+    tree = MerkleTree.from_manifest(manifest)
+    manifest["merkle_root"] = tree.root
+    manifest["merkle_directories"] = tree.directory_digests()
+
+
+def merkle_root(manifest):
+    """Return the Merkle root of the items in a manifest.
+
+    :param manifest: manifest dictionary
+    :returns: SHA-256 hex digest
+    """
+    return MerkleTree.from_manifest(manifest).root
@@ -0,0 +1,136 @@
+"""Array backed columns of numeric overlay values.
+
+Numeric overlays loaded as dictionaries hold one Python object per item. An
+:class:`dtoolcore.overlaycolumn.OverlayColumn` instead stores the values in a
+typed :class:`array.array` in the order of the sorted item identifiers,
+which is the same for all overlays of a dataset. Columns can be persisted
+as binary blobs by the storage broker, see
+:meth:`dtoolcore.DataSet.get_overlay_column`.
+"""
+
+import array
+import bisect
+import numbers
+import sys
+
+import dtoolcore
+
+#: Array type codes used for boolean, integer and floating point values.
+BOOL_TYPECODE = "b"
+INT_TYPECODE = "q"
+FLOAT_TYPECODE = "d"
+
+
+def _typecode_for_values(values):
+    """Return the array type code able to hold all the values."""
+    typecode = None
+    for value in values:
+        if isinstance(value, bool):
+            value_typecode = BOOL_TYPECODE
+        elif isinstance(value, numbers.Integral):
+            value_typecode = INT_TYPECODE
+        elif isinstance(value, numbers.Real):
+            value_typecode = FLOAT_TYPECODE
+        else:
+            raise dtoolcore.DtoolCoreTypeError(
+                "Only numeric and boolean overlays can be stored as columns"
+            )
+        if typecode is None or typecode == value_typecode:
+            typecode = value_typecode
+        elif BOOL_TYPECODE in (typecode, value_typecode):
+            raise dtoolcore.DtoolCoreTypeError(
+                "Overlay mixes boolean and numeric values"
+            )
+        else:
+            typecode = FLOAT_TYPECODE
+    if typecode is None:
+        typecode = FLOAT_TYPECODE
+    return typecode
+
+
+class OverlayColumn(object):
+    """Overlay values stored in an array in sorted identifier order.
+
+    :param identifiers: sorted list of the dataset item identifiers
+    :param values: :class:`array.array` of the values in identifier order
+    """
+
+    def __init__(self, identifiers, values):
+        if len(identifiers) != len(values):
+            raise dtoolcore.DtoolCoreValueError(
+                "Number of values does not match number of identifiers"
+            )
+        self.identifiers = identifiers
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, identifier):
+        position = bisect.bisect_left(self.identifiers, identifier)
+        if position == len(self.identifiers) or \
+                self.identifiers[position] != identifier:
+            raise dtoolcore.DtoolCoreKeyError(identifier)
+        return self._to_python(self.values[position])
+
+    def __iter__(self):
+        return iter(self.identifiers)
+
+    def _to_python(self, value):
+        if self.values.typecode == BOOL_TYPECODE:
+            return bool(value)
+        return value
+
+    @property
+    def typecode(self):
+        """Return the array type code of the values."""
+        return self.values.typecode
+
+    def items(self):
+        """Yield (identifier, value) tuples."""
+        for identifier, value in zip(self.identifiers, self.values):
+            yield identifier, self._to_python(value)
+
+    def to_dict(self):
+        """Return the column as an overlay dictionary."""
+        return dict(self.items())
+
+    def to_bytes(self):
+        """Return the values as bytes in the native byte order."""
+        return self.values.tobytes()
+
+    @classmethod
+    def from_overlay(cls, overlay, identifiers):
+        """Return column built from an overlay dictionary.
+
+        :param overlay: dictionary of values keyed by identifier
+        :param identifiers: sorted list of the dataset item identifiers
+        :raises: DtoolCoreTypeError if the values are not all numbers or all
+                 booleans
+        :returns: :class:`dtoolcore.overlaycolumn.OverlayColumn`
+        """
+        ordered_values = [overlay[identifier] for identifier in identifiers]
+        typecode = _typecode_for_values(ordered_values)
+        try:
+            values = array.array(typecode, ordered_values)
+        except OverflowError:
+            raise dtoolcore.DtoolCoreTypeError(
+                "Overlay values too large to be stored as a column"
+            )
+        return cls(identifiers, values)
+
+    @classmethod
+    def from_bytes(cls, identifiers, typecode, data, byteorder=sys.byteorder):
+        """Return column from bytes created using :meth:`to_bytes`.
+
+        :param identifiers: sorted list of the dataset item identifiers
+        :param typecode: array type code of the values
+        :param data: bytes
+        :param byteorder: byte order of the data, "little" or "big"
+        :returns: :class:`dtoolcore.overlaycolumn.OverlayColumn`
+        """
+        values = array.array(typecode)
+        values.frombytes(data)
+        if byteorder != sys.byteorder:
+            values.byteswap()
+        return cls(identifiers, values)
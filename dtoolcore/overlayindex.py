@@ -0,0 +1,166 @@
+"""Indexes for selecting dataset items by overlay value.
+
+An :class:`dtoolcore.overlayindex.OverlayIndex` maps the values of an overlay
+to the identifiers of the items having them (an inverted index) and keeps the
+numeric values in sorted order (a sorted index). It is used by
+:meth:`dtoolcore.DataSet.select` to answer queries without scanning the
+overlay::
+
+    from dtoolcore.overlayindex import In, Range
+    dataset.select(is_read1=True, plate=In([3, 4]))
+    dataset.select(intensity=Range(0.5, 1.0))
+"""
+
+import bisect
+import json
+import numbers
+
+
+def _is_number(value):
+    return isinstance(value, numbers.Real) and not isinstance(value, bool)
+
+
+def _encode_value(value):
+    """Return key used for the value in the inverted index."""
+    # Numbers that compare equal, e.g. 3 and 3.0, share a key.
+    if _is_number(value) and float(value).is_integer():
+        value = int(value)
+    return json.dumps(value, sort_keys=True)
+
+
+class Condition(object):
+    """Base class for conditions on overlay values."""
+
+    def select(self, index):
+        """Return set of identifiers of the items meeting the condition.
+
+        :param index: :class:`dtoolcore.overlayindex.OverlayIndex`
+        :returns: set of identifiers
+        """
+        raise(NotImplementedError())
+
+
+class Eq(Condition):
+    """Condition selecting items whose overlay value equals value."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def __repr__(self):
+        return "<Eq {!r}>".format(self.value)
+
+    def select(self, index):
+        return index.eq(self.value)
+
+
+class In(Condition):
+    """Condition selecting items whose overlay value is one of values."""
+
+    def __init__(self, values):
+        self.values = list(values)
+
+    def __repr__(self):
+        return "<In {!r}>".format(self.values)
+
+    def select(self, index):
+        return index.isin(self.values)
+
+
+class Range(Condition):
+    """Condition selecting items with numeric overlay values in a range.
+
+    Both bounds are inclusive. A bound of None means that the range is open
+    on that side.
+    """
+
+    def __init__(self, minimum=None, maximum=None):
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def __repr__(self):
+        return "<Range {!r} {!r}>".format(self.minimum, self.maximum)
+
+    def select(self, index):
+        return index.range(self.minimum, self.maximum)
+
+
+def as_condition(value):
+    """Return value as a condition, treating plain values as equality."""
+    if isinstance(value, Condition):
+        return value
+    return Eq(value)
+
+
+class OverlayIndex(object):
+    """Inverted and sorted index of the values of an overlay.
+
+    :param values: dictionary mapping encoded values to lists of identifiers
+    :param sorted_values: numeric values in ascending order
+    :param sorted_identifiers: identifiers in the order of sorted_values
+    """
+
+    def __init__(self, values, sorted_values, sorted_identifiers):
+        self._values = values
+        self._sorted_values = sorted_values
+        self._sorted_identifiers = sorted_identifiers
+
+    @classmethod
+    def from_overlay(cls, overlay):
+        """Return index built from an overlay.
+
+        :param overlay: dictionary of overlay values keyed by identifier
+        :returns: :class:`dtoolcore.overlayindex.OverlayIndex`
+        """
+        values = {}
+        numeric = []
+        for identifier, value in overlay.items():
+            values.setdefault(_encode_value(value), []).append(identifier)
+            if _is_number(value):
+                numeric.append((value, identifier))
+        numeric.sort()
+        return cls(
+            values,
+            [value for value, _ in numeric],
+            [identifier for _, identifier in numeric]
+        )
+
+    @classmethod
+    def from_dict(cls, index_dict):
+        """Return index from a dictionary created using :meth:`to_dict`."""
+        return cls(
+            index_dict["values"],
+            index_dict["sorted_values"],
+            index_dict["sorted_identifiers"]
+        )
+
+    def to_dict(self):
+        """Return JSON serialisable dictionary representation of the index."""
+        return {
+            "values": self._values,
+            "sorted_values": self._sorted_values,
+            "sorted_identifiers": self._sorted_identifiers,
+        }
+
+    def eq(self, value):
+        """Return set of identifiers of the items with the value."""
+        return set(self._values.get(_encode_value(value), []))
+
+    def isin(self, values):
+        """Return set of identifiers of the items with one of the values."""
+        identifiers = set()
+        for value in values:
+            identifiers.update(self._values.get(_encode_value(value), []))
+        return identifiers
+
+    def range(self, minimum=None, maximum=None):
+        """Return set of identifiers of the items with values in the range.
+
+        Only numeric values are considered. Both bounds are inclusive.
+        """
+        start = 0
+        end = len(self._sorted_values)
+        if minimum is not None:
+            start = bisect.bisect_left(self._sorted_values, minimum)
+        if maximum is not None:
+            end = bisect.bisect_right(self._sorted_values, maximum)
+        return set(self._sorted_identifiers[start:end])
@@ -1,27 +1,47 @@
 """Disk storage broker."""
 
 import os
+import io
 import json
 import shutil
+import tempfile
 import logging
 import datetime
 import socket
+import sys
+import stat
+import threading
+import time
+import uuid
 
 from dtoolcore import __version__
 from dtoolcore.utils import (
     mkdir_parents,
     generate_identifier,
+    sha1_hexdigest,
     generous_parse_uri,
     timestamp,
     IS_WINDOWS,
     windows_to_unix_path,
     unix_to_windows_path,
     handle_to_osrelpath,
+    copy_file,
+    COPY_BUFSIZE,
+    get_num_threads,
+    threaded_imap_unordered,
+)
+from dtoolcore.jsoncodec import get_json_codec
+from dtoolcore.filehasher import (
+    FileHasher,
+    md5sum_hexdigest,
+    sha256sum_hexdigest,
 )
-from dtoolcore.filehasher import FileHasher, md5sum_hexdigest
 
 logger = logging.getLogger(__name__)
 
+# Storage brokers are pickled when generating manifests using multiprocessing,
+# so the lock serialising writes to item journals lives at module level.
+_ITEM_JOURNAL_LOCK = threading.Lock()
 
 _STRUCTURE_PARAMETERS = {
     "data_directory": ["data"],
@@ -59,6 +79,23 @@ Structural metadata describing the data items: .dtool/manifest.json
 Per item descriptive metadata: .dtool/overlays/
 Dataset key/value pairs metadata: .dtool/annotations/
 Dataset tags metadata: .dtool/tags/
+Indexes of overlay values: .dtool/overlay_indexes/
+Binary columns of numeric overlay values: .dtool/overlay_columns/
+"""
+
+
+_DEDUP_DTOOL_README_TXT = _DTOOL_README_TXT + """
+Item content
+------------
+
+The files in data/ are hardlinks to objects in the content addressed object
+pool ../.dtool_object_pool/ shared by all datasets in the same base URI.
+Objects are named after the SHA-256 hash of their content. Objects are
+read-only, as modifying one would modify the items of every dataset sharing
+it. The manifest lists the items as for any other dataset, so the dataset
+can be read without knowing about the pool. The pool and the datasets must
+stay on the same file system; copying or moving a dataset elsewhere copies
+the content of its items.
 """
 
 
@@ -73,6 +110,24 @@ class DiskStorageBrokerValidationWarning(Warning):
 class BaseStorageBroker(object):
     """Base storage broker class defining the required interface."""
 
+    # Codec used to encode and decode the JSON metadata, resolved from the
+    # DTOOL_JSON_CODEC setting on first use.
+    _json_codec = None
+
+    @property
+    def json_codec(self):
+        """Return the codec used to encode and decode the JSON metadata.
+
+        See :mod:`dtoolcore.jsoncodec`. The ``DTOOL_JSON_CODEC`` setting is
+        read from the configuration file the storage broker was created
+        with, if it keeps it as ``_config_path``.
+        """
+        if self._json_codec is None:
+            self._json_codec = get_json_codec(
+                config_path=getattr(self, "_config_path", None)
+            )
+        return self._json_codec
+
     # Class methods to override.
 
     @classmethod
@@ -80,6 +135,17 @@ class BaseStorageBroker(object):
         """Return list containing URIs in location given by base_uri."""
         raise(NotImplementedError())
 
+    @classmethod
+    def iter_dataset_uris(cls, base_uri, config_path):
+        """Yield URIs of the datasets in location given by base_uri.
+
+        The default implementation iterates over the list returned by
+        :meth:`list_dataset_uris`. Storage brokers can override it to yield
+        URIs as they are found.
+        """
+        for uri in cls.list_dataset_uris(base_uri, config_path):
+            yield uri
+
     @classmethod
     def generate_uri(cls, name, uuid, base_uri):
         """Return dataset URI."""
@@ -175,6 +241,25 @@ class BaseStorageBroker(object):
         """Return the hash."""
         raise(NotImplementedError())
 
+    def get_item_stat(self, identifier, relpath):
+        """Return size and modification time of an item of a frozen dataset.
+
+        Used for quick verification, so the item content must not be
+        fetched. The default implementation uses :meth:`get_size_in_bytes`
+        and :meth:`get_utc_timestamp` with the relpath as the handle.
+        Storage brokers that cannot look up frozen items by relpath should
+        override it.
+
+        :param identifier: item identifier
+        :param relpath: relpath of the item from the manifest
+        :raises: IOError/OSError if the item does not exist
+        :returns: tuple (size_in_bytes, utc_timestamp)
+        """
+        return (
+            self.get_size_in_bytes(relpath),
+            self.get_utc_timestamp(relpath)
+        )
+
     def has_admin_metadata(self):
         """Return True if the administrative metadata exists.
 
@@ -241,7 +326,7 @@ class BaseStorageBroker(object):
         """Return the admin metadata as a dictionary."""
         logger.debug("Getting admin metdata {}".format(self))
         text = self.get_text(self.get_admin_metadata_key())
-        return json.loads(text)
+        return self.json_codec.loads(text)
 
     def get_readme_content(self):
         """Return the README descriptive metadata as a string."""
@@ -252,14 +337,14 @@ class BaseStorageBroker(object):
         """Return the manifest as a dictionary."""
         logger.debug("Getting manifest {}".format(self))
         text = self.get_text(self.get_manifest_key())
-        return json.loads(text)
+        return self.json_codec.loads(text)
 
     def get_overlay(self, overlay_name):
         """Return overlay as a dictionary."""
         logger.debug("Getting overlay: {} {}".format(overlay_name, self))
         overlay_key = self.get_overlay_key(overlay_name)
         text = self.get_text(overlay_key)
-        return json.loads(text)
+        return self.json_codec.loads(text)
 
     def get_annotation(self, annotation_name):
         """Return value of the annotation associated with the key.
@@ -271,19 +356,19 @@ class BaseStorageBroker(object):
         logger.debug("Getting annotation: {} {}".format(annotation_name, self))
         annotation_key = self.get_annotation_key(annotation_name)
         text = self.get_text(annotation_key)
-        return json.loads(text)
+        return self.json_codec.loads(text)
 
     def put_admin_metadata(self, admin_metadata):
         """Store the admin metadata."""
         logger.debug("Putting admin metdata {}".format(self))
-        text = json.dumps(admin_metadata)
+        text = self.json_codec.dumps(admin_metadata)
         key = self.get_admin_metadata_key()
         self.put_text(key, text)
 
     def put_manifest(self, manifest):
         """Store the manifest."""
         logger.debug("Putting manifest {}".format(self))
-        text = json.dumps(manifest, indent=2, sort_keys=True)
+        text = self.json_codec.dumps(manifest, indent=2, sort_keys=True)
         key = self.get_manifest_key()
         self.put_text(key, text)
 
@@ -312,7 +397,7 @@ class BaseStorageBroker(object):
         """Store the overlay."""
         logger.debug("Putting overlay: {} {}".format(overlay_name, self))
         key = self.get_overlay_key(overlay_name)
-        text = json.dumps(overlay, indent=2)
+        text = self.json_codec.dumps(overlay, indent=2)
         self.put_text(key, text)
 
     def put_annotation(self, annotation_name, annotation):
@@ -323,7 +408,7 @@ class BaseStorageBroker(object):
         """
         logger.debug("Putting annotation: {} {}".format(annotation_name, self))
         key = self.get_annotation_key(annotation_name)
-        text = json.dumps(annotation, indent=2)
+        text = self.json_codec.dumps(annotation, indent=2)
         self.put_text(key, text)
 
     def put_tag(self, tag):
@@ -353,6 +438,286 @@ class BaseStorageBroker(object):
         key = self.get_annotation_key(annotation_name)
         self.delete_key(key)
 
+    def get_annotations(self, names=None):
+        """Return dictionary of annotations keyed by name.
+
+        The annotation names are listed once. Names of annotations that do
+        not exist are ignored.
+
+        :param names: iterable of annotation names, defaults to all the
+                      annotations of the dataset
+        :returns: dictionary of annotations
+        """
+        logger.debug("Getting annotations {}".format(self))
+        existing_names = self.list_annotation_names()
+        if names is not None:
+            existing_names = set(existing_names)
+            names = [name for name in names if name in existing_names]
+        else:
+            names = existing_names
+        return dict((name, self.get_annotation(name)) for name in names)
+
+    def put_annotations(self, annotations):
+        """Set/update the values of several annotations.
+
+        :param annotations: dictionary of annotations keyed by name
+        """
+        logger.debug("Putting annotations {}".format(self))
+        for annotation_name, annotation in annotations.items():
+            self.put_annotation(annotation_name, annotation)
+
+    def put_tags(self, tags):
+        """Annotate the dataset with several tags.
+
+        :param tags: iterable of tags
+        """
+        logger.debug("Putting tags {}".format(self))
+        for tag in tags:
+            self.put_tag(tag)
+
+    def delete_tags(self, tags):
+        """Delete several tags from a dataset.
+
+        :param tags: iterable of tags
+        """
+        logger.debug("Deleting tags {}".format(self))
+        for tag in tags:
+            self.delete_tag(tag)
+
+    def delete_annotations(self, annotation_names):
+        """Delete several annotations from a dataset.
+
+        :param annotation_names: iterable of annotation names
+        """
+        logger.debug("Deleting annotations {}".format(self))
+        for annotation_name in annotation_names:
+            self.delete_annotation(annotation_name)
+
+    def put_overlays(self, overlays):
+        """Store several overlays.
+
+        :param overlays: dictionary of overlays keyed by name
+        """
+        logger.debug("Putting overlays {}".format(self))
+        for overlay_name, overlay in overlays.items():
+            self.put_overlay(overlay_name, overlay)
+
+    def link_item(self, fpath, relpath):
+        """Put item at relpath in dataset sharing storage with fpath.
+
+        Storage brokers that cannot share storage between the file at fpath
+        and the dataset item copy the content using :meth:`put_item`.
+
+        :param fpath: path to the item on disk
+        :param relpath: relative path name given to the item in the dataset as
+                        a handle
+        :returns: the handle given to the item
+        """
+        return self.put_item(fpath, relpath)
+
+    def is_linked(self, handle):
+        """Return True if the item shares storage with its source file.
+
+        Only items stored by :meth:`link_item` through this storage broker
+        instance are reported. Storage brokers that never share storage
+        return False.
+
+        :param handle: handle of the item
+        """
+        return False
+
+    def put_items(self, items, link=False, callback=None, num_threads=None,
+                  progress_callback=None):
+        """Put items with content from fpaths at relpaths in dataset.
+
+        The default implementation stores the items one at a time using
+        :meth:`put_item`, or :meth:`link_item` if link is True, and reports
+        the progress once per item. Storage brokers can override it to batch
+        or parallelise the work and to report the progress while the content
+        is being copied.
+
+        :param items: iterable of (fpath, relpath) tuples
+        :param link: use :meth:`link_item` rather than :meth:`put_item`
+        :param callback: function called with the relpath and handle of each
+                         item once it has been stored
+        :param num_threads: number of threads, ignored by the default
+                            implementation
+        :param progress_callback: function called with the number of bytes
+                                  stored
+        :returns: list of the handles given to the items
+        """
+        handles = []
+        for fpath, relpath in items:
+            if link:
+                handle = self.link_item(fpath, relpath)
+            else:
+                handle = self.put_item(fpath, relpath)
+            if progress_callback:
+                progress_callback(os.path.getsize(fpath))
+            if callback:
+                callback(relpath, handle)
+            handles.append(handle)
+        return handles
+
+    def put_item_from_stream(self, stream, relpath):
+        """Put item with content read from stream at relpath in dataset.
+
+        The default implementation writes the content to a temporary file
+        and uses :meth:`put_item`. Storage brokers can override it to write
+        the content directly into the dataset.
+
+        :param stream: binary file-like object or bytes
+        :param relpath: relative path name given to the item in the dataset as
+                        a handle
+        :returns: the handle given to the item
+        """
+        stream = _as_binary_stream(stream)
+        fd, tmp_fpath = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                shutil.copyfileobj(stream, fh, COPY_BUFSIZE)
+            return self.put_item(tmp_fpath, relpath)
+        finally:
+            os.unlink(tmp_fpath)
+
+    def get_metadata_fingerprint(self):
+        """Return string that changes when the dataset metadata changes.
+
+        The fingerprint covers the administrative metadata, the README, the
+        manifest, the annotations, the tags and the overlays. It is used to
+        avoid reading unchanged metadata, e.g. by
+        :class:`dtoolcore.catalog.Catalog`. The default implementation
+        returns None, meaning that the metadata always needs to be read.
+
+        :returns: fingerprint string or None
+        """
+        return None
+
+    def get_overlay_index(self, overlay_name):
+        """Return the persisted index of an overlay.
+
+        The default implementation does not persist overlay indexes and
+        returns None.
+
+        :param overlay_name: name of the overlay
+        :returns: dictionary created using
+                  :meth:`dtoolcore.overlayindex.OverlayIndex.to_dict` or None
+                  if there is no up to date index
+        """
+        return None
+
+    def put_overlay_index(self, overlay_name, index):
+        """Persist the index of an overlay.
+
+        Storage brokers that do not persist overlay indexes ignore the call.
+
+        :param overlay_name: name of the overlay
+        :param index: dictionary created using
+                      :meth:`dtoolcore.overlayindex.OverlayIndex.to_dict`
+        """
+        pass
+
+    def get_overlay_column(self, overlay_name):
+        """Return the persisted column encoding of an overlay.
+
+        The default implementation does not persist overlay columns and
+        returns None.
+
+        :param overlay_name: name of the overlay
+        :returns: dictionary with the keys "typecode", "byteorder" and "data"
+                  or None if there is no up to date column
+        """
+        return None
+
+    def put_overlay_column(self, overlay_name, typecode, data):
+        """Persist the column encoding of an overlay.
+
+        Storage brokers that do not persist overlay columns ignore the call.
+
+        :param overlay_name: name of the overlay
+        :param typecode: :mod:`array` type code of the values
+        :param data: values as bytes in the native byte order
+        """
+        pass
+
+    def get_consolidated_metadata(self):
+        """Return the consolidated metadata of a frozen dataset.
+
+        The consolidated metadata is a snapshot of the administrative
+        metadata, README, annotations, tags, overlay names and summary
+        statistics of a frozen dataset, which can be read at once. The
+        default implementation returns None, meaning that the snapshot is not
+        available.
+
+        :returns: dictionary or None if there is no up to date snapshot
+        """
+        return None
+
+    def update_consolidated_metadata(self, create=True):
+        """Regenerate the consolidated metadata of a frozen dataset.
+
+        Storage brokers that do not support consolidated metadata ignore the
+        call.
+
+        :param create: create the snapshot if the dataset does not have one
+        :returns: the consolidated metadata dictionary or None
+        """
+        return None
+
+    def delete_consolidated_metadata(self):
+        """Delete the consolidated metadata of a frozen dataset.
+
+        Called when the metadata is updated without regenerating the
+        snapshot. Storage brokers that do not support consolidated metadata
+        ignore the call.
+        """
+        pass
+
+    def get_item_journal(self):
+        """Return the item journal of a proto dataset.
+
+        The item journal records the properties of items whose content is
+        known to be complete and verified, for example items that have been
+        copied from another dataset. It is used to skip items when resuming
+        a copy and to avoid recalculating hashes when freezing.
+
+        :returns: dictionary of item properties keyed by identifier, or None
+                  if the storage broker does not keep an item journal
+        """
+        return None
+
+    def get_item_journal_entry(self, identifier):
+        """Return the item journal entry of an item.
+
+        :param identifier: item identifier
+        :returns: dictionary of item properties, or None if the item is not
+                  in the item journal or there is no item journal
+        """
+        journal = self.get_item_journal()
+        if journal is None:
+            return None
+        return journal.get(identifier)
+
+    def add_item_journal_entry(self, identifier, properties):
+        """Record the properties of a complete and verified item.
+
+        Storage brokers that do not keep an item journal ignore the entry.
+
+        :param identifier: item identifier
+        :param properties: item properties as returned by
+                           :meth:`item_properties`
+        """
+        pass
+
+    def remove_item_journal_entry(self, identifier):
+        """Remove the item journal entry of an item that is written again.
+
+        Storage brokers that do not keep an item journal ignore the call.
+
+        :param identifier: item identifier
+        """
+        pass
+
     def get_relpath(self, handle):
         """Return the relative path."""
         return handle
@@ -386,6 +751,54 @@ class BaseStorageBroker(object):
         self._document_structure()
 
 
+def _fsync_directory(dirpath):
+    """Flush the entries of a directory to disk where the platform allows."""
+    try:
+        fd = os.open(dirpath, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        logger.debug("Unable to fsync {}".format(dirpath))
+    finally:
+        os.close(fd)
+
+
+def _stat_fingerprint(fpath):
+    """Return string made from the modification time and size of fpath."""
+    try:
+        stat = os.stat(fpath)
+    except OSError:
+        return "-"
+    return "{}:{}".format(stat.st_mtime_ns, stat.st_size)
+
+
+def _as_binary_stream(stream):
+    """Return binary file-like object from bytes or file-like object."""
+    if isinstance(stream, (bytes, bytearray, memoryview)):
+        return io.BytesIO(stream)
+    return stream
+
+
+def _write_stream(stream, fpath, hasher=None):
+    """Write content of stream to fpath updating the optional hashlib hasher.
+
+    :returns: number of bytes written
+    """
+    size = 0
+    with open(fpath, "wb") as fh:
+        while True:
+            buf = stream.read(COPY_BUFSIZE)
+            if not buf:
+                break
+            fh.write(buf)
+            if hasher is not None:
+                hasher.update(buf)
+            size += len(buf)
+    return size
+
+
 def _get_abspath_from_uri(uri):
     """Return abspath.
     """
@@ -427,6 +840,8 @@ class DiskStorageBroker(BaseStorageBroker):
 
         logger.debug("Initialising {}...".format(self))
 
+        self._config_path = config_path
+
         # Get the abspath to the dataset.
         self._abspath = _get_abspath_from_uri(uri)
 
@@ -442,6 +857,14 @@ class DiskStorageBroker(BaseStorageBroker):
         self._metadata_fragments_abspath = self._generate_abspath(
             "metadata_fragments_directory"
         )
+        self._item_journal_abspath = os.path.join(
+            self._metadata_fragments_abspath,
+            "item_journal.jsonl"
+        )
+        self._consolidated_metadata_abspath = os.path.join(
+            self._generate_abspath("dtool_directory"),
+            "consolidated.json"
+        )
 
         # Define some essential directories to be created.
         self._essential_subdirectories = [
@@ -452,6 +875,15 @@ class DiskStorageBroker(BaseStorageBroker):
             self._tags_abspath,
         ]
 
+        # Manifest cache used to look up item relpaths.
+        self._manifest_cache = None
+
+        # Handles of the items hardlinked by link_item.
+        self._linked_handles = set()
+
+        # Item journal entries read or written by this instance.
+        self._item_journal_cache = None
+
     # Generic helper functions.
 
     def _generate_abspath(self, key):
@@ -469,33 +901,50 @@ class DiskStorageBroker(BaseStorageBroker):
     @classmethod
     def list_dataset_uris(cls, base_uri, config_path):
         """Return list containing URIs in location given by base_uri."""
+        return list(cls.iter_dataset_uris(base_uri, config_path))
+
+    @classmethod
+    def iter_dataset_uris(cls, base_uri, config_path):
+        """Yield URIs of the datasets in location given by base_uri.
 
+        The base directory is scanned once and the administrative metadata
+        files of the subdirectories are checked concurrently, using the number
+        of threads given by :func:`dtoolcore.utils.get_num_threads`. The URIs
+        are yielded in the order in which the checks complete.
+        """
         parsed_uri = generous_parse_uri(base_uri)
-        uri_list = []
 
         path = parsed_uri.path
         if IS_WINDOWS:
             path = unix_to_windows_path(parsed_uri.path)
 
-        for d in os.listdir(path):
-            dir_path = os.path.join(path, d)
-
-            if not os.path.isdir(dir_path):
-                continue
-
-            storage_broker = cls(dir_path, config_path)
+        admin_metadata_relpath = os.path.join(
+            *cls._structure_parameters["admin_metadata_relpath"]
+        )
 
-            if not storage_broker.has_admin_metadata():
+        def iter_dir_names():
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir():
+                            yield entry.name
+                    except OSError:
+                        continue
+
+        def dataset_name(name):
+            admin_fpath = os.path.join(path, name, admin_metadata_relpath)
+            if os.path.isfile(admin_fpath):
+                return name
+            return None
+
+        num_threads = get_num_threads(config_path=config_path)
+        for name in threaded_imap_unordered(
+                dataset_name,
+                iter_dir_names(),
+                num_threads):
+            if name is None:
                 continue
-
-            uri = storage_broker.generate_uri(
-                name=d,
-                uuid=None,
-                base_uri=base_uri
-            )
-            uri_list.append(uri)
-
-        return uri_list
+            yield cls.generate_uri(name=name, uuid=None, base_uri=base_uri)
 
     @classmethod
     def generate_uri(cls, name, uuid, base_uri):
@@ -591,7 +1040,21 @@ class DiskStorageBroker(BaseStorageBroker):
     def get_hash(self, handle):
         """Return the hash."""
         fpath = self._fpath_from_handle(handle)
-        return DiskStorageBroker.hasher(fpath)
+        return self.hasher(fpath)
+
+    def get_item_stat(self, identifier, relpath):
+        """Return size and modification time of an item of a frozen dataset.
+
+        :param identifier: item identifier
+        :param relpath: relpath of the item from the manifest
+        :raises: OSError if the item does not exist
+        :returns: tuple (size_in_bytes, utc_timestamp)
+        """
+        fpath = self._fpath_from_handle(
+            handle_to_osrelpath(relpath, IS_WINDOWS)
+        )
+        stat = os.stat(fpath)
+        return stat.st_size, stat.st_mtime
 
     def has_admin_metadata(self):
         """Return True if the administrative metadata exists.
@@ -629,14 +1092,24 @@ class DiskStorageBroker(BaseStorageBroker):
             tags.append(fname)
         return tags
 
+    def put_manifest(self, manifest):
+        """Store the manifest."""
+        # Drop the cached manifest before it is replaced.
+        self._manifest_cache = None
+        super(DiskStorageBroker, self).put_manifest(manifest)
+
     def get_item_abspath(self, identifier):
         """Return absolute path at which item content can be accessed.
 
         :param identifier: item identifier
         :returns: absolute path from which the item content can be accessed
         """
-        manifest = self.get_manifest()
-        item = manifest["items"][identifier]
+        # The manifest of a frozen dataset does not change, so it is only
+        # parsed once rather than for every item. It is dropped when this
+        # storage broker writes a manifest.
+        if self._manifest_cache is None:
+            self._manifest_cache = self.get_manifest()
+        item = self._manifest_cache["items"][identifier]
         relpath = handle_to_osrelpath(item["relpath"], IS_WINDOWS)
         item_abspath = os.path.join(self._data_abspath, relpath)
         return item_abspath
@@ -663,7 +1136,7 @@ class DiskStorageBroker(BaseStorageBroker):
             if not os.path.isdir(abspath):
                 os.mkdir(abspath)
 
-    def put_item(self, fpath, relpath):
+    def put_item(self, fpath, relpath, progress_callback=None):
         """Put item with content from fpath at relpath in dataset.
 
         Missing directories in relpath are created on the fly.
@@ -671,6 +1144,8 @@ class DiskStorageBroker(BaseStorageBroker):
         :param fpath: path to the item on disk
         :param relpath: relative path name given to the item in the dataset as
                         a handle, i.e. a Unix-like relpath
+        :param progress_callback: function called with the number of bytes
+                                  copied after each chunk
         :returns: the handle given to the item
         """
 
@@ -681,10 +1156,618 @@ class DiskStorageBroker(BaseStorageBroker):
         mkdir_parents(dirname)
 
         # Copy the file across.
-        shutil.copyfile(fpath, dest_path)
+        self._invalidate_item_journal_entry(relpath)
+        self._linked_handles.discard(relpath)
+        copy_file(
+            fpath,
+            dest_path,
+            progress_callback=progress_callback
+        )
+
+        return relpath
+
+    def link_item(self, fpath, relpath):
+        """Put item with content from fpath at relpath in dataset as hardlink.
+
+        The item is hardlinked if fpath is on the same file system as the
+        dataset, otherwise its content is copied. Missing directories in
+        relpath are created on the fly.
+
+        :param fpath: path to the item on disk
+        :param relpath: relative path name given to the item in the dataset as
+                        a handle, i.e. a Unix-like relpath
+        :returns: the handle given to the item
+        """
+        osrelpath = handle_to_osrelpath(relpath, IS_WINDOWS)
+        dest_path = os.path.join(self._data_abspath, osrelpath)
+        mkdir_parents(os.path.dirname(dest_path))
+
+        self._invalidate_item_journal_entry(relpath)
+        self._link_or_copy(fpath, dest_path, relpath)
 
         return relpath
 
+    def is_linked(self, handle):
+        """Return True if the item was hardlinked by :meth:`link_item`.
+
+        :param handle: handle of the item
+        """
+        return handle in self._linked_handles
+
+    def _link_or_copy(self, fpath, dest_path, relpath,
+                      progress_callback=None):
+        """Hardlink fpath to dest_path if on the same device, else copy."""
+        dirname = os.path.dirname(dest_path)
+        src_stat = os.stat(fpath)
+        if src_stat.st_dev == os.stat(dirname).st_dev:
+            # Mirror put_item, which overwrites existing items.
+            if os.path.lexists(dest_path):
+                os.unlink(dest_path)
+            try:
+                os.link(fpath, dest_path)
+                self._linked_handles.add(relpath)
+                if progress_callback:
+                    progress_callback(src_stat.st_size)
+                return
+            except OSError as exc:
+                # E.g. the file system does not support hardlinks or the
+                # link count limit has been reached.
+                logger.debug("Failed to link {}: {}".format(fpath, exc))
+
+        self._linked_handles.discard(relpath)
+        copy_file(fpath, dest_path, progress_callback=progress_callback)
+
+    def put_items(self, items, link=False, callback=None, num_threads=None,
+                  progress_callback=None):
+        """Put items with content from fpaths at relpaths in dataset.
+
+        Items are copied, or linked, concurrently. Each missing directory is
+        only created once and the items iterable is consumed lazily, so it can
+        be fed by a pipeline.
+
+        :param items: iterable of (fpath, relpath) tuples
+        :param link: use :meth:`link_item` rather than :meth:`put_item`
+        :param callback: function called with the relpath and handle of each
+                         item once it has been stored, from the thread that
+                         stored the item
+        :param num_threads: number of threads, see
+                            :func:`dtoolcore.utils.get_num_threads`
+        :param progress_callback: function called with the number of bytes
+                                  stored after each chunk, from the thread
+                                  that stored the item
+        :returns: list of the handles given to the items
+        """
+        created_directories = set()
+
+        def put(indexed_item):
+            index, (fpath, relpath) = indexed_item
+            osrelpath = handle_to_osrelpath(relpath, IS_WINDOWS)
+            dest_path = os.path.join(self._data_abspath, osrelpath)
+            dirname = os.path.dirname(dest_path)
+            if dirname not in created_directories:
+                mkdir_parents(dirname)
+                created_directories.add(dirname)
+
+            self._invalidate_item_journal_entry(relpath)
+            if link:
+                self._link_or_copy(
+                    fpath,
+                    dest_path,
+                    relpath,
+                    progress_callback
+                )
+            else:
+                self._linked_handles.discard(relpath)
+                copy_file(
+                    fpath,
+                    dest_path,
+                    progress_callback=progress_callback
+                )
+
+            if callback:
+                callback(relpath, relpath)
+            return index, relpath
+
+        num_threads = get_num_threads(num_threads)
+        results = threaded_imap_unordered(put, enumerate(items), num_threads)
+        return [handle for _, handle in sorted(results)]
+
+    def put_item_from_stream(self, stream, relpath):
+        """Put item with content read from stream at relpath in dataset.
+
+        The content is written directly into the data directory. The hash is
+        calculated while writing and recorded in the item journal, so that it
+        does not need to be recalculated when the dataset is frozen.
+
+        :param stream: binary file-like object or bytes
+        :param relpath: relative path name given to the item in the dataset as
+                        a handle, i.e. a Unix-like relpath
+        :returns: the handle given to the item
+        """
+        osrelpath = handle_to_osrelpath(relpath, IS_WINDOWS)
+        dest_path = os.path.join(self._data_abspath, osrelpath)
+        mkdir_parents(os.path.dirname(dest_path))
+
+        hasher = self.hasher.hashlib_hasher()
+        self._invalidate_item_journal_entry(relpath)
+        _write_stream(_as_binary_stream(stream), dest_path, hasher)
+
+        if hasher is not None:
+            properties = {
+                "relpath": relpath,
+                "size_in_bytes": self.get_size_in_bytes(relpath),
+                "utc_timestamp": self.get_utc_timestamp(relpath),
+                "hash": hasher.hexdigest(),
+            }
+            self.add_item_journal_entry(
+                generate_identifier(relpath),
+                properties
+            )
+
+        return relpath
+
+    def get_annotations(self, names=None):
+        """Return dictionary of annotations keyed by name.
+
+        The annotations directory is listed once and the annotations are read
+        concurrently. Names of annotations that do not exist are ignored.
+
+        :param names: iterable of annotation names, defaults to all the
+                      annotations of the dataset
+        :returns: dictionary of annotations
+        """
+        existing_names = self.list_annotation_names()
+        if names is not None:
+            existing_names = set(existing_names)
+            names = [name for name in names if name in existing_names]
+        else:
+            names = existing_names
+
+        def read(annotation_name):
+            return annotation_name, self.get_annotation(annotation_name)
+
+        return dict(threaded_imap_unordered(read, names, get_num_threads()))
+
+    def _put_texts(self, texts):
+        """Write several texts concurrently.
+
+        The parent directories are created once up front rather than for
+        each text.
+
+        :param texts: list of (key, text) tuples
+        """
+        for parent_directory in set(os.path.dirname(k) for k, _ in texts):
+            mkdir_parents(parent_directory)
+
+        def write(item):
+            key, text = item
+            with open(key, "w") as fh:
+                fh.write(text)
+
+        for _ in threaded_imap_unordered(write, texts, get_num_threads()):
+            pass
+
+    def _delete_keys(self, keys):
+        """Delete several files concurrently."""
+        for _ in threaded_imap_unordered(
+                self.delete_key,
+                keys,
+                get_num_threads()):
+            pass
+
+    def put_annotations(self, annotations):
+        """Set/update the values of several annotations concurrently.
+
+        :param annotations: dictionary of annotations keyed by name
+        """
+        logger.debug("Putting annotations {}".format(self))
+        self._put_texts([
+            (
+                self.get_annotation_key(annotation_name),
+                self.json_codec.dumps(annotation, indent=2)
+            )
+            for annotation_name, annotation in annotations.items()
+        ])
+
+    def delete_annotations(self, annotation_names):
+        """Delete several annotations from a dataset concurrently.
+
+        :param annotation_names: iterable of annotation names
+        """
+        logger.debug("Deleting annotations {}".format(self))
+        self._delete_keys([
+            self.get_annotation_key(annotation_name)
+            for annotation_name in annotation_names
+        ])
+
+    def put_tags(self, tags):
+        """Annotate the dataset with several tags concurrently.
+
+        :param tags: iterable of tags
+        """
+        logger.debug("Putting tags {}".format(self))
+        self._put_texts([(self.get_tag_key(tag), "") for tag in tags])
+
+    def delete_tags(self, tags):
+        """Delete several tags from a dataset concurrently.
+
+        :param tags: iterable of tags
+        """
+        logger.debug("Deleting tags {}".format(self))
+        self._delete_keys([self.get_tag_key(tag) for tag in tags])
+
+    def put_overlays(self, overlays):
+        """Store several overlays concurrently.
+
+        :param overlays: dictionary of overlays keyed by name
+        """
+        logger.debug("Putting overlays {}".format(self))
+        self._put_texts([
+            (
+                self.get_overlay_key(overlay_name),
+                self.json_codec.dumps(overlay, indent=2)
+            )
+            for overlay_name, overlay in overlays.items()
+        ])
+
+    def get_metadata_fingerprint(self):
+        """Return string that changes when the dataset metadata changes.
+
+        The fingerprint is calculated from the modification times and sizes
+        of the administrative metadata, README and manifest files and of the
+        files in the annotations, tags and overlays directories, so no
+        metadata is read.
+
+        :returns: fingerprint string
+        """
+        parts = [
+            _stat_fingerprint(fpath) for fpath in (
+                self.get_admin_metadata_key(),
+                self.get_readme_key(),
+                self.get_manifest_key(),
+            )
+        ]
+        for dir_path in (
+                self._annotations_abspath,
+                self._tags_abspath,
+                self._overlays_abspath):
+            try:
+                with os.scandir(dir_path) as entries:
+                    entry_parts = []
+                    for entry in entries:
+                        stat = entry.stat()
+                        entry_parts.append("{}:{}:{}".format(
+                            entry.name,
+                            stat.st_mtime_ns,
+                            stat.st_size
+                        ))
+            except OSError:
+                parts.append("-")
+                continue
+            parts.extend(sorted(entry_parts))
+            parts.append("/")
+        return sha1_hexdigest("\n".join(parts))
+
+    def _overlay_index_abspath(self, overlay_name):
+        return os.path.join(
+            self._generate_abspath("dtool_directory"),
+            "overlay_indexes",
+            overlay_name + ".json"
+        )
+
+    def get_overlay_index(self, overlay_name):
+        """Return the persisted index of an overlay.
+
+        The index is stored in ``.dtool/overlay_indexes/`` and is only
+        returned if the overlay has not been modified since it was built.
+
+        :param overlay_name: name of the overlay
+        :returns: index dictionary or None if there is no up to date index
+        """
+        try:
+            text = self.get_text(self._overlay_index_abspath(overlay_name))
+            persisted = self.json_codec.loads(text)
+        except (IOError, OSError, ValueError):
+            return None
+        overlay_fingerprint = _stat_fingerprint(
+            self.get_overlay_key(overlay_name)
+        )
+        if persisted.get("overlay_fingerprint") != overlay_fingerprint:
+            return None
+        return persisted["index"]
+
+    def put_overlay_index(self, overlay_name, index):
+        """Persist the index of an overlay in ``.dtool/overlay_indexes/``.
+
+        Failures to write, e.g. for read only datasets, are logged and
+        otherwise ignored, since the index can be rebuilt from the overlay.
+
+        :param overlay_name: name of the overlay
+        :param index: index dictionary
+        """
+        persisted = {
+            "overlay_fingerprint": _stat_fingerprint(
+                self.get_overlay_key(overlay_name)
+            ),
+            "index": index,
+        }
+        fpath = self._overlay_index_abspath(overlay_name)
+        tmp_fpath = "{}.tmp-{}".format(fpath, uuid.uuid4())
+        try:
+            self.put_text(tmp_fpath, self.json_codec.dumps(persisted))
+            os.replace(tmp_fpath, fpath)
+        except (IOError, OSError) as e:
+            logger.warning("Could not persist overlay index {}: {}".format(
+                overlay_name,
+                e
+            ))
+
+    def _overlay_column_abspaths(self, overlay_name):
+        dir_path = os.path.join(
+            self._generate_abspath("dtool_directory"),
+            "overlay_columns"
+        )
+        return (
+            os.path.join(dir_path, overlay_name + ".json"),
+            os.path.join(dir_path, overlay_name + ".bin"),
+        )
+
+    def get_overlay_column(self, overlay_name):
+        """Return the persisted column encoding of an overlay.
+
+        Columns are stored in ``.dtool/overlay_columns/`` as a JSON header
+        and a binary file with the values. They are only returned if the
+        overlay has not been modified since the column was written.
+
+        :param overlay_name: name of the overlay
+        :returns: dictionary with the keys "typecode", "byteorder" and "data"
+                  or None if there is no up to date column
+        """
+        header_fpath, data_fpath = self._overlay_column_abspaths(overlay_name)
+        try:
+            header = self.json_codec.loads(self.get_text(header_fpath))
+            with open(data_fpath, "rb") as fh:
+                data = fh.read()
+        except (IOError, OSError, ValueError):
+            return None
+        overlay_fingerprint = _stat_fingerprint(
+            self.get_overlay_key(overlay_name)
+        )
+        if header.get("overlay_fingerprint") != overlay_fingerprint:
+            return None
+        if header.get("size_in_bytes") != len(data):
+            return None
+        return {
+            "typecode": header["typecode"],
+            "byteorder": header["byteorder"],
+            "data": data,
+        }
+
+    def put_overlay_column(self, overlay_name, typecode, data):
+        """Persist the column encoding of an overlay.
+
+        Failures to write, e.g. for read only datasets, are logged and
+        otherwise ignored, since the column can be rebuilt from the overlay.
+
+        :param overlay_name: name of the overlay
+        :param typecode: :mod:`array` type code of the values
+        :param data: values as bytes in the native byte order
+        """
+        header_fpath, data_fpath = self._overlay_column_abspaths(overlay_name)
+        header = {
+            "overlay_fingerprint": _stat_fingerprint(
+                self.get_overlay_key(overlay_name)
+            ),
+            "typecode": typecode,
+            "byteorder": sys.byteorder,
+            "size_in_bytes": len(data),
+        }
+        try:
+            mkdir_parents(os.path.dirname(data_fpath))
+            tmp_fpath = "{}.tmp-{}".format(data_fpath, uuid.uuid4())
+            with open(tmp_fpath, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp_fpath, data_fpath)
+            tmp_fpath = "{}.tmp-{}".format(header_fpath, uuid.uuid4())
+            self.put_text(tmp_fpath, self.json_codec.dumps(header))
+            os.replace(tmp_fpath, header_fpath)
+        except (IOError, OSError) as e:
+            logger.warning("Could not persist overlay column {}: {}".format(
+                overlay_name,
+                e
+            ))
+
+    def get_consolidated_metadata(self):
+        """Return the consolidated metadata of a frozen dataset.
+
+        The snapshot in ``.dtool/consolidated.json`` is only returned if its
+        fingerprint matches :meth:`get_metadata_fingerprint`.
+
+        :returns: dictionary or None if there is no up to date snapshot
+        """
+        try:
+            text = self.get_text(self._consolidated_metadata_abspath)
+            consolidated = self.json_codec.loads(text)
+        except (IOError, OSError, ValueError):
+            return None
+        if consolidated.get("fingerprint") != self.get_metadata_fingerprint():
+            return None
+        return consolidated
+
+    def update_consolidated_metadata(self, create=True):
+        """Regenerate the consolidated metadata of a frozen dataset.
+
+        The snapshot is written to ``.dtool/consolidated.json``. The summary
+        statistics of the previous snapshot are reused if the manifest is
+        unchanged.
+
+        :param create: create the snapshot if the dataset does not have one
+        :returns: the consolidated metadata dictionary or None if the dataset
+                  is not frozen or has no snapshot and create is False
+        """
+        try:
+            previous = self.json_codec.loads(
+                self.get_text(self._consolidated_metadata_abspath)
+            )
+        except (IOError, OSError):
+            if not create:
+                return None
+            previous = {}
+        except ValueError:
+            previous = {}
+
+        # Calculate the fingerprint before reading the metadata, so that
+        # changes made while reading make the snapshot stale.
+        fingerprint = self.get_metadata_fingerprint()
+        admin_metadata = self.get_admin_metadata()
+        if admin_metadata.get("type") != "dataset":
+            return None
+
+        manifest_fingerprint = _stat_fingerprint(self.get_manifest_key())
+        if previous.get("manifest_fingerprint") == manifest_fingerprint:
+            number_of_items = previous["number_of_items"]
+            size_in_bytes = previous["size_in_bytes"]
+        else:
+            items = self.get_manifest()["items"]
+            number_of_items = len(items)
+            size_in_bytes = sum(p["size_in_bytes"] for p in items.values())
+
+        try:
+            readme = self.get_readme_content()
+        except (IOError, OSError):
+            readme = None
+
+        consolidated = {
+            "fingerprint": fingerprint,
+            "manifest_fingerprint": manifest_fingerprint,
+            "admin_metadata": admin_metadata,
+            "readme": readme,
+            "annotations": self.get_annotations(),
+            "tags": self.list_tags(),
+            "overlay_names": self.list_overlay_names(),
+            "number_of_items": number_of_items,
+            "size_in_bytes": size_in_bytes,
+        }
+
+        # Replace the file atomically so that readers never see a partially
+        # written snapshot.
+        tmp_abspath = "{}.tmp-{}".format(
+            self._consolidated_metadata_abspath,
+            uuid.uuid4()
+        )
+        self.put_text(tmp_abspath, self.json_codec.dumps(consolidated))
+        os.replace(tmp_abspath, self._consolidated_metadata_abspath)
+        return consolidated
+
+    def delete_consolidated_metadata(self):
+        """Delete ``.dtool/consolidated.json`` if it exists."""
+        try:
+            os.remove(self._consolidated_metadata_abspath)
+        except FileNotFoundError:
+            pass
+
+    def get_item_journal(self):
+        """Return the item journal of a proto dataset.
+
+        :returns: dictionary of item properties keyed by identifier
+        """
+        journal = {}
+        if os.path.isfile(self._item_journal_abspath):
+            with open(self._item_journal_abspath) as fh:
+                for line in fh:
+                    try:
+                        entry = self.json_codec.loads(line)
+                    except ValueError:
+                        # Entry torn by a crash while it was being written.
+                        continue
+                    identifier = entry.pop("identifier")
+                    if entry.get("removed"):
+                        journal.pop(identifier, None)
+                    else:
+                        journal[identifier] = entry
+        with _ITEM_JOURNAL_LOCK:
+            self._item_journal_cache = dict(journal)
+        return journal
+
+    def get_item_journal_entry(self, identifier):
+        """Return the item journal entry of an item.
+
+        The item journal is read once, entries added afterwards through this
+        storage broker are looked up in memory.
+
+        :param identifier: item identifier
+        :returns: dictionary of item properties, or None if the item is not
+                  in the item journal
+        """
+        if self._item_journal_cache is None:
+            self.get_item_journal()
+        return self._item_journal_cache.get(identifier)
+
+    def add_item_journal_entry(self, identifier, properties):
+        """Record the properties of a complete and verified item.
+
+        The item content is flushed to disk before the entry is appended to
+        the journal, and the journal is flushed to disk after it, so that the
+        journal never refers to content that could be lost in a crash and
+        entries are not lost once recorded.
+
+        :param identifier: item identifier
+        :param properties: item properties as returned by
+                           :meth:`item_properties`
+        """
+        fpath = self._fpath_from_handle(
+            handle_to_osrelpath(properties["relpath"], IS_WINDOWS)
+        )
+        try:
+            with open(fpath, "rb") as fh:
+                os.fsync(fh.fileno())
+        except OSError:
+            # Some platforms only allow flushing files opened for writing.
+            logger.debug("Unable to fsync {}".format(fpath))
+
+        entry = dict(properties)
+        entry["identifier"] = identifier
+        line = self.json_codec.dumps(entry, sort_keys=True) + "\n"
+        with _ITEM_JOURNAL_LOCK:
+            mkdir_parents(self._metadata_fragments_abspath)
+            created = not os.path.isfile(self._item_journal_abspath)
+            with open(self._item_journal_abspath, "a") as fh:
+                fh.write(line)
+                fh.flush()
+                os.fsync(fh.fileno())
+            if created:
+                _fsync_directory(self._metadata_fragments_abspath)
+            if self._item_journal_cache is not None:
+                self._item_journal_cache[identifier] = dict(properties)
+
+    def remove_item_journal_entry(self, identifier):
+        """Remove the item journal entry of an item that is written again.
+
+        The journal is append only, so a line marking the entry as removed
+        is appended and flushed to disk before the item is overwritten.
+
+        :param identifier: item identifier
+        """
+        line = self.json_codec.dumps(
+            {"identifier": identifier, "removed": True},
+            sort_keys=True
+        ) + "\n"
+        with _ITEM_JOURNAL_LOCK:
+            if not os.path.isfile(self._item_journal_abspath):
+                return
+            with open(self._item_journal_abspath, "a") as fh:
+                fh.write(line)
+                fh.flush()
+                os.fsync(fh.fileno())
+            if self._item_journal_cache is not None:
+                self._item_journal_cache.pop(identifier, None)
+
+    def _invalidate_item_journal_entry(self, relpath):
+        """Remove the journal entry of an item about to be overwritten."""
+        identifier = generate_identifier(relpath)
+        if self.get_item_journal_entry(identifier) is not None:
+            self.remove_item_journal_entry(identifier)
+
     def iter_item_handles(self):
         """Return iterator over item handles."""
 
@@ -714,7 +1797,7 @@ class DiskStorageBroker(BaseStorageBroker):
         fpath = prefix + '.{}.json'.format(key)
 
         with open(fpath, 'w') as fh:
-            json.dump(value, fh)
+            fh.write(self.json_codec.dumps(value))
 
     def get_item_metadata(self, handle):
         """Return dictionary containing all metadata associated with handle.
@@ -743,7 +1826,7 @@ class DiskStorageBroker(BaseStorageBroker):
         for f in files:
             key = f.split('.')[-2]  # filename: identifier.key.json
             with open(f) as fh:
-                value = json.load(fh)
+                value = self.json_codec.loads(fh.read())
             metadata[key] = value
 
         return metadata
@@ -770,7 +1853,8 @@ class DiskStorageBroker(BaseStorageBroker):
         :meth:`dtoolcore.ProtoDataSet.freeze` method.
 
         In the :class:`dtoolcore.storage_broker.DiskStorageBroker` it removes
-        the temporary directory for storing item metadata fragment files.
+        the temporary directory for storing item metadata fragment files and
+        the item journal.
         """
         if os.path.isdir(self._metadata_fragments_abspath):
             shutil.rmtree(self._metadata_fragments_abspath)
@@ -782,3 +1866,241 @@ class DiskStorageBroker(BaseStorageBroker):
                 key = os.path.join(self._abspath, name)
                 historical_readme_keys.append(key)
         return historical_readme_keys
+
+
+class DedupDiskStorageBroker(DiskStorageBroker):
+    """
+    Storage broker storing item content in a content addressed object pool.
+
+    The object pool is shared by all datasets in the same base URI. The
+    items in the data directory of a dataset are hardlinks to objects in the
+    pool, named after the SHA-256 hash of their content. Putting an item with
+    content already present in the pool therefore only requires reading the
+    item, not writing it.
+
+    Rather than storing references to the pool in the manifest, datasets are
+    laid out as by the :class:`dtoolcore.storagebroker.DiskStorageBroker`,
+    so they can be read by any tool that reads disk datasets, and the link
+    count of an object records whether it is still used. This has some
+    limits:
+
+    - the base URI must be on a file system supporting hardlinks, and
+      datasets cannot be split across file systems; copying or moving a
+      dataset to another file system copies the content of its items
+    - objects, and hence the items, are made read-only, since modifying one
+      would modify all items sharing its content
+    - the number of items sharing an object is limited by the maximum link
+      count of the file system
+    """
+
+    #: Attribute used to define the type of storage broker.
+    key = "dedup"
+
+    #: Attribute used by :class:`dtoolcore.ProtoDataSet` to write the hash
+    #: function name to the manifest. The hash is also the object pool key.
+    hasher = FileHasher(sha256sum_hexdigest)
+
+    # Attribute used to document the structure of the dataset.
+    _dtool_readme_txt = _DEDUP_DTOOL_README_TXT
+
+    #: Name of the object pool directory in the base URI.
+    object_pool_directory = ".dtool_object_pool"
+
+    #: Objects added to the pool or linked more recently than this number of
+    #: seconds are not removed by :meth:`prune_object_pool`, as they may be
+    #: about to be linked into a dataset.
+    prune_grace_period = 3600
+
+    def __init__(self, uri, config_path=None):
+        super(DedupDiskStorageBroker, self).__init__(uri, config_path)
+        self._object_pool_abspath = os.path.join(
+            os.path.dirname(self._abspath),
+            self.object_pool_directory
+        )
+
+    def _object_abspath(self, digest):
+        return os.path.join(self._object_pool_abspath, digest[:2], digest)
+
+    def _put_object(self, fpath, digest=None, progress_callback=None):
+        """Add content of fpath to the object pool and return object path."""
+        if digest is None:
+            digest = self.hasher(fpath)
+        object_abspath = self._object_abspath(digest)
+        if os.path.isfile(object_abspath):
+            logger.debug("Object already in pool: {}".format(digest))
+            if progress_callback:
+                progress_callback(os.path.getsize(fpath))
+            return digest, object_abspath
+
+        # Write to a temporary file first so that the pool never contains
+        # partially written objects.
+        tmp_abspath = self._tmp_object_abspath()
+        copy_file(fpath, tmp_abspath, progress_callback=progress_callback)
+        self._publish_object(tmp_abspath, object_abspath)
+        return digest, object_abspath
+
+    def _tmp_object_abspath(self):
+        mkdir_parents(self._object_pool_abspath)
+        return os.path.join(
+            self._object_pool_abspath,
+            "tmp-{}".format(uuid.uuid4())
+        )
+
+    def _publish_object(self, tmp_abspath, object_abspath):
+        """Move completely written temporary file into the object pool.
+
+        The object is made read-only. Linking fails if another process has
+        added the same object in the meantime, in which case that object is
+        kept.
+        """
+        mode = stat.S_IMODE(os.stat(tmp_abspath).st_mode)
+        os.chmod(
+            tmp_abspath,
+            mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+        )
+        mkdir_parents(os.path.dirname(object_abspath))
+        try:
+            os.link(tmp_abspath, object_abspath)
+        except OSError:
+            if not os.path.isfile(object_abspath):
+                raise
+        finally:
+            os.unlink(tmp_abspath)
+
+    def _link_object(self, digest, object_abspath, relpath):
+        """Link object into data directory and record it in the journal."""
+        osrelpath = handle_to_osrelpath(relpath, IS_WINDOWS)
+        dest_path = os.path.join(self._data_abspath, osrelpath)
+        mkdir_parents(os.path.dirname(dest_path))
+        if os.path.lexists(dest_path):
+            self._invalidate_item_journal_entry(relpath)
+            os.unlink(dest_path)
+        os.link(object_abspath, dest_path)
+
+        properties = {
+            "relpath": relpath,
+            "size_in_bytes": self.get_size_in_bytes(relpath),
+            "utc_timestamp": self.get_utc_timestamp(relpath),
+            "hash": digest,
+        }
+        self.add_item_journal_entry(generate_identifier(relpath), properties)
+
+    def put_item(self, fpath, relpath, progress_callback=None):
+        """Put item with content from fpath at relpath in dataset.
+
+        The content is only written to the object pool if it is not already
+        present. The hash is recorded in the item journal so that it does not
+        need to be recalculated when the dataset is frozen.
+
+        :param fpath: path to the item on disk
+        :param relpath: relative path name given to the item in the dataset as
+                        a handle, i.e. a Unix-like relpath
+        :param progress_callback: function called with the number of bytes
+                                  stored
+        :returns: the handle given to the item
+        """
+        digest, object_abspath = self._put_object(
+            fpath,
+            progress_callback=progress_callback
+        )
+        try:
+            self._link_object(digest, object_abspath, relpath)
+        except FileNotFoundError:
+            # The object was pruned after it was found in the pool.
+            digest, object_abspath = self._put_object(fpath, digest)
+            self._link_object(digest, object_abspath, relpath)
+        return relpath
+
+    def put_item_from_stream(self, stream, relpath):
+        """Put item with content read from stream at relpath in dataset.
+
+        The content is hashed while it is written to a temporary file in the
+        object pool, which is discarded if the object already exists.
+
+        :param stream: binary file-like object or bytes
+        :param relpath: relative path name given to the item in the dataset as
+                        a handle, i.e. a Unix-like relpath
+        :returns: the handle given to the item
+        """
+        hasher = self.hasher.hashlib_hasher()
+        tmp_abspath = self._tmp_object_abspath()
+        _write_stream(_as_binary_stream(stream), tmp_abspath, hasher)
+        digest = hasher.hexdigest()
+        object_abspath = self._object_abspath(digest)
+        self._publish_object(tmp_abspath, object_abspath)
+        self._link_object(digest, object_abspath, relpath)
+        return relpath
+
+    def link_item(self, fpath, relpath):
+        """Put item with content from fpath at relpath in dataset.
+
+        Items are always links to the object pool, so this is the same as
+        :meth:`put_item`.
+        """
+        return self.put_item(fpath, relpath)
+
+    def put_items(self, items, link=False, callback=None, num_threads=None,
+                  progress_callback=None):
+        """Put items with content from fpaths at relpaths in dataset.
+
+        Items are hashed and stored concurrently.
+
+        :param items: iterable of (fpath, relpath) tuples
+        :param link: ignored, items are always links to the object pool
+        :param callback: function called with the relpath and handle of each
+                         item once it has been stored, from the thread that
+                         stored the item
+        :param num_threads: number of threads, see
+                            :func:`dtoolcore.utils.get_num_threads`
+        :param progress_callback: function called with the number of bytes
+                                  stored, from the thread that stored the
+                                  item
+        :returns: list of the handles given to the items
+        """
+        def put(indexed_item):
+            index, (fpath, relpath) = indexed_item
+            handle = self.put_item(fpath, relpath, progress_callback)
+            if callback:
+                callback(relpath, handle)
+            return index, handle
+
+        num_threads = get_num_threads(num_threads)
+        results = threaded_imap_unordered(put, enumerate(items), num_threads)
+        return [handle for _, handle in sorted(results)]
+
+    @classmethod
+    def prune_object_pool(cls, base_uri, grace_period=None):
+        """Remove objects that are no longer part of any dataset.
+
+        Objects only linked from the pool itself are removed, unless they
+        have been added or linked within the grace period. Temporary files of
+        objects that are being written are never removed, so the pool can be
+        pruned while datasets are being created.
+
+        :param base_uri: base URI containing the object pool
+        :param grace_period: number of seconds, defaults to
+                             :attr:`prune_grace_period`
+        :returns: list of the hashes of the removed objects
+        """
+        if grace_period is None:
+            grace_period = cls.prune_grace_period
+        base_abspath = _get_abspath_from_uri(base_uri)
+        pool_abspath = os.path.join(base_abspath, cls.object_pool_directory)
+        removed = []
+        if not os.path.isdir(pool_abspath):
+            return removed
+        cutoff = time.time() - grace_period
+        for dirpath, dirnames, filenames in os.walk(pool_abspath):
+            for fn in filenames:
+                if fn.startswith("tmp-"):
+                    continue
+                fpath = os.path.join(dirpath, fn)
+                object_stat = os.stat(fpath)
+                if object_stat.st_nlink != 1:
+                    continue
+                # The change time is updated when the link count changes.
+                if max(object_stat.st_mtime, object_stat.st_ctime) > cutoff:
+                    continue
+                os.unlink(fpath)
+                removed.append(fn)
+        return removed
@@ -13,6 +13,13 @@ import re
 import socket
 import logging
 
+from concurrent.futures import (
+    ThreadPoolExecutor,
+    FIRST_COMPLETED,
+    as_completed,
+    wait,
+)
+
 try:
     from urlparse import urlparse, urlunparse
 except ImportError:
@@ -32,6 +39,14 @@ NAME_VALID_CHARS_LIST = ["0-9", "a-z", "A-Z", "-", "_", "."]
 NAME_VALID_CHARS_STR = "".join(NAME_VALID_CHARS_LIST)
 NAME_VALID_CHARS_REGEX = re.compile(r"^[{}]+$".format(NAME_VALID_CHARS_STR))
 
+HAS_FADVISE = hasattr(os, "posix_fadvise")
+HAS_NOATIME = hasattr(os, "O_NOATIME")
+
+COPY_BUFSIZE = 1024 * 1024
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+
+DEFAULT_NUM_THREADS = min(32, (os.cpu_count() or 1) + 4)
+
 
 def windows_to_unix_path(win_path):
     """Return Unix path."""
@@ -286,3 +301,373 @@ def handle_to_osrelpath(handle, is_windows=False):
     if is_windows:
         return "\\".join(directories)
     return "/".join(directories)
+
+
+def config_value_is_true(value):
+    """Return True if a configuration value represents a true boolean.
+
+    Configuration values coming from environment variables are strings, so
+    "true", "yes", "on" and "1" (case insensitive) are all considered true.
+    """
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "yes", "on", "1")
+    return bool(value)
+
+
+def get_memoised_config(cache, config_path, keys, read_config):
+    """Return settings read from the configuration, memoised per file.
+
+    Settings looked up for every file or storage broker are only read again
+    when the modification time or size of the configuration file, or one of
+    the environment variables named in keys, change.
+
+    :param cache: dictionary used to memoise the settings
+    :param config_path: path to JSON configuration file
+    :param keys: names of the environment variables the settings depend on
+    :param read_config: function called with config_path to read the
+                        settings
+    :returns: value returned by read_config
+    """
+    if config_path is None:
+        config_path = DEFAULT_CONFIG_PATH
+    try:
+        config_stat = os.stat(config_path)
+        config_fingerprint = (config_stat.st_mtime_ns, config_stat.st_size)
+    except OSError:
+        config_fingerprint = None
+    fingerprint = (config_fingerprint,) + tuple(
+        os.environ.get(key) for key in keys
+    )
+    cached = cache.get(config_path)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+
+    value = read_config(config_path)
+    cache[config_path] = (fingerprint, value)
+    return value
+
+
+# I/O hint settings keyed by configuration file path, see get_io_hints.
+_IO_HINTS_CACHE = dict()
+
+
+def _read_io_hints(config_path):
+    sequential = get_config_value("DTOOL_IO_HINTS", config_path, default=True)
+    drop_cache = get_config_value(
+        "DTOOL_IO_DROP_CACHE",
+        config_path,
+        default=False
+    )
+    return (
+        config_value_is_true(sequential),
+        config_value_is_true(drop_cache)
+    )
+
+
+def get_io_hints(config_path=None):
+    """Return tuple with the I/O hint settings (sequential, drop_cache).
+
+    ``DTOOL_IO_HINTS`` (default true) controls whether files read once from
+    start to end are opened with ``O_NOATIME`` where permitted and advised
+    as ``POSIX_FADV_SEQUENTIAL``.
+
+    ``DTOOL_IO_DROP_CACHE`` (default false) controls whether
+    ``POSIX_FADV_DONTNEED`` is issued once a file has been consumed, so that
+    bulk operations do not evict the page cache of other processes.
+
+    The settings are looked up for every file hashed or copied, see
+    :func:`dtoolcore.utils.get_memoised_config`.
+
+    :param config_path: path to JSON configuration file
+    :returns: tuple of booleans (sequential, drop_cache)
+    """
+    return get_memoised_config(
+        _IO_HINTS_CACHE,
+        config_path,
+        ("DTOOL_IO_HINTS", "DTOOL_IO_DROP_CACHE"),
+        _read_io_hints
+    )
+
+
+def _fadvise(fd, advice):
+    """Give the kernel advice about the access pattern of the whole file."""
+    if not HAS_FADVISE:
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, advice)
+    except OSError:
+        # Advice is only a hint, e.g. pipes and some file systems reject it.
+        pass
+
+
+def open_for_sequential_read(fpath, io_hints=True):
+    """Return binary file object for reading fpath once from start to end.
+
+    If io_hints is True the file is opened with ``O_NOATIME`` where the
+    platform and file ownership permit it and the kernel is advised that the
+    file will be read sequentially.
+
+    :param fpath: path to file
+    :param io_hints: use platform specific I/O hints
+    :returns: file object opened in binary read mode
+    """
+    flags = os.O_RDONLY | getattr(os, "O_BINARY", 0)
+    fd = None
+    if io_hints and HAS_NOATIME:
+        try:
+            fd = os.open(fpath, flags | os.O_NOATIME)
+        except OSError as exc:
+            # O_NOATIME is only permitted for the owner of the file.
+            if exc.errno != errno.EPERM:
+                raise
+    if fd is None:
+        fd = os.open(fpath, flags)
+    if io_hints and HAS_FADVISE:
+        _fadvise(fd, os.POSIX_FADV_SEQUENTIAL)
+    return os.fdopen(fd, "rb")
+
+
+def drop_from_page_cache(fh):
+    """Advise the kernel that the cached pages of the file are not needed.
+
+    Dirty pages are not dropped by the kernel, so files that have been
+    written are flushed to disk first.
+
+    :param fh: file object
+    """
+    if not HAS_FADVISE:
+        return
+    if fh.writable():
+        fh.flush()
+        os.fdatasync(fh.fileno())
+    _fadvise(fh.fileno(), os.POSIX_FADV_DONTNEED)
+
+
+# Errors indicating that a copy method is not supported for the given pair
+# of files, rather than a genuine I/O error.
+_COPY_FALLBACK_ERRNOS = set([
+    errno.ENOSYS,
+    errno.EXDEV,
+    errno.EINVAL,
+    errno.EOPNOTSUPP,
+    errno.ENOTSUP,
+])
+
+
+def _available_copy_methods():
+    """Return list of copy methods in order of preference."""
+    methods = []
+    if hasattr(os, "copy_file_range"):
+        methods.append("copy_file_range")
+    # Only Linux supports sendfile with a regular file as output.
+    if hasattr(os, "sendfile") and platform.system() == "Linux":
+        methods.append("sendfile")
+    methods.append("read_write")
+    return methods
+
+
+def _copy_chunk(method, infd, outfd, offset, count):
+    """Copy up to count bytes at offset from infd to outfd.
+
+    :returns: number of bytes copied, zero at the end of the input file
+    """
+    if method == "copy_file_range":
+        return os.copy_file_range(infd, outfd, count, offset, offset)
+    if method == "sendfile":
+        os.lseek(outfd, offset, os.SEEK_SET)
+        return os.sendfile(outfd, infd, offset, count)
+    os.lseek(infd, offset, os.SEEK_SET)
+    data = os.read(infd, min(count, COPY_BUFSIZE))
+    os.lseek(outfd, offset, os.SEEK_SET)
+    view = memoryview(data)
+    while view:
+        written = os.write(outfd, view)
+        view = view[written:]
+    return len(data)
+
+
+def _data_segments(fd, size, sparse):
+    """Return list of (start, end) tuples of regions containing data.
+
+    Holes in sparse files are skipped if the platform supports SEEK_DATA.
+    """
+    if not (sparse and hasattr(os, "SEEK_DATA")):
+        return [(0, size)]
+    segments = []
+    offset = 0
+    try:
+        while offset < size:
+            try:
+                start = os.lseek(fd, offset, os.SEEK_DATA)
+            except OSError as exc:
+                if exc.errno == errno.ENXIO:
+                    # No more data after offset.
+                    break
+                raise
+            end = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+            segments.append((start, end))
+            offset = end
+    except OSError:
+        # SEEK_DATA not supported by the file system.
+        return [(0, size)]
+    return segments
+
+
+def copy_file(
+    src,
+    dest,
+    config_path=None,
+    chunk_size=COPY_CHUNK_SIZE,
+    progress_callback=None
+):
+    """Copy the content of the file src to the file dest.
+
+    The copy is done in kernel space where possible, preferring
+    ``os.copy_file_range`` (which allows file systems such as XFS, Btrfs and
+    NFSv4.2 to copy server side or share extents), then ``os.sendfile`` and
+    finally a buffered copy in user space. Holes in sparse files are
+    preserved where the platform supports ``SEEK_DATA``.
+
+    The source file is read using the I/O hints configured by
+    :func:`dtoolcore.utils.get_io_hints`.
+
+    :param src: path to source file
+    :param dest: path to destination file
+    :param config_path: path to JSON configuration file
+    :param chunk_size: maximum number of bytes copied per system call
+    :param progress_callback: function called with the number of bytes
+                              copied after each chunk
+    :raises: IOError if the source file is shorter than its size at the
+             start of the copy
+    """
+    sequential, drop_cache = get_io_hints(config_path)
+    methods = _available_copy_methods()
+    with open_for_sequential_read(src, io_hints=sequential) as fsrc:
+        infd = fsrc.fileno()
+        stat = os.fstat(infd)
+        size = stat.st_size
+        sparse = getattr(stat, "st_blocks", size) * 512 < size
+        with open(dest, "wb") as fdest:
+            outfd = fdest.fileno()
+            for start, end in _data_segments(infd, size, sparse):
+                offset = start
+                while offset < end:
+                    count = min(chunk_size, end - offset)
+                    try:
+                        copied = _copy_chunk(
+                            methods[0],
+                            infd,
+                            outfd,
+                            offset,
+                            count
+                        )
+                    except OSError as exc:
+                        if len(methods) == 1:
+                            raise
+                        if exc.errno not in _COPY_FALLBACK_ERRNOS:
+                            raise
+                        logger.debug("Copy method {} failed: {}".format(
+                            methods[0],
+                            exc
+                        ))
+                        methods.pop(0)
+                        continue
+                    if copied == 0:
+                        if len(methods) > 1:
+                            # Some file systems report end of file to the
+                            # kernel copy methods, retry in user space.
+                            logger.debug(
+                                "Copy method {} copied nothing".format(
+                                    methods[0]
+                                )
+                            )
+                            methods.pop(0)
+                            continue
+                        raise IOError(
+                            "Short copy of {}: expected {} bytes, "
+                            "got {}".format(src, size, offset)
+                        )
+                    offset += copied
+                    if progress_callback:
+                        progress_callback(copied)
+
+            # Make sure that trailing holes are part of the file.
+            os.ftruncate(outfd, size)
+
+            if drop_cache:
+                drop_from_page_cache(fdest)
+        if drop_cache:
+            drop_from_page_cache(fsrc)
+
+
+def get_num_threads(num_threads=None, config_path=None):
+    """Return the number of threads to use for concurrent I/O.
+
+    Preference:
+    1. The ``num_threads`` argument if it is not None
+    2. The ``DTOOL_NUM_THREADS`` configuration value
+    3. The :data:`dtoolcore.utils.DEFAULT_NUM_THREADS` default
+
+    :param num_threads: explicitly requested number of threads
+    :param config_path: path to JSON configuration file
+    :returns: number of threads, at least one
+    """
+    if num_threads is None:
+        num_threads = get_config_value(
+            "DTOOL_NUM_THREADS",
+            config_path,
+            default=DEFAULT_NUM_THREADS
+        )
+    return max(1, int(num_threads))
+
+
+def _executor_imap_unordered(executor, func, iterable, max_pending):
+    pending = set()
+    for item in iterable:
+        pending.add(executor.submit(func, item))
+        if len(pending) >= max_pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    for future in as_completed(pending):
+        yield future.result()
+
+
+def threaded_imap_unordered(func, iterable, num_threads, max_pending=None,
+                            executor=None):
+    """Yield results of func applied to the items in iterable using threads.
+
+    Results are yielded as soon as they are available, so the order may
+    differ from that of the input. At most max_pending items are in flight
+    at any time, which means that the input iterable is consumed lazily. If
+    num_threads is one and no executor is given the items are processed in
+    the calling thread.
+
+    :param func: function taking one item as input
+    :param iterable: iterable of items
+    :param num_threads: number of worker threads
+    :param max_pending: maximum number of items in flight, defaults to twice
+                        the number of threads
+    :param executor: existing :class:`concurrent.futures.Executor` to submit
+                     the work to rather than creating a pool of num_threads
+                     threads; it is not shut down afterwards
+    :returns: iterator over the results
+    """
+    if executor is None and num_threads <= 1:
+        for item in iterable:
+            yield func(item)
+        return
+
+    if max_pending is None:
+        max_pending = 2 * max(1, num_threads)
+
+    if executor is not None:
+        for result in _executor_imap_unordered(
+                executor, func, iterable, max_pending):
+            yield result
+        return
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        for result in _executor_imap_unordered(
+                executor, func, iterable, max_pending):
+            yield result
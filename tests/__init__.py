@@ -76,3 +76,48 @@ def local_tmp_dir_fixture(request):
     def teardown():
         shutil.rmtree(d)
     return d
+
+
+def create_dataset(
+    base_uri,
+    name="test_dataset",
+    items=None,
+    item_metadata=None,
+    annotations=None,
+    tags=None,
+    readme_content="",
+):
+    """Create a frozen dataset and return it.
+
+    :param base_uri: base URI to create the dataset in
+    :param name: dataset name
+    :param items: dict mapping relpaths to item content, either bytes or the
+                  path of a file; defaults to the files in TEST_SAMPLE_DATA
+    :param item_metadata: dict mapping relpaths to dicts of item metadata
+    :param annotations: dict of annotations
+    :param tags: list of tags
+    :param readme_content: content of the readme
+    :returns: :class:`dtoolcore.DataSet`
+    """
+    from dtoolcore import DataSetCreator, DataSet
+
+    if items is None:
+        items = dict(
+            (fname, os.path.join(TEST_SAMPLE_DATA, fname))
+            for fname in os.listdir(TEST_SAMPLE_DATA)
+        )
+
+    with DataSetCreator(name, base_uri, readme_content) as creator:
+        for relpath, content in items.items():
+            if isinstance(content, bytes):
+                creator.put_item_from_stream(content, relpath)
+            else:
+                creator.put_item(content, relpath)
+        for relpath, metadata in (item_metadata or {}).items():
+            for key, value in metadata.items():
+                creator.add_item_metadata(relpath, key, value)
+        for key, value in (annotations or {}).items():
+            creator.put_annotation(key, value)
+        for tag in tags or []:
+            creator.put_tag(tag)
+    return DataSet.from_uri(creator.uri)
@@ -0,0 +1,152 @@
+"""Tests for the content addressed deduplicating disk storage broker."""
+
+import os
+
+from . import tmp_dir_fixture  # NOQA
+from . import TEST_SAMPLE_DATA
+from . import create_dataset
+
+
+def test_dedup_datasets_share_objects(tmp_dir_fixture):  # NOQA
+
+    import dtoolcore
+    from dtoolcore.filehasher import sha256sum_hexdigest
+    from dtoolcore.storagebroker import DedupDiskStorageBroker
+
+    base_uri = "dedup://" + tmp_dir_fixture
+
+    ds1 = create_dataset(base_uri, "first")
+    ds2 = create_dataset(base_uri, "second")
+
+    assert ds1.uri.startswith("dedup://")
+    assert isinstance(ds1._storage_broker, DedupDiskStorageBroker)
+    assert ds1._manifest["hash_function"] == "sha256sum_hexdigest"
+
+    for i in ds1.identifiers:
+        fpath1 = ds1.item_content_abspath(i)
+        fpath2 = ds2.item_content_abspath(i)
+        assert os.stat(fpath1).st_ino == os.stat(fpath2).st_ino
+        assert ds1.item_properties(i)["hash"] == sha256sum_hexdigest(fpath1)
+
+    # Only the object pool and the datasets are in the base URI.
+    assert sorted(os.listdir(tmp_dir_fixture)) == \
+        [".dtool_object_pool", "first", "second"]
+    uris = [ds.uri for ds in dtoolcore.iter_datasets_in_base_uri(base_uri)]
+    assert sorted(uris) == sorted([ds1.uri, ds2.uri])
+
+
+def test_dedup_put_existing_object_skips_write(tmp_dir_fixture):  # NOQA
+
+    from dtoolcore.storagebroker import DedupDiskStorageBroker
+
+    broker = DedupDiskStorageBroker(os.path.join(tmp_dir_fixture, "ds"))
+    broker.create_structure()
+
+    fpath = os.path.join(TEST_SAMPLE_DATA, "tiny.png")
+    broker.put_item(fpath, "a.png")
+    digest = broker.hasher(fpath)
+    object_abspath = broker._object_abspath(digest)
+    mtime = os.stat(object_abspath).st_mtime_ns
+
+    broker.put_items([(fpath, "b.png"), (fpath, "sub/c.png")])
+    assert os.stat(object_abspath).st_mtime_ns == mtime
+    assert os.stat(object_abspath).st_nlink == 4
+
+    journal = broker.get_item_journal()
+    assert set(entry["hash"] for entry in journal.values()) == set([digest])
+
+
+def test_dedup_prune_object_pool(tmp_dir_fixture):  # NOQA
+
+    import shutil
+    import stat
+    from dtoolcore.storagebroker import DedupDiskStorageBroker
+
+    broker = DedupDiskStorageBroker(os.path.join(tmp_dir_fixture, "ds"))
+    broker.create_structure()
+    fpath = os.path.join(TEST_SAMPLE_DATA, "tiny.png")
+    broker.put_item(fpath, "a.png")
+
+    digest = broker.hasher(fpath)
+    object_abspath = broker._object_abspath(digest)
+
+    # Objects are read-only as they are shared by items.
+    assert not os.stat(object_abspath).st_mode & stat.S_IWUSR
+
+    assert DedupDiskStorageBroker.prune_object_pool(
+        tmp_dir_fixture,
+        grace_period=0
+    ) == []
+
+    # Objects being written are not removed.
+    tmp_abspath = broker._tmp_object_abspath()
+    with open(tmp_abspath, "w") as fh:
+        fh.write("partially written")
+
+    shutil.rmtree(os.path.join(tmp_dir_fixture, "ds"))
+
+    # Objects added within the grace period are not removed.
+    assert DedupDiskStorageBroker.prune_object_pool(tmp_dir_fixture) == []
+
+    removed = DedupDiskStorageBroker.prune_object_pool(
+        tmp_dir_fixture,
+        grace_period=0
+    )
+    assert removed == [digest]
+    assert not os.path.exists(object_abspath)
+    assert os.path.isfile(tmp_abspath)
+
+
+def test_dedup_copy_reuses_journaled_hashes(tmp_dir_fixture, monkeypatch):  # NOQA
+
+    import dtoolcore
+    from dtoolcore.filehasher import sha256sum_hexdigest
+    from dtoolcore.storagebroker import DedupDiskStorageBroker
+
+    src_dir = os.path.join(tmp_dir_fixture, "src")
+    dest_dir = os.path.join(tmp_dir_fixture, "dest")
+    for directory in [src_dir, dest_dir]:
+        os.mkdir(directory)
+    src_ds = create_dataset(src_dir, "src")
+
+    # The hashes are calculated once while the items are stored.
+    def get_hash(self, handle):
+        raise AssertionError("Item {} was hashed again".format(handle))
+
+    monkeypatch.setattr(DedupDiskStorageBroker, "get_hash", get_hash)
+    dest_uri = dtoolcore.copy(src_ds.uri, "dedup://" + dest_dir)
+    monkeypatch.undo()
+
+    dest_ds = dtoolcore.DataSet.from_uri(dest_uri)
+    assert set(dest_ds.identifiers) == set(src_ds.identifiers)
+    for i in dest_ds.identifiers:
+        fpath = dest_ds.item_content_abspath(i)
+        assert dest_ds.item_properties(i)["hash"] == sha256sum_hexdigest(fpath)
+
+
+def test_dedup_put_item_after_concurrent_prune(tmp_dir_fixture):  # NOQA
+
+    from dtoolcore.storagebroker import DedupDiskStorageBroker
+
+    broker = DedupDiskStorageBroker(os.path.join(tmp_dir_fixture, "ds"))
+    broker.create_structure()
+    fpath = os.path.join(TEST_SAMPLE_DATA, "tiny.png")
+    broker.put_item(fpath, "a.png")
+    object_abspath = broker._object_abspath(broker.hasher(fpath))
+
+    # The object is pruned after it has been found in the pool.
+    put_object = broker._put_object
+    calls = []
+
+    def pruned_put_object(fpath, digest=None, **kwargs):
+        result = put_object(fpath, digest, **kwargs)
+        if not calls:
+            os.unlink(object_abspath)
+        calls.append(fpath)
+        return result
+
+    broker._put_object = pruned_put_object
+    broker.put_item(fpath, "b.png")
+
+    assert len(calls) == 2
+    assert os.stat(object_abspath).st_nlink == 2
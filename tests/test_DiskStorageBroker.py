@@ -10,6 +10,7 @@ import pytest
 from . import tmp_dir_fixture  # NOQA
 from . import tmp_uri_fixture  # NOQA
 from . import TEST_SAMPLE_DATA
+from . import uri_to_path
 
 
 def test_initialise():
@@ -163,6 +164,29 @@ def test_store_and_retrieve_manifest(tmp_dir_fixture):  # NOQA
             assert actual == expected
 
 
+def test_get_item_abspath_after_put_manifest(tmp_dir_fixture):  # NOQA
+    from dtoolcore.storagebroker import DiskStorageBroker
+    from dtoolcore.utils import generate_identifier
+
+    destination_path = os.path.join(tmp_dir_fixture, 'my_proto_dataset')
+    storagebroker = DiskStorageBroker(destination_path)
+
+    storagebroker.create_structure()
+
+    first_id = generate_identifier('first.txt')
+    second_id = generate_identifier('second.txt')
+
+    storagebroker.put_manifest(
+        {'items': {first_id: {'relpath': 'first.txt'}}}
+    )
+    assert storagebroker.get_item_abspath(first_id).endswith('first.txt')
+
+    storagebroker.put_manifest(
+        {'items': {second_id: {'relpath': 'second.txt'}}}
+    )
+    assert storagebroker.get_item_abspath(second_id).endswith('second.txt')
+
+
 def test_item_properties(tmp_dir_fixture):  # NOQA
     from dtoolcore.storagebroker import DiskStorageBroker
 
@@ -334,6 +358,35 @@ def test_list_dataset_uris(tmp_uri_fixture):  # NOQA
     assert set(expected_uris) == set(actual_uris)
 
 
+def test_iter_dataset_uris(tmp_uri_fixture):  # NOQA
+
+    import types
+    import dtoolcore
+    from dtoolcore.storagebroker import DiskStorageBroker
+
+    base_path = uri_to_path(tmp_uri_fixture)
+
+    # Files and directories that are not datasets are ignored.
+    os.mkdir(os.path.join(base_path, "not_a_dataset"))
+    with open(os.path.join(base_path, "a_file.txt"), "w") as fh:
+        fh.write("hello")
+
+    expected_uris = []
+    for i in range(20):
+        proto_dataset = dtoolcore.create_proto_dataset(
+            "ds_{}".format(i),
+            tmp_uri_fixture
+        )
+        expected_uris.append(proto_dataset.uri)
+
+    uris = DiskStorageBroker.iter_dataset_uris(
+        base_uri=tmp_uri_fixture,
+        config_path=None
+    )
+    assert isinstance(uris, types.GeneratorType)
+    assert sorted(uris) == sorted(expected_uris)
+
+
 def test_pre_freeze_hook(tmp_dir_fixture):  # NOQA
     from dtoolcore.storagebroker import DiskStorageBroker
 
@@ -437,3 +490,123 @@ def test_put_text_creates_missing_subdirectories(tmp_dir_fixture):  # NOQA
 
     assert os.path.isfile(annotation_key)
     assert not os.path.isdir(annotation_key)
+
+
+def test_link_item(tmp_dir_fixture):  # NOQA
+
+    from dtoolcore.storagebroker import DiskStorageBroker
+
+    destination_path = os.path.join(tmp_dir_fixture, 'my_proto_dataset')
+    storagebroker = DiskStorageBroker(destination_path)
+    storagebroker.create_structure()
+
+    fpath = os.path.join(tmp_dir_fixture, 'item.txt')
+    with open(fpath, 'w') as fh:
+        fh.write('hello')
+
+    handle = storagebroker.link_item(fpath, 'sub/item.txt')
+    assert handle == 'sub/item.txt'
+    assert storagebroker.is_linked(handle)
+    dest_path = storagebroker._fpath_from_handle(handle)
+    assert os.stat(dest_path).st_ino == os.stat(fpath).st_ino
+
+    # Linking again replaces the existing item.
+    storagebroker.link_item(fpath, 'sub/item.txt')
+    assert os.stat(dest_path).st_ino == os.stat(fpath).st_ino
+
+
+def test_link_item_falls_back_to_copy(tmp_dir_fixture, monkeypatch):  # NOQA
+
+    import errno
+    from dtoolcore.storagebroker import DiskStorageBroker
+
+    destination_path = os.path.join(tmp_dir_fixture, 'my_proto_dataset')
+    storagebroker = DiskStorageBroker(destination_path)
+    storagebroker.create_structure()
+
+    fpath = os.path.join(tmp_dir_fixture, 'item.txt')
+    with open(fpath, 'w') as fh:
+        fh.write('hello')
+
+    def cross_device_link(src, dest):
+        raise OSError(errno.EXDEV, "Cross-device link")
+
+    monkeypatch.setattr(os, "link", cross_device_link)
+
+    handle = storagebroker.link_item(fpath, 'item.txt')
+    assert not storagebroker.is_linked(handle)
+    dest_path = storagebroker._fpath_from_handle(handle)
+    assert os.stat(dest_path).st_ino != os.stat(fpath).st_ino
+    with open(dest_path) as fh:
+        assert fh.read() == 'hello'
+
+
+def test_put_items(tmp_dir_fixture):  # NOQA
+
+    from dtoolcore.storagebroker import BaseStorageBroker, DiskStorageBroker
+
+    destination_path = os.path.join(tmp_dir_fixture, 'my_proto_dataset')
+    storagebroker = DiskStorageBroker(destination_path)
+    storagebroker.create_structure()
+
+    items = []
+    for fname in sorted(os.listdir(TEST_SAMPLE_DATA)):
+        fpath = os.path.join(TEST_SAMPLE_DATA, fname)
+        items.append((fpath, fname))
+        items.append((fpath, 'a/b/' + fname))
+
+    stored = []
+    progress = []
+
+    def callback(relpath, handle):
+        stored.append(handle)
+
+    handles = storagebroker.put_items(
+        iter(items),
+        callback=callback,
+        num_threads=4,
+        progress_callback=progress.append
+    )
+    assert handles == [relpath for _, relpath in items]
+    assert sorted(stored) == sorted(handles)
+    total = sum(os.path.getsize(fpath) for fpath, _ in items)
+    assert sum(progress) == total
+    assert sorted(storagebroker.iter_item_handles()) == sorted(handles)
+
+    # The default implementation stores the items one at a time.
+    destination_path = os.path.join(tmp_dir_fixture, 'serial_dataset')
+    storagebroker = DiskStorageBroker(destination_path)
+    storagebroker.create_structure()
+    progress = []
+    handles = BaseStorageBroker.put_items(
+        storagebroker,
+        items,
+        link=True,
+        progress_callback=progress.append
+    )
+    assert handles == [relpath for _, relpath in items]
+    assert sum(progress) == total
+    assert sorted(storagebroker.iter_item_handles()) == sorted(handles)
+
+
+def test_get_item_journal_entry(tmp_dir_fixture):  # NOQA
+
+    from dtoolcore.storagebroker import DiskStorageBroker
+    from dtoolcore.utils import generate_identifier
+
+    destination_path = os.path.join(tmp_dir_fixture, 'my_proto_dataset')
+    storagebroker = DiskStorageBroker(destination_path)
+    storagebroker.create_structure()
+
+    fpath = os.path.join(TEST_SAMPLE_DATA, 'tiny.png')
+    handle = storagebroker.put_item(fpath, 'tiny.png')
+    identifier = generate_identifier(handle)
+    assert storagebroker.get_item_journal_entry(identifier) is None
+
+    properties = storagebroker.item_properties(handle)
+    storagebroker.add_item_journal_entry(identifier, properties)
+    assert storagebroker.get_item_journal_entry(identifier) == properties
+
+    # The entry has been flushed to the journal file.
+    reopened = DiskStorageBroker(destination_path)
+    assert reopened.get_item_journal_entry(identifier) == properties
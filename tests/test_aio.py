@@ -0,0 +1,129 @@
+"""Test the dtoolcore.aio module."""
+
+import asyncio
+import os
+
+import pytest
+
+from . import tmp_dir_fixture  # NOQA
+from . import tmp_uri_fixture  # NOQA
+from . import TEST_SAMPLE_DATA
+
+
+def test_async_create_read_and_copy(tmp_uri_fixture, tmp_dir_fixture):  # NOQA
+    from dtoolcore import DataSet
+    from dtoolcore.aio import AsyncProtoDataSet, AsyncDataSet, copy
+    from dtoolcore.utils import generate_identifier
+
+    fpath = os.path.join(TEST_SAMPLE_DATA, "tiny.png")
+
+    async def create_and_read():
+        proto = await AsyncProtoDataSet.create("async", tmp_uri_fixture)
+        handles = await proto.put_items(
+            [(fpath, "tiny.png"), (fpath, "sub/tiny.png")],
+            concurrency=2
+        )
+        assert handles == ["tiny.png", "sub/tiny.png"]
+        await proto.put_item_from_stream(b"hello", "hello.txt")
+        for handle in ("tiny.png", "sub/tiny.png", "hello.txt"):
+            await proto.add_item_metadata(handle, "greeting", True)
+        await proto.put_tag("async")
+        await proto.put_tags(["bulk", "extra"])
+        await proto.delete_tags(["extra"])
+        await proto.put_annotations({"project": "aio"})
+        assert sorted([h async for h in proto.iter_item_handles()]) == \
+            ["hello.txt", "sub/tiny.png", "tiny.png"]
+
+        dataset = await proto.freeze()
+        assert isinstance(dataset, AsyncDataSet)
+        assert sorted(await dataset.list_tags()) == ["async", "bulk"]
+        assert await dataset.get_annotations() == {"project": "aio"}
+        assert await dataset.list_overlay_names() == ["greeting"]
+
+        entries = [e async for e in dataset.iter_manifest_entries()]
+        assert len(entries) == 3
+
+        abspaths = dict([
+            r async for r in dataset.iter_item_content_abspaths(concurrency=2)
+        ])
+        identifier = generate_identifier("hello.txt")
+        with open(abspaths[identifier], "rb") as fh:
+            assert fh.read() == b"hello"
+
+        assert [p async for p in dataset.verify()] == []
+
+        dest_base_uri = os.path.join(tmp_dir_fixture, "dest")
+        os.mkdir(dest_base_uri)
+        return await copy(dataset.uri, dest_base_uri)
+
+    dest_uri = asyncio.run(create_and_read())
+    copied = DataSet.from_uri(dest_uri)
+    assert len(copied.identifiers) == 3
+
+
+def test_native_async_broker_method_is_used(tmp_uri_fixture):  # NOQA
+    from dtoolcore import DataSetCreator
+    from dtoolcore.aio import AsyncDataSet
+
+    with DataSetCreator("native", tmp_uri_fixture) as creator:
+        creator.put_item_from_stream(b"x", "x.txt")
+
+    async def read():
+        dataset = await AsyncDataSet.from_uri(creator.uri)
+
+        async def async_get_readme_content():
+            return "native"
+
+        dataset._storage_broker.async_get_readme_content = \
+            async_get_readme_content
+        return await dataset.get_readme_content()
+
+    assert asyncio.run(read()) == "native"
+
+
+def test_async_dataset_matches_dataset(tmp_uri_fixture):  # NOQA
+    from dtoolcore import DataSetCreator, DtoolCoreKeyError
+    from dtoolcore.aio import AsyncDataSet
+    from dtoolcore.utils import generate_identifier
+
+    with DataSetCreator("matches", tmp_uri_fixture) as creator:
+        creator.put_item_from_stream(b"x", "x.txt")
+        creator.put_annotation("zebra", 1)
+        creator.put_annotation("aardvark", 2)
+
+    async def read():
+        dataset = await AsyncDataSet.from_uri(creator.uri)
+        assert await dataset.list_annotation_names() == \
+            dataset.dataset.list_annotation_names()
+        assert await dataset.list_annotation_names() == ["aardvark", "zebra"]
+
+        with pytest.raises(DtoolCoreKeyError):
+            await dataset.get_overlay("missing")
+
+        os.unlink(await dataset.item_content_abspath(
+            generate_identifier("x.txt")
+        ))
+        problems = [p async for p in dataset.verify(mode="quick")]
+        assert [p[1] for p in problems] == ["missing"]
+
+    asyncio.run(read())
+
+
+def test_async_proto_dataset_create_with_config_path(tmp_uri_fixture, tmp_dir_fixture):  # NOQA
+    from dtoolcore.aio import AsyncProtoDataSet
+
+    config_path = os.path.join(tmp_dir_fixture, "dtool.json")
+
+    async def create():
+        proto = await AsyncProtoDataSet.create(
+            "config",
+            tmp_uri_fixture,
+            config_path=config_path
+        )
+        await proto.put_item_from_stream(b"x", "x.txt")
+        dataset = await proto.freeze()
+        return proto, dataset
+
+    proto, dataset = asyncio.run(create())
+    assert proto._config_path == config_path
+    assert dataset._config_path == config_path
@@ -0,0 +1,97 @@
+"""Test the bulk annotation and tag functionality."""
+
+import pytest
+
+from . import tmp_uri_fixture  # NOQA
+
+
+def test_bulk_annotations(tmp_uri_fixture):  # NOQA
+    from dtoolcore import (
+        DataSet,
+        create_proto_dataset,
+        DtoolCoreKeyError,
+        DtoolCoreInvalidNameError,
+    )
+
+    proto = create_proto_dataset("bulk", tmp_uri_fixture)
+    annotations = dict(
+        ("annotation-{}".format(i), {"value": i}) for i in range(20)
+    )
+    proto.put_annotations(annotations)
+    proto.freeze()
+
+    dataset = DataSet.from_uri(proto.uri)
+    assert dataset.get_annotations() == annotations
+    assert dataset.get_annotations(["annotation-3", "annotation-7"]) == {
+        "annotation-3": {"value": 3},
+        "annotation-7": {"value": 7},
+    }
+    assert dataset.get_annotations([]) == {}
+
+    with pytest.raises(DtoolCoreKeyError):
+        dataset.get_annotations(["annotation-3", "missing"])
+
+    # Nothing is written if any name is invalid.
+    with pytest.raises(DtoolCoreInvalidNameError):
+        dataset.put_annotations({"good": 1, "not good": 2})
+    assert "good" not in dataset.list_annotation_names()
+
+
+def test_bulk_tags(tmp_uri_fixture):  # NOQA
+    from dtoolcore import (
+        DataSetCreator,
+        DataSet,
+        DtoolCoreInvalidNameError,
+        DtoolCoreValueError,
+    )
+
+    with DataSetCreator("bulk-tags", tmp_uri_fixture) as creator:
+        creator.put_tags(["a", "b", "c"])
+        creator.put_annotations({"project": "x"})
+
+    dataset = DataSet.from_uri(creator.uri)
+    assert sorted(dataset.list_tags()) == ["a", "b", "c"]
+    assert dataset.get_annotations() == {"project": "x"}
+
+    dataset.put_tags(tag for tag in ["d", "e"])
+    dataset.delete_tags(["a", "d", "not-a-tag"])
+    assert sorted(dataset.list_tags()) == ["b", "c", "e"]
+
+    with pytest.raises(DtoolCoreInvalidNameError):
+        dataset.put_tags(["f", "bad tag"])
+    with pytest.raises(DtoolCoreValueError):
+        dataset.put_tags(["f", 1])
+    assert "f" not in dataset.list_tags()
+
+
+def test_base_storage_broker_bulk_defaults():
+    from dtoolcore.storagebroker import BaseStorageBroker
+
+    class DictStorageBroker(BaseStorageBroker):
+        def __init__(self):
+            self.annotations = {}
+            self.tags = set()
+
+        def list_annotation_names(self):
+            return list(self.annotations)
+
+        def get_annotation(self, annotation_name):
+            return self.annotations[annotation_name]
+
+        def put_annotation(self, annotation_name, annotation):
+            self.annotations[annotation_name] = annotation
+
+        def put_tag(self, tag):
+            self.tags.add(tag)
+
+        def delete_tag(self, tag):
+            self.tags.discard(tag)
+
+    broker = DictStorageBroker()
+    broker.put_annotations({"a": 1, "b": 2})
+    assert broker.get_annotations() == {"a": 1, "b": 2}
+    assert broker.get_annotations(["b", "missing"]) == {"b": 2}
+
+    broker.put_tags(["x", "y"])
+    broker.delete_tags(["x"])
+    assert broker.tags == {"y"}
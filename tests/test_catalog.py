@@ -0,0 +1,123 @@
+"""Test the dtoolcore.catalog module."""
+
+import os
+import shutil
+
+import pytest
+
+from . import tmp_dir_fixture  # NOQA
+from . import tmp_uri_fixture  # NOQA
+from . import uri_to_path
+from . import TEST_SAMPLE_DATA
+
+
+def _create_datasets(base_uri):
+    from dtoolcore import DataSetCreator, create_proto_dataset
+
+    fpath = os.path.join(TEST_SAMPLE_DATA, "tiny.png")
+    uris = {}
+    for name, project in [("ds-a", "alpha"), ("ds-b", "beta")]:
+        with DataSetCreator(name, base_uri) as creator:
+            creator.put_item(fpath, "tiny.png")
+            creator.put_annotation("project", project)
+            creator.put_tag("raw")
+        uris[name] = creator.uri
+
+    proto = create_proto_dataset("proto", base_uri)
+    proto.put_tag("raw")
+    uris["proto"] = proto.uri
+    return uris
+
+
+def test_catalog_refresh_and_queries(tmp_uri_fixture, tmp_dir_fixture):  # NOQA
+    from dtoolcore import DataSet, DtoolCoreKeyError
+    from dtoolcore.catalog import Catalog
+
+    uris = _create_datasets(tmp_uri_fixture)
+    db_path = os.path.join(tmp_dir_fixture, "catalog", "catalog.sqlite")
+
+    with Catalog(db_path) as catalog:
+        counts = catalog.refresh(tmp_uri_fixture)
+        assert counts == {
+            "added": 3, "updated": 0, "removed": 0, "unchanged": 0,
+            "failed": 0
+        }
+
+        assert catalog.find_by_tag("raw") == sorted(uris.values())
+        assert catalog.find(tags=["raw"], type_name="dataset") == \
+            sorted([uris["ds-a"], uris["ds-b"]])
+        assert catalog.find_by_annotation("project", "alpha") == \
+            [uris["ds-a"]]
+        assert catalog.find_by_annotation("project", "gamma") == []
+        assert catalog.list_dataset_uris(tmp_uri_fixture) == \
+            sorted(uris.values())
+
+        info = catalog.get_dataset_info(uris["ds-a"])
+        assert info["admin_metadata"]["name"] == "ds-a"
+        assert info["tags"] == ["raw"]
+        assert info["annotations"] == {"project": "alpha"}
+        assert info["number_of_items"] == 1
+        assert info["size_in_bytes"] == 276
+        assert catalog.get_dataset_info(uris["proto"])["number_of_items"] \
+            is None
+
+        with pytest.raises(DtoolCoreKeyError):
+            catalog.get_dataset_info(tmp_uri_fixture + "/missing")
+
+    # The catalog persists and only changed datasets are read again.
+    dataset = DataSet.from_uri(uris["ds-b"])
+    dataset.put_annotation("project", "alphabet")
+    dataset.delete_tag("raw")
+    shutil.rmtree(uri_to_path(uris["proto"]))
+
+    with Catalog(db_path) as catalog:
+        counts = catalog.refresh(tmp_uri_fixture)
+        assert counts == {
+            "added": 0, "updated": 1, "removed": 1, "unchanged": 1,
+            "failed": 0
+        }
+        assert catalog.find_by_tag("raw") == [uris["ds-a"]]
+        assert catalog.find_by_annotation("project", "alphabet") == \
+            [uris["ds-b"]]
+
+
+def test_catalog_path_from_config(tmp_dir_fixture):  # NOQA
+    from dtoolcore.catalog import Catalog
+    from . import tmp_env_var
+
+    db_path = os.path.join(tmp_dir_fixture, "from_env.sqlite")
+    with tmp_env_var("DTOOL_CATALOG_PATH", db_path):
+        with Catalog() as catalog:
+            assert catalog.db_path == db_path
+    assert os.path.isfile(db_path)
+
+
+def test_catalog_refresh_skips_unreadable_datasets(tmp_uri_fixture, tmp_dir_fixture):  # NOQA
+    from dtoolcore import DataSet
+    from dtoolcore.catalog import Catalog
+
+    uris = _create_datasets(tmp_uri_fixture)
+    db_path = os.path.join(tmp_dir_fixture, "catalog.sqlite")
+
+    with Catalog(db_path) as catalog:
+        catalog.refresh(tmp_uri_fixture)
+
+        # A manifest that is being written, or has been corrupted.
+        manifest_path = os.path.join(
+            uri_to_path(uris["ds-a"]),
+            ".dtool",
+            "manifest.json"
+        )
+        with open(manifest_path, "w") as fh:
+            fh.write('{"items": {')
+        dataset = DataSet.from_uri(uris["ds-b"])
+        dataset.put_tag("checked")
+
+        counts = catalog.refresh(tmp_uri_fixture)
+        assert counts == {
+            "added": 0, "updated": 1, "removed": 0, "unchanged": 1,
+            "failed": 1
+        }
+        # The entry of the unreadable dataset is kept.
+        assert catalog.find_by_tag("raw") == sorted(uris.values())
+        assert catalog.find_by_tag("checked") == [uris["ds-b"]]
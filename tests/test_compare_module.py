@@ -136,3 +136,134 @@ def test_diff_content(tmp_uri_fixture):  # NOQA
         DiskStorageBroker.hasher(ds_b.item_content_abspath(identifier))
     )]
     assert diff_content(ds_a, ds_b) == expected
+
+
+def _create_datasets_for_content_diff(base_uri):
+    from dtoolcore import DataSet, DataSetCreator
+
+    uris = []
+    for name, odd_content in [("a", "one"), ("b", "two")]:
+        with DataSetCreator("test_compare_" + name, base_uri) as creator:
+            for i in range(20):
+                content = odd_content if i % 2 else "same"
+                creator.put_item_from_stream(
+                    "{} {}".format(content, i).encode(),
+                    "item_{}.txt".format(i)
+                )
+        uris.append(creator.uri)
+    return [DataSet.from_uri(uri) for uri in uris]
+
+
+def test_diff_content_modes(tmp_uri_fixture):  # NOQA
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    import pytest
+
+    from dtoolcore import DtoolCoreValueError
+    from dtoolcore.utils import generate_identifier
+    from dtoolcore.compare import diff_content, iter_diff_content
+
+    ds_a, ds_b = _create_datasets_for_content_diff(tmp_uri_fixture)
+
+    expected_ids = sorted(
+        generate_identifier("item_{}.txt".format(i)) for i in range(1, 20, 2)
+    )
+    rehashed = diff_content(ds_a, ds_b, num_threads=4)
+    assert [d[0] for d in rehashed] == expected_ids
+
+    assert diff_content(ds_a, ds_b, mode="manifest") == rehashed
+    assert diff_content(ds_a, ds_a, mode="manifest") == []
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        streamed = iter_diff_content(ds_a, ds_b, executor=executor)
+        assert sorted(streamed) == rehashed
+
+    # The manifest mode does not read the item content.
+    def fail(identifier):
+        raise AssertionError("Item content read")
+    ds_a._storage_broker.get_item_abspath = fail
+    assert diff_content(ds_a, ds_b, mode="manifest") == rehashed
+
+    with pytest.raises(DtoolCoreValueError):
+        list(iter_diff_content(ds_a, ds_b, mode="unknown"))
+
+    ds_b._manifest["hash_function"] = "sha256sum_hexdigest"
+    with pytest.raises(DtoolCoreValueError):
+        diff_content(ds_a, ds_b, mode="manifest")
+
+
+def test_iter_diff(tmp_uri_fixture):  # NOQA
+
+    from dtoolcore import DataSet, DataSetCreator
+    from dtoolcore.utils import generate_identifier
+    from dtoolcore.compare import iter_diff
+
+    contents = [
+        {"same.txt": b"same", "size.txt": b"a", "hash.txt": b"x",
+         "only_a.txt": b"a"},
+        {"same.txt": b"same", "size.txt": b"bb", "hash.txt": b"y",
+         "only_b.txt": b"b"},
+    ]
+    datasets = []
+    for i, items in enumerate(contents):
+        with DataSetCreator("test_iter_diff_{}".format(i), tmp_uri_fixture) as creator:  # NOQA
+            for relpath, content in items.items():
+                creator.put_item_from_stream(content, relpath)
+        datasets.append(DataSet.from_uri(creator.uri))
+    ds_a, ds_b = datasets
+
+    assert list(iter_diff(ds_a, ds_a)) == []
+
+    differences = list(iter_diff(ds_a, ds_b))
+    assert [d[0] for d in differences] == sorted(d[0] for d in differences)
+
+    by_kind = dict(((d[0], d[1]), d[2:]) for d in differences)
+    hash_id = generate_identifier("hash.txt")
+    size_id = generate_identifier("size.txt")
+    assert by_kind[(generate_identifier("only_a.txt"), "missing")] == \
+        ("only_a.txt", None)
+    assert by_kind[(generate_identifier("only_b.txt"), "missing")] == \
+        (None, "only_b.txt")
+    assert by_kind[(size_id, "size")] == (1, 2)
+    assert (size_id, "hash") in by_kind
+    assert by_kind[(hash_id, "hash")] == (
+        ds_a.item_properties(hash_id)["hash"],
+        ds_b.item_properties(hash_id)["hash"]
+    )
+    assert (hash_id, "size") not in by_kind
+    assert len(differences) == 5
+
+    # Hashes are not compared if the hash functions differ.
+    ds_b._manifest["hash_function"] = "sha256sum_hexdigest"
+    kinds = [d[1] for d in iter_diff(ds_a, ds_b)]
+    assert "hash" not in kinds
+
+
+def test_merge_diff():
+
+    import pytest
+
+    from dtoolcore import DtoolCoreValueError
+    from dtoolcore.compare import merge_diff
+
+    def item(relpath, size=1, hash_="h"):
+        return {"relpath": relpath, "size_in_bytes": size, "hash": hash_}
+
+    a = [("1", item("x")), ("2", item("y")), ("4", item("z", 2))]
+    b = [("2", item("y2")), ("3", item("w")), ("4", item("z", 3, "g"))]
+
+    # The streams are consumed lazily.
+    differences = merge_diff(iter(a), iter(b))
+    assert next(differences) == ("1", "missing", "x", None)
+    assert list(differences) == [
+        ("2", "relpath", "y", "y2"),
+        ("3", "missing", None, "w"),
+        ("4", "size", 2, 3),
+        ("4", "hash", "h", "g"),
+    ]
+    assert list(merge_diff(a, b, compare_hashes=False))[-1] == \
+        ("4", "size", 2, 3)
+
+    with pytest.raises(DtoolCoreValueError):
+        list(merge_diff(list(reversed(a)), b))
@@ -0,0 +1,185 @@
+"""Test the consolidated metadata snapshot of frozen datasets."""
+
+import os
+import json
+
+import pytest
+
+from . import tmp_uri_fixture  # NOQA
+from . import uri_to_path
+from . import TEST_SAMPLE_DATA
+from . import create_dataset
+
+
+@pytest.fixture(autouse=True)
+def consolidated_metadata_enabled(monkeypatch):
+    monkeypatch.setenv("DTOOL_CONSOLIDATED_METADATA", "true")
+
+
+SNAPSHOT_DATASET = dict(
+    name="snapshot",
+    items={
+        "tiny.png": os.path.join(TEST_SAMPLE_DATA, "tiny.png"),
+        "copy.png": os.path.join(TEST_SAMPLE_DATA, "tiny.png"),
+    },
+    item_metadata={
+        "tiny.png": {"is_copy": False},
+        "copy.png": {"is_copy": True},
+    },
+    annotations={"project": "x"},
+    tags=["raw"],
+    readme_content="---\n",
+)
+
+
+def test_consolidated_metadata_written_on_freeze(tmp_uri_fixture):  # NOQA
+    uri = create_dataset(tmp_uri_fixture, **SNAPSHOT_DATASET).uri
+
+    fpath = os.path.join(uri_to_path(uri), ".dtool", "consolidated.json")
+    with open(fpath) as fh:
+        consolidated = json.load(fh)
+
+    assert consolidated["admin_metadata"]["name"] == "snapshot"
+    assert consolidated["admin_metadata"]["type"] == "dataset"
+    assert consolidated["readme"] == "---\n"
+    assert consolidated["annotations"] == {"project": "x"}
+    assert consolidated["tags"] == ["raw"]
+    assert consolidated["overlay_names"] == ["is_copy"]
+    assert consolidated["number_of_items"] == 2
+    assert consolidated["size_in_bytes"] == 2 * 276
+
+
+def test_consolidated_metadata_optional(tmp_uri_fixture, monkeypatch):  # NOQA
+    from dtoolcore import DataSet
+
+    monkeypatch.delenv("DTOOL_CONSOLIDATED_METADATA")
+    uri = create_dataset(tmp_uri_fixture, **SNAPSHOT_DATASET).uri
+
+    fpath = os.path.join(uri_to_path(uri), ".dtool", "consolidated.json")
+    assert not os.path.exists(fpath)
+
+    dataset = DataSet.from_uri(uri)
+    assert dataset._consolidated_metadata is None
+    assert dataset.get_annotation("project") == "x"
+
+
+def test_dataset_opened_from_consolidated_metadata(tmp_uri_fixture):  # NOQA
+    from dtoolcore import DataSet, DtoolCoreKeyError
+
+    uri = create_dataset(tmp_uri_fixture, **SNAPSHOT_DATASET).uri
+    dataset = DataSet.from_uri(uri)
+    assert dataset._consolidated_metadata is not None
+
+    # No other metadata files are read.
+    def fail(*args, **kwargs):
+        raise AssertionError("Metadata read outside the snapshot")
+    storage_broker = dataset._storage_broker
+    storage_broker.get_text = fail
+
+    assert dataset.name == "snapshot"
+    assert dataset.get_readme_content() == "---\n"
+    assert dataset.get_annotation("project") == "x"
+    assert dataset.get_annotations() == {"project": "x"}
+    assert dataset.list_annotation_names() == ["project"]
+    assert dataset.list_tags() == ["raw"]
+    assert dataset.list_overlay_names() == ["is_copy"]
+    with pytest.raises(DtoolCoreKeyError):
+        dataset.get_annotation("missing")
+    del storage_broker.get_text
+
+    # Single updates delete the snapshot rather than regenerating it.
+    dataset.put_annotation("project", "y")
+    dataset.put_tags(["checked"])
+    assert dataset._consolidated_metadata is None
+    assert dataset.get_annotation("project") == "y"
+    fpath = os.path.join(uri_to_path(uri), ".dtool", "consolidated.json")
+    assert not os.path.exists(fpath)
+
+    reopened = DataSet.from_uri(uri)
+    assert reopened._consolidated_metadata is None
+    assert reopened.get_annotation("project") == "y"
+    assert sorted(reopened.list_tags()) == ["checked", "raw"]
+
+    # The snapshot can be regenerated explicitly.
+    reopened.update_consolidated_metadata()
+    assert DataSet.from_uri(uri)._consolidated_metadata["annotations"] == \
+        {"project": "y"}
+
+
+def test_snapshot_used_for_lifetime_of_instance(tmp_uri_fixture):  # NOQA
+    from dtoolcore import DataSet
+
+    uri = create_dataset(tmp_uri_fixture, **SNAPSHOT_DATASET).uri
+    dataset = DataSet.from_uri(uri)
+    assert dataset._consolidated_metadata is not None
+
+    # The fingerprint is only checked when the dataset is opened.
+    calls = []
+    storage_broker = dataset._storage_broker
+    fingerprint = storage_broker.get_metadata_fingerprint
+
+    def counting_fingerprint():
+        calls.append(1)
+        return fingerprint()
+
+    storage_broker.get_metadata_fingerprint = counting_fingerprint
+    for _ in range(3):
+        assert dataset.get_readme_content() == "---\n"
+        assert dataset.get_annotations() == {"project": "x"}
+        assert dataset.list_tags() == ["raw"]
+        assert dataset.list_overlay_names() == ["is_copy"]
+    assert calls == []
+
+    # Updates through another dataset instance are seen once the dataset is
+    # opened again.
+    other = DataSet.from_uri(uri)
+    other.put_annotation("project", "changed")
+    other.put_tag("other")
+    other.put_readme("---\nchanged: true\n")
+
+    reopened = DataSet.from_uri(uri)
+    assert reopened._consolidated_metadata is None
+    assert reopened.get_annotations() == {"project": "changed"}
+    assert sorted(reopened.list_tags()) == ["other", "raw"]
+    assert reopened.get_readme_content() == "---\nchanged: true\n"
+
+
+def test_updates_do_not_create_snapshot(tmp_uri_fixture):  # NOQA
+    from dtoolcore import DataSet
+
+    uri = create_dataset(tmp_uri_fixture, **SNAPSHOT_DATASET).uri
+    fpath = os.path.join(uri_to_path(uri), ".dtool", "consolidated.json")
+
+    # E.g. a dataset frozen before snapshots were introduced.
+    os.unlink(fpath)
+
+    dataset = DataSet.from_uri(uri)
+    with dataset.metadata_batch():
+        dataset.put_tag("batch")
+    assert not os.path.exists(fpath)
+    assert sorted(dataset.list_tags()) == ["batch", "raw"]
+
+    dataset.update_consolidated_metadata()
+    assert os.path.isfile(fpath)
+
+
+def test_stale_consolidated_metadata_is_ignored(tmp_uri_fixture):  # NOQA
+    from dtoolcore import DataSet
+    from dtoolcore.storagebroker import DiskStorageBroker
+
+    uri = create_dataset(tmp_uri_fixture, **SNAPSHOT_DATASET).uri
+
+    # Changes made without going through a DataSet make the snapshot stale.
+    storage_broker = DiskStorageBroker(uri)
+    storage_broker.put_annotation("project", "changed elsewhere")
+    storage_broker.put_tag("external")
+    assert storage_broker.get_consolidated_metadata() is None
+
+    dataset = DataSet.from_uri(uri)
+    assert dataset._consolidated_metadata is None
+    assert dataset.get_annotation("project") == "changed elsewhere"
+    assert sorted(dataset.list_tags()) == ["external", "raw"]
+
+    consolidated = storage_broker.update_consolidated_metadata()
+    assert consolidated["annotations"] == {"project": "changed elsewhere"}
+    assert storage_broker.get_consolidated_metadata() == consolidated
@@ -216,3 +216,186 @@ def test_copy_resume_fixes_broken_files(tmp_uri_fixture):  # NOQA
 
     assert src_ds.list_overlay_names() == dest_ds.list_overlay_names()
     assert src_ds.get_overlay(overlay) == dest_ds.get_overlay(overlay)
+
+
+def test_copy_concurrent_matches_serial(tmp_uri_fixture):  # NOQA
+
+    import dtoolcore
+
+    for directory in ["src", "serial", "concurrent"]:
+        os.mkdir(os.path.join(uri_to_path(tmp_uri_fixture), directory))
+
+    proto_dataset = dtoolcore.create_proto_dataset(
+        "test_copy",
+        tmp_uri_fixture + "/src"
+    )
+    for fname in os.listdir(TEST_SAMPLE_DATA):
+        item_fpath = os.path.join(TEST_SAMPLE_DATA, fname)
+        proto_dataset.put_item(item_fpath, fname)
+        proto_dataset.put_item(item_fpath, "subdir/" + fname)
+    proto_dataset.freeze()
+    src_ds = dtoolcore.DataSet.from_uri(proto_dataset.uri)
+
+    serial_sizes = []
+    serial_uri = dtoolcore.copy(
+        src_ds.uri,
+        tmp_uri_fixture + "/serial",
+        num_threads=1,
+        progress_callback=serial_sizes.append
+    )
+
+    # Largest items are copied first.
+    assert serial_sizes == sorted(serial_sizes, reverse=True)
+
+    concurrent_sizes = []
+    concurrent_uri = dtoolcore.copy(
+        src_ds.uri,
+        tmp_uri_fixture + "/concurrent",
+        num_threads=4,
+        progress_callback=concurrent_sizes.append
+    )
+
+    total = sum(
+        src_ds.item_properties(i)["size_in_bytes"] for i in src_ds.identifiers
+    )
+    assert sum(serial_sizes) == total
+    assert sum(concurrent_sizes) == total
+
+    serial_ds = dtoolcore.DataSet.from_uri(serial_uri)
+    concurrent_ds = dtoolcore.DataSet.from_uri(concurrent_uri)
+    assert set(serial_ds.identifiers) == set(src_ds.identifiers)
+    assert set(concurrent_ds.identifiers) == set(src_ds.identifiers)
+    for i in src_ds.identifiers:
+        for ds in (serial_ds, concurrent_ds):
+            for key in ("hash", "relpath", "size_in_bytes"):
+                assert ds.item_properties(i)[key] == \
+                    src_ds.item_properties(i)[key]
+
+
+def test_copy_link_mode(tmp_uri_fixture):  # NOQA
+
+    import dtoolcore
+
+    for directory in ["src", "linked", "copied"]:
+        os.mkdir(os.path.join(uri_to_path(tmp_uri_fixture), directory))
+
+    proto_dataset = dtoolcore.create_proto_dataset(
+        "test_copy",
+        tmp_uri_fixture + "/src"
+    )
+    for fname in os.listdir(TEST_SAMPLE_DATA):
+        proto_dataset.put_item(os.path.join(TEST_SAMPLE_DATA, fname), fname)
+    proto_dataset.freeze()
+    src_ds = dtoolcore.DataSet.from_uri(proto_dataset.uri)
+
+    linked_uri = dtoolcore.copy(
+        src_ds.uri,
+        tmp_uri_fixture + "/linked",
+        link=True
+    )
+    linked_ds = dtoolcore.DataSet.from_uri(linked_uri)
+    assert linked_ds.admin_metadata["link_mode"] == "hardlink"
+    assert "link_mode" not in src_ds.admin_metadata
+
+    for i in src_ds.identifiers:
+        src_stat = os.stat(src_ds.item_content_abspath(i))
+        linked_stat = os.stat(linked_ds.item_content_abspath(i))
+        assert src_stat.st_ino == linked_stat.st_ino
+        assert linked_ds.item_properties(i)["hash"] == \
+            src_ds.item_properties(i)["hash"]
+
+    # The link mode is not inherited when copying a linked dataset.
+    copied_uri = dtoolcore.copy(linked_uri, tmp_uri_fixture + "/copied")
+    copied_ds = dtoolcore.DataSet.from_uri(copied_uri)
+    assert "link_mode" not in copied_ds.admin_metadata
+    for i in src_ds.identifiers:
+        src_stat = os.stat(src_ds.item_content_abspath(i))
+        copied_stat = os.stat(copied_ds.item_content_abspath(i))
+        assert src_stat.st_ino != copied_stat.st_ino
+
+
+def test_copy_link_mode_uses_manifest_hashes(tmp_uri_fixture, monkeypatch):  # NOQA
+
+    import dtoolcore
+    from dtoolcore.storagebroker import DiskStorageBroker
+
+    for directory in ["src", "linked"]:
+        os.mkdir(os.path.join(uri_to_path(tmp_uri_fixture), directory))
+
+    proto_dataset = dtoolcore.create_proto_dataset(
+        "test_copy",
+        tmp_uri_fixture + "/src"
+    )
+    for fname in os.listdir(TEST_SAMPLE_DATA):
+        proto_dataset.put_item(os.path.join(TEST_SAMPLE_DATA, fname), fname)
+    proto_dataset.freeze()
+    src_ds = dtoolcore.DataSet.from_uri(proto_dataset.uri)
+
+    # Hardlinked items are neither hashed when they are stored nor when the
+    # copy is frozen.
+    def get_hash(self, handle):
+        raise AssertionError("Linked item {} was hashed".format(handle))
+
+    monkeypatch.setattr(DiskStorageBroker, "get_hash", get_hash)
+    linked_uri = dtoolcore.copy(
+        src_ds.uri,
+        tmp_uri_fixture + "/linked",
+        link=True
+    )
+    monkeypatch.undo()
+
+    linked_ds = dtoolcore.DataSet.from_uri(linked_uri)
+    for i in src_ds.identifiers:
+        assert linked_ds.item_properties(i)["hash"] == \
+            src_ds.item_properties(i)["hash"]
+
+
+def test_copy_link_mode_only_recorded_if_linked(tmp_uri_fixture, monkeypatch):  # NOQA
+
+    import errno
+    import dtoolcore
+
+    for directory in ["src", "dest"]:
+        os.mkdir(os.path.join(uri_to_path(tmp_uri_fixture), directory))
+
+    proto_dataset = dtoolcore.create_proto_dataset(
+        "test_copy",
+        tmp_uri_fixture + "/src"
+    )
+    for fname in os.listdir(TEST_SAMPLE_DATA):
+        proto_dataset.put_item(os.path.join(TEST_SAMPLE_DATA, fname), fname)
+    proto_dataset.freeze()
+
+    def cross_device_link(src, dest):
+        raise OSError(errno.EXDEV, "Cross-device link")
+
+    monkeypatch.setattr(os, "link", cross_device_link)
+    copied_uri = dtoolcore.copy(
+        proto_dataset.uri,
+        tmp_uri_fixture + "/dest",
+        link=True
+    )
+    copied_ds = dtoolcore.DataSet.from_uri(copied_uri)
+    assert "link_mode" not in copied_ds.admin_metadata
+
+
+def test_link_mode_survives_reopening(tmp_uri_fixture):  # NOQA
+
+    import dtoolcore
+
+    proto_dataset = dtoolcore.create_proto_dataset(
+        "test_link",
+        tmp_uri_fixture
+    )
+    fpath = os.path.join(uri_to_path(tmp_uri_fixture), "item.txt")
+    with open(fpath, "w") as fh:
+        fh.write("hello")
+    proto_dataset.put_item(fpath, "item.txt", link=True)
+
+    # E.g. copy_resume opens the proto dataset again before freezing it.
+    reopened = dtoolcore.ProtoDataSet.from_uri(proto_dataset.uri)
+    assert reopened.admin_metadata["link_mode"] == "hardlink"
+    reopened.freeze()
+
+    dataset = dtoolcore.DataSet.from_uri(proto_dataset.uri)
+    assert dataset.admin_metadata["link_mode"] == "hardlink"
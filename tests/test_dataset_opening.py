@@ -0,0 +1,96 @@
+"""Test that opening datasets reads the administrative metadata once."""
+
+import pytest
+
+from . import tmp_uri_fixture  # NOQA
+
+
+class _CountingMixin(object):
+    counts = {"init": 0, "reads": 0}
+
+    def __init__(self, *args, **kwargs):
+        _CountingMixin.counts["init"] += 1
+        super(_CountingMixin, self).__init__(*args, **kwargs)
+
+    def get_admin_metadata(self):
+        _CountingMixin.counts["reads"] += 1
+        return super(_CountingMixin, self).get_admin_metadata()
+
+    def get_consolidated_metadata(self):
+        _CountingMixin.counts["reads"] += 1
+        return super(_CountingMixin, self).get_consolidated_metadata()
+
+
+def _counting_lookup(monkeypatch):
+    import dtoolcore
+    from dtoolcore.storagebroker import DiskStorageBroker
+
+    class CountingDiskStorageBroker(_CountingMixin, DiskStorageBroker):
+        pass
+
+    monkeypatch.setattr(
+        dtoolcore,
+        "_generate_storage_broker_lookup",
+        lambda: {"file": CountingDiskStorageBroker}
+    )
+    _CountingMixin.counts = {"init": 0, "reads": 0}
+    return _CountingMixin.counts
+
+
+def test_from_uri_uses_one_broker_and_one_read(tmp_uri_fixture, monkeypatch):  # NOQA
+    from dtoolcore import create_proto_dataset, DataSet, DtoolCoreTypeError
+
+    monkeypatch.setenv("DTOOL_CONSOLIDATED_METADATA", "true")
+    proto = create_proto_dataset("single_read", tmp_uri_fixture)
+    proto.freeze()
+
+    counts = _counting_lookup(monkeypatch)
+    dataset = DataSet.from_uri(proto.uri)
+    assert dataset.name == "single_read"
+    assert counts == {"init": 1, "reads": 1}
+
+    with pytest.raises(DtoolCoreTypeError):
+        DataSet.from_uri(tmp_uri_fixture + "/does_not_exist")
+
+
+def test_iter_datasets_in_base_uri_reads_once(tmp_uri_fixture, monkeypatch):  # NOQA
+    from dtoolcore import create_proto_dataset, iter_datasets_in_base_uri
+
+    monkeypatch.setenv("DTOOL_CONSOLIDATED_METADATA", "true")
+    for i in range(3):
+        create_proto_dataset("ds_{}".format(i), tmp_uri_fixture).freeze()
+
+    counts = _counting_lookup(monkeypatch)
+    datasets = list(iter_datasets_in_base_uri(tmp_uri_fixture))
+    assert len(datasets) == 3
+    assert counts == {"init": 3, "reads": 3}
+
+
+def test_from_broker_and_from_admin_metadata(tmp_uri_fixture):  # NOQA
+    from dtoolcore import (
+        create_proto_dataset,
+        DataSet,
+        ProtoDataSet,
+        DtoolCoreTypeError,
+    )
+    from dtoolcore.storagebroker import DiskStorageBroker
+
+    proto = create_proto_dataset("constructors", tmp_uri_fixture)
+    storage_broker = DiskStorageBroker(proto.uri)
+
+    from_broker = ProtoDataSet.from_broker(proto.uri, storage_broker)
+    assert from_broker.uuid == proto.uuid
+    assert from_broker._storage_broker is storage_broker
+
+    with pytest.raises(DtoolCoreTypeError):
+        DataSet.from_broker(proto.uri, storage_broker)
+
+    admin_metadata = storage_broker.get_admin_metadata()
+    with pytest.raises(DtoolCoreTypeError):
+        DataSet.from_admin_metadata(proto.uri, admin_metadata)
+
+    proto.freeze()
+    admin_metadata = storage_broker.get_admin_metadata()
+    dataset = DataSet.from_admin_metadata(proto.uri, admin_metadata)
+    assert dataset.uuid == proto.uuid
+    assert len(dataset.identifiers) == 0
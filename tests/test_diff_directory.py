@@ -0,0 +1,164 @@
+"""Test comparing a directory with a dataset."""
+
+import os
+import time
+
+from . import tmp_dir_fixture  # NOQA
+
+
+def _write(fpath, content, mtime=None):
+    dirname = os.path.dirname(fpath)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    with open(fpath, "wb") as fh:
+        fh.write(content)
+    if mtime is not None:
+        os.utime(fpath, (mtime, mtime))
+
+
+def _set_mtime_to_item_timestamp(dataset, directory, relpath):
+    from dtoolcore.utils import generate_identifier
+
+    properties = dataset.item_properties(generate_identifier(relpath))
+    mtime_ns = int(round(properties["utc_timestamp"] * 1e6)) * 1000
+    os.utime(os.path.join(directory, relpath), ns=(mtime_ns, mtime_ns))
+
+
+def _create_directory_and_dataset(tmp_dir):
+    from dtoolcore import DataSetCreator, DataSet
+
+    directory = os.path.join(tmp_dir, "working")
+    base_uri = os.path.join(tmp_dir, "datasets")
+    os.mkdir(base_uri)
+
+    # Files older than the dataset items, as when a directory is ingested.
+    past = time.time() - 3600
+    contents = {
+        "unchanged.txt": b"same",
+        "size.txt": b"size",
+        "content.txt": b"content",
+        "sneaky.txt": b"sneaky",
+        "removed.txt": b"removed",
+        "sub/nested.txt": b"nested",
+    }
+    for relpath, content in contents.items():
+        _write(os.path.join(directory, relpath), content, past)
+
+    with DataSetCreator("diff_directory", base_uri) as creator:
+        for relpath in contents:
+            creator.put_item(os.path.join(directory, relpath), relpath)
+    dataset = DataSet.from_uri(creator.uri)
+
+    future = time.time() + 3600
+    _set_mtime_to_item_timestamp(dataset, directory, "unchanged.txt")
+    _write(os.path.join(directory, "size.txt"), b"larger size", past)
+    # Same size and an old modification time, e.g. restored using "cp -p".
+    _write(os.path.join(directory, "content.txt"), b"CONTENT", past)
+    # Same size and the modification time of the item, only found by
+    # hashing.
+    _write(os.path.join(directory, "sneaky.txt"), b"SNEAKY")
+    _set_mtime_to_item_timestamp(dataset, directory, "sneaky.txt")
+    # Same content, but modified after the item was added.
+    _write(os.path.join(directory, "sub/nested.txt"), b"nested", future)
+    _write(os.path.join(directory, "sub/new.txt"), b"new")
+    os.remove(os.path.join(directory, "removed.txt"))
+
+    return directory, dataset
+
+
+def test_diff_directory(tmp_dir_fixture):  # NOQA
+    from dtoolcore.compare import diff_directory
+
+    directory, dataset = _create_directory_and_dataset(tmp_dir_fixture)
+
+    differences = list(diff_directory(dataset, directory, num_threads=2))
+    assert differences[-1] == ("removed.txt", "removed")
+    assert sorted(differences) == [
+        ("content.txt", "changed"),
+        ("removed.txt", "removed"),
+        ("size.txt", "changed"),
+        ("sneaky.txt", "changed"),
+        ("sub/new.txt", "new"),
+    ]
+
+    assert sorted(diff_directory(dataset, directory, trust_mtime=True)) == [
+        ("content.txt", "changed"),
+        ("removed.txt", "removed"),
+        ("size.txt", "changed"),
+        ("sub/new.txt", "new"),
+    ]
+
+
+def test_diff_directory_only_hashes_ambiguous_files(tmp_dir_fixture, monkeypatch):  # NOQA
+    import dtoolcore.filehasher
+    from dtoolcore.compare import diff_directory
+
+    directory, dataset = _create_directory_and_dataset(tmp_dir_fixture)
+
+    hashed = []
+    hasher = dtoolcore.filehasher.md5sum_hexdigest
+
+    def md5sum_hexdigest(fpath):
+        hashed.append(os.path.relpath(fpath, directory))
+        return hasher(fpath)
+
+    monkeypatch.setattr(
+        dtoolcore.filehasher,
+        "md5sum_hexdigest",
+        md5sum_hexdigest
+    )
+    list(diff_directory(dataset, directory, trust_mtime=True))
+    assert sorted(hashed) == ["content.txt", os.path.join("sub", "nested.txt")]
+
+
+def test_diff_directory_uses_manifest_hash_function(tmp_dir_fixture):  # NOQA
+    import pytest
+    from dtoolcore import DtoolCoreValueError
+    from dtoolcore.compare import diff_directory
+    from dtoolcore.filehasher import FileHasher, sha256sum_hexdigest
+
+    directory, dataset = _create_directory_and_dataset(tmp_dir_fixture)
+    expected = sorted(diff_directory(dataset, directory))
+
+    # The hasher of the storage broker may differ from the one used when
+    # the dataset was created.
+    dataset._storage_broker.hasher = FileHasher(sha256sum_hexdigest)
+    assert sorted(diff_directory(dataset, directory)) == expected
+
+    dataset._manifest["hash_function"] = "no_such_hexdigest"
+    with pytest.raises(DtoolCoreValueError):
+        list(diff_directory(dataset, directory))
+
+
+def test_diff_directory_hash_cache(tmp_dir_fixture, monkeypatch):  # NOQA
+    from dtoolcore.compare import diff_directory
+    from dtoolcore.hashcache import HashCache
+
+    directory, dataset = _create_directory_and_dataset(tmp_dir_fixture)
+    db_path = os.path.join(tmp_dir_fixture, "cache", "hashes.sqlite")
+
+    with HashCache(db_path) as hash_cache:
+        expected = sorted(diff_directory(
+            dataset,
+            directory,
+            hash_cache=hash_cache
+        ))
+
+    def fail(fpath):
+        raise AssertionError("File hashed")
+
+    monkeypatch.setattr("dtoolcore.filehasher.md5sum_hexdigest", fail)
+    with HashCache(db_path) as hash_cache:
+        assert sorted(diff_directory(
+            dataset,
+            directory,
+            hash_cache=hash_cache
+        )) == expected
+
+        # Modified files are hashed again.
+        fpath = os.path.join(directory, "content.txt")
+        stat = os.stat(fpath)
+        os.utime(fpath, (stat.st_atime, stat.st_mtime + 1))
+        assert hash_cache.get(fpath, os.stat(fpath), "md5sum_hexdigest") \
+            is None
+        assert hash_cache.get(fpath, stat, "md5sum_hexdigest") is not None
@@ -46,3 +46,23 @@ def test_FileHasher():
 
     file_hasher = FileHasher(dummy)
     assert file_hasher.name == "dummy"
+
+
+def test_FileHasher_hashlib_hasher():
+    from dtoolcore.filehasher import (
+        FileHasher,
+        md5sum_hexdigest,
+        md5sum_digest,
+        sha256sum_hexdigest,
+    )
+    test_file = os.path.join(TEST_SAMPLE_DATA, 'tiny.png')
+    with open(test_file, "rb") as fh:
+        content = fh.read()
+
+    for func in (md5sum_hexdigest, sha256sum_hexdigest):
+        file_hasher = FileHasher(func)
+        hasher = file_hasher.hashlib_hasher()
+        hasher.update(content)
+        assert hasher.hexdigest() == file_hasher(test_file)
+
+    assert FileHasher(md5sum_digest).hashlib_hasher() is None
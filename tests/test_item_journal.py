@@ -0,0 +1,139 @@
+"""Test the item journal used when copying datasets."""
+
+import os
+
+from . import uri_to_path
+from . import tmp_uri_fixture  # NOQA
+from . import TEST_SAMPLE_DATA
+
+
+def _create_src_dataset(base_uri):
+    import dtoolcore
+
+    proto_dataset = dtoolcore.create_proto_dataset("test_journal", base_uri)
+    for fname in os.listdir(TEST_SAMPLE_DATA):
+        proto_dataset.put_item(os.path.join(TEST_SAMPLE_DATA, fname), fname)
+    proto_dataset.freeze()
+    return dtoolcore.DataSet.from_uri(proto_dataset.uri)
+
+
+def test_copy_content_writes_item_journal(tmp_uri_fixture):  # NOQA
+
+    import dtoolcore
+
+    for directory in ["src", "dest"]:
+        os.mkdir(os.path.join(uri_to_path(tmp_uri_fixture), directory))
+
+    src_ds = _create_src_dataset(tmp_uri_fixture + "/src")
+    dest_proto_ds = dtoolcore._copy_create_proto_dataset(
+        src_ds,
+        tmp_uri_fixture + "/dest"
+    )
+    dtoolcore._copy_content(src_ds, dest_proto_ds, num_threads=2)
+
+    journal = dest_proto_ds._storage_broker.get_item_journal()
+    assert set(journal.keys()) == set(src_ds.identifiers)
+    for i in src_ds.identifiers:
+        assert journal[i]["hash"] == src_ds.item_properties(i)["hash"]
+
+    dest_proto_ds.freeze()
+    assert dest_proto_ds._storage_broker.get_item_journal() == {}
+
+    dest_ds = dtoolcore.DataSet.from_uri(dest_proto_ds.uri)
+    for i in src_ds.identifiers:
+        assert dest_ds.item_properties(i)["hash"] == \
+            src_ds.item_properties(i)["hash"]
+
+
+def test_copy_resume_recopies_unjournaled_items(tmp_uri_fixture):  # NOQA
+
+    import dtoolcore
+    from dtoolcore.utils import generate_identifier
+
+    for directory in ["src", "dest"]:
+        os.mkdir(os.path.join(uri_to_path(tmp_uri_fixture), directory))
+
+    src_ds = _create_src_dataset(tmp_uri_fixture + "/src")
+    dest_proto_ds = dtoolcore._copy_create_proto_dataset(
+        src_ds,
+        tmp_uri_fixture + "/dest"
+    )
+
+    # An item with the right size but torn content.
+    tiny_fpath = os.path.join(TEST_SAMPLE_DATA, "tiny.png")
+    with open(tiny_fpath, "rb") as fh:
+        content = fh.read()
+    torn_fpath = os.path.join(uri_to_path(tmp_uri_fixture), "torn.png")
+    with open(torn_fpath, "wb") as fh:
+        fh.write(b"\0" * len(content))
+    dest_proto_ds.put_item(torn_fpath, "tiny.png")
+
+    dest_uri = dtoolcore.copy_resume(src_ds.uri, tmp_uri_fixture + "/dest")
+    dest_ds = dtoolcore.DataSet.from_uri(dest_uri)
+
+    identifier = generate_identifier("tiny.png")
+    assert dest_ds.item_properties(identifier)["hash"] == \
+        src_ds.item_properties(identifier)["hash"]
+
+
+def test_freeze_uses_current_journal_entries(tmp_uri_fixture):  # NOQA
+
+    import dtoolcore
+    from dtoolcore.utils import generate_identifier
+
+    proto_ds = dtoolcore.create_proto_dataset("test_journal", tmp_uri_fixture)
+    for fname in ["tiny.png", "another_file.txt"]:
+        proto_ds.put_item(os.path.join(TEST_SAMPLE_DATA, fname), fname)
+
+    broker = proto_ds._storage_broker
+    for handle in ["tiny.png", "another_file.txt"]:
+        properties = broker.item_properties(handle)
+        properties["hash"] = "from-journal"
+        broker.add_item_journal_entry(generate_identifier(handle), properties)
+
+    # Modify one of the items after it has been journaled.
+    fpath = broker._fpath_from_handle("another_file.txt")
+    with open(fpath, "a") as fh:
+        fh.write("more")
+
+    proto_ds.freeze()
+    dataset = dtoolcore.DataSet.from_uri(proto_ds.uri)
+
+    tiny_props = dataset.item_properties(generate_identifier("tiny.png"))
+    assert tiny_props["hash"] == "from-journal"
+
+    other_props = dataset.item_properties(
+        generate_identifier("another_file.txt")
+    )
+    assert other_props["hash"] == broker.hasher(fpath)
+
+
+def test_overwriting_item_removes_journal_entry(tmp_uri_fixture):  # NOQA
+
+    import dtoolcore
+    from dtoolcore.utils import generate_identifier
+
+    proto_ds = dtoolcore.create_proto_dataset("test_journal", tmp_uri_fixture)
+    proto_ds.put_item_from_stream(b"old content", "item.txt")
+
+    broker = proto_ds._storage_broker
+    identifier = generate_identifier("item.txt")
+    fpath = broker._fpath_from_handle("item.txt")
+    old_stat = os.stat(fpath)
+    assert broker.get_item_journal_entry(identifier) is not None
+
+    # Overwrite with content of the same size and restore the modification
+    # time, as on file systems with a coarse modification time.
+    new_fpath = os.path.join(uri_to_path(tmp_uri_fixture), "new.txt")
+    with open(new_fpath, "w") as fh:
+        fh.write("new content")
+    proto_ds.put_item(new_fpath, "item.txt")
+    os.utime(fpath, ns=(old_stat.st_atime_ns, old_stat.st_mtime_ns))
+
+    assert broker.get_item_journal_entry(identifier) is None
+    assert identifier not in broker.get_item_journal()
+
+    proto_ds.freeze()
+    dataset = dtoolcore.DataSet.from_uri(proto_ds.uri)
+    assert dataset.item_properties(identifier)["hash"] == \
+        broker.hasher(new_fpath)
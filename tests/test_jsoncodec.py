@@ -0,0 +1,145 @@
+"""Test the JSON codecs used for dataset metadata."""
+
+import pytest
+
+from . import tmp_uri_fixture  # NOQA
+from . import tmp_dir_fixture  # NOQA
+
+
+def test_default_json_codec(monkeypatch):
+    from dtoolcore.jsoncodec import get_json_codec, StdlibJSONCodec
+
+    monkeypatch.delenv("DTOOL_JSON_CODEC", raising=False)
+    codec = get_json_codec()
+    assert isinstance(codec, StdlibJSONCodec)
+    assert codec is get_json_codec("json")
+
+    text = codec.dumps({"b": 1, "a": [1, 2]}, indent=2, sort_keys=True)
+    assert text == '{\n  "a": [\n    1,\n    2\n  ],\n  "b": 1\n}'
+    assert codec.loads(text) == {"a": [1, 2], "b": 1}
+
+
+def test_unknown_json_codec(monkeypatch):
+    from dtoolcore import DtoolCoreValueError
+    from dtoolcore.jsoncodec import get_json_codec
+
+    with pytest.raises(DtoolCoreValueError):
+        get_json_codec("no-such-codec")
+
+    monkeypatch.setenv("DTOOL_JSON_CODEC", "no-such-codec")
+    with pytest.raises(DtoolCoreValueError):
+        get_json_codec()
+
+
+def test_json_codec_setting_memoised(tmp_dir_fixture, monkeypatch):  # NOQA
+    import os
+    import dtoolcore.utils
+    from dtoolcore.jsoncodec import get_json_codec
+
+    config_path = os.path.join(tmp_dir_fixture, "dtool.json")
+    with open(config_path, "w") as fh:
+        fh.write('{"DTOOL_JSON_CODEC": "json"}')
+
+    calls = []
+    get_config_value = dtoolcore.utils.get_config_value
+
+    def counting_get_config_value(*args, **kwargs):
+        calls.append(args)
+        return get_config_value(*args, **kwargs)
+
+    monkeypatch.setattr(
+        "dtoolcore.jsoncodec.get_config_value",
+        counting_get_config_value
+    )
+    monkeypatch.delenv("DTOOL_JSON_CODEC", raising=False)
+    assert get_json_codec(config_path=config_path).name == "json"
+    assert get_json_codec(config_path=config_path).name == "json"
+    assert len(calls) == 1
+
+    # The setting is read again when the environment variable changes.
+    monkeypatch.setenv("DTOOL_JSON_CODEC", "no-such-codec")
+    with pytest.raises(dtoolcore.DtoolCoreValueError):
+        get_json_codec(config_path=config_path)
+    assert len(calls) == 2
+
+
+def test_storage_broker_uses_its_config_path(tmp_dir_fixture, monkeypatch):  # NOQA
+    import os
+    from dtoolcore import DtoolCoreValueError
+    from dtoolcore.storagebroker import DiskStorageBroker
+
+    config_path = os.path.join(tmp_dir_fixture, "dtool.json")
+    with open(config_path, "w") as fh:
+        fh.write('{"DTOOL_JSON_CODEC": "no-such-codec"}')
+
+    monkeypatch.delenv("DTOOL_JSON_CODEC", raising=False)
+    uri = os.path.join(tmp_dir_fixture, "dataset")
+    assert DiskStorageBroker(uri).json_codec.name == "json"
+    with pytest.raises(DtoolCoreValueError):
+        DiskStorageBroker(uri, config_path).json_codec
+
+
+def test_unavailable_json_codec_falls_back(monkeypatch):
+    from dtoolcore.jsoncodec import (
+        get_json_codec,
+        list_json_codecs,
+        OrjsonJSONCodec,
+        StdlibJSONCodec,
+    )
+
+    monkeypatch.setattr(OrjsonJSONCodec, "is_available", classmethod(
+        lambda cls: False
+    ))
+    assert isinstance(get_json_codec("orjson"), StdlibJSONCodec)
+    assert isinstance(get_json_codec("auto"), StdlibJSONCodec)
+    assert "orjson" not in list_json_codecs()
+
+
+def test_orjson_codec():
+    pytest.importorskip("orjson")
+    from dtoolcore.jsoncodec import get_json_codec, OrjsonJSONCodec
+
+    codec = get_json_codec("orjson")
+    assert isinstance(codec, OrjsonJSONCodec)
+    assert isinstance(get_json_codec("auto"), OrjsonJSONCodec)
+
+    stdlib = get_json_codec("json")
+    manifest = {
+        "items": {"b": {"size_in_bytes": 3}, "a": {"size_in_bytes": 1}},
+        "hash_function": "md5sum_hexdigest",
+    }
+    text = codec.dumps(manifest, indent=2, sort_keys=True)
+    assert text == stdlib.dumps(manifest, indent=2, sort_keys=True)
+    assert codec.loads(text) == manifest
+
+    # Values orjson does not handle itself fall back to the standard
+    # library.
+    assert codec.loads(codec.dumps(2 ** 70)) == 2 ** 70
+    assert codec.dumps({1: "a"}) == '{"1":"a"}'
+
+    # Non-ASCII characters are escaped like the standard library does.
+    text = {"label": u"caf\u00e9 \U0001f600"}
+    assert codec.dumps(text) == '{"label":"caf\\u00e9 \\ud83d\\ude00"}'
+    assert codec.dumps(text, indent=2) == stdlib.dumps(text, indent=2)
+    nan = codec.loads('{"value": NaN}')["value"]
+    assert nan != nan
+    with pytest.raises(ValueError):
+        codec.loads("not json")
+
+
+def test_datasets_written_with_orjson_are_readable(tmp_uri_fixture, monkeypatch):  # NOQA
+    pytest.importorskip("orjson")
+    from dtoolcore import DataSetCreator, DataSet
+
+    monkeypatch.setenv("DTOOL_JSON_CODEC", "orjson")
+    with DataSetCreator("orjson", tmp_uri_fixture) as creator:
+        handle = creator.put_item_from_stream(b"hello", "hello.txt")
+        creator.add_item_metadata(handle, "label", "café")
+        creator.put_annotation("project", {"name": "café"})
+
+    monkeypatch.setenv("DTOOL_JSON_CODEC", "json")
+    dataset = DataSet.from_uri(creator.uri)
+    assert dataset._storage_broker.json_codec.name == "json"
+    assert len(dataset.identifiers) == 1
+    assert list(dataset.get_overlay("label").values()) == ["café"]
+    assert dataset.get_annotation("project") == {"name": "café"}
@@ -0,0 +1,146 @@
+"""Test the Merkle roots of datasets."""
+
+import pytest
+
+from . import tmp_uri_fixture  # NOQA
+from . import create_dataset
+
+
+ITEMS = {
+    "README.txt": b"top",
+    "plate_1/a.txt": b"a",
+    "plate_1/b.txt": b"b",
+    "plate_2/c.txt": b"c",
+    "plate_2/raw/d.txt": b"d",
+}
+
+
+def test_merkle_tree():
+    from dtoolcore.merkle import MerkleTree, DIRECTORY, FILE
+
+    entries = [
+        ("x.txt", "h1", 1),
+        ("sub/y.txt", "h2", 2),
+        ("sub/deep/z.txt", "h3", 3),
+    ]
+    tree = MerkleTree.from_items(entries)
+    assert MerkleTree.from_items(reversed(entries)).root == tree.root
+
+    children = tree.children("")
+    assert children["x.txt"][0] == FILE
+    assert children["sub"] == (DIRECTORY, tree.digest("sub"))
+    assert tree.children("sub")["deep"] == \
+        (DIRECTORY, tree.digest("sub/deep"))
+
+    # Changing the hash, size or name of any item changes the root.
+    for changed in [
+            ("sub/deep/z.txt", "other", 3),
+            ("sub/deep/z.txt", "h3", 4),
+            ("sub/deep/renamed.txt", "h3", 3)]:
+        other = MerkleTree.from_items(entries[:2] + [changed])
+        assert other.root != tree.root
+        assert other.children("")["x.txt"] == children["x.txt"]
+
+    with pytest.raises(KeyError):
+        tree.children("missing")
+
+
+def test_merkle_root_stored_on_freeze(tmp_uri_fixture):  # NOQA
+    from dtoolcore.merkle import MerkleTree, StoredMerkleTree, merkle_root
+
+    dataset = create_dataset(tmp_uri_fixture, "merkle", ITEMS)
+    manifest = dataset._storage_broker.get_manifest()
+    assert manifest["merkle_root"] == merkle_root(manifest)
+
+    tree = MerkleTree.from_manifest(manifest)
+    assert manifest["merkle_directories"] == tree.directory_digests()
+    assert sorted(manifest["merkle_directories"]) == \
+        ["", "plate_1", "plate_2", "plate_2/raw"]
+
+    stored = StoredMerkleTree.from_manifest(manifest)
+    assert stored.root == tree.root
+    for path in manifest["merkle_directories"]:
+        assert stored.children(path) == tree.children(path)
+    with pytest.raises(KeyError):
+        stored.children("missing")
+
+
+def test_merkle_roots_equal_and_diff_subtrees(tmp_uri_fixture):  # NOQA
+    from dtoolcore import DtoolCoreValueError
+    from dtoolcore.compare import merkle_roots_equal, diff_subtrees
+
+    ds_a = create_dataset(tmp_uri_fixture, "merkle_a", ITEMS)
+    ds_same = create_dataset(tmp_uri_fixture, "merkle_same", ITEMS)
+
+    changed = dict(ITEMS)
+    changed["plate_2/raw/d.txt"] = b"changed"
+    del changed["plate_1/b.txt"]
+    del changed["plate_1/a.txt"]
+    changed["plate_3/e.txt"] = b"e"
+    ds_b = create_dataset(tmp_uri_fixture, "merkle_b", changed)
+
+    assert merkle_roots_equal(ds_a, ds_same)
+    assert not merkle_roots_equal(ds_a, ds_b)
+    assert list(diff_subtrees(ds_a, ds_same)) == []
+
+    differences = dict(
+        (path, (a_digest is not None, b_digest is not None))
+        for path, a_digest, b_digest in diff_subtrees(ds_a, ds_b)
+    )
+    assert differences == {
+        "plate_1/": (True, False),
+        "plate_3/": (False, True),
+        "plate_2/raw/d.txt": (True, True),
+    }
+
+    # Datasets frozen without stored Merkle digests are handled.
+    del ds_same._manifest["merkle_root"]
+    del ds_same._manifest["merkle_directories"]
+    assert merkle_roots_equal(ds_a, ds_same)
+    del ds_b._manifest["merkle_directories"]
+    assert dict(
+        (path, (a_digest is not None, b_digest is not None))
+        for path, a_digest, b_digest in diff_subtrees(ds_a, ds_b)
+    ) == differences
+
+    ds_b._manifest["hash_function"] = "sha256sum_hexdigest"
+    with pytest.raises(DtoolCoreValueError):
+        merkle_roots_equal(ds_a, ds_b)
+
+
+def test_diff_subtrees_only_descends_into_differing_directories(tmp_uri_fixture, monkeypatch):  # NOQA
+    import dtoolcore.merkle
+    from dtoolcore.merkle import StoredMerkleTree
+    from dtoolcore.compare import diff_subtrees
+
+    ds_a = create_dataset(tmp_uri_fixture, "merkle_a", ITEMS)
+    changed = dict(ITEMS)
+    changed["plate_1/a.txt"] = b"changed"
+    ds_b = create_dataset(tmp_uri_fixture, "merkle_b", changed)
+
+    visited = []
+    children = StoredMerkleTree.children
+
+    def recording_children(self, path):
+        visited.append(path)
+        return children(self, path)
+
+    digested = []
+    item_digest = dtoolcore.merkle._item_digest
+
+    def recording_item_digest(name, item_hash, size_in_bytes):
+        digested.append(name)
+        return item_digest(name, item_hash, size_in_bytes)
+
+    monkeypatch.setattr(StoredMerkleTree, "children", recording_children)
+    monkeypatch.setattr(
+        dtoolcore.merkle,
+        "_item_digest",
+        recording_item_digest
+    )
+    differences = list(diff_subtrees(ds_a, ds_b))
+
+    assert [d[0] for d in differences] == ["plate_1/a.txt"]
+    assert sorted(set(visited)) == ["", "plate_1"]
+    # Only the items in the visited directories are digested.
+    assert sorted(set(digested)) == ["README.txt", "a.txt", "b.txt"]
@@ -0,0 +1,148 @@
+"""Test batching of metadata writes."""
+
+import pytest
+
+from . import tmp_uri_fixture  # NOQA
+from . import create_dataset
+
+
+ITEMS = dict(
+    ("item_{}.txt".format(i), str(i).encode()) for i in range(4)
+)
+
+
+def test_metadata_batch(tmp_uri_fixture):  # NOQA
+    from dtoolcore import DataSet
+
+    dataset = create_dataset(
+        tmp_uri_fixture,
+        "batch",
+        ITEMS,
+        annotations={"stale": "remove me"},
+        tags=["stale"],
+    )
+    overlay = dict((i, len(i)) for i in dataset.identifiers)
+
+    with dataset.metadata_batch():
+        for i in range(10):
+            dataset.put_annotation("annotation-{}".format(i), i)
+        dataset.put_annotations({"project": "x", "stale": "kept"})
+        dataset.delete_annotation("stale")
+        dataset.put_tags(["a", "b"])
+        dataset.put_tag("c")
+        dataset.delete_tags(["b", "stale"])
+        dataset.put_overlay("length", overlay)
+        dataset.put_overlay("counts", overlay, columnar=True)
+
+        # Nothing is written until the batch exits.
+        assert dataset._storage_broker.list_annotation_names() == ["stale"]
+        assert dataset.list_tags() == ["stale"]
+        assert dataset.list_overlay_names() == []
+
+    expected_annotations = dict(
+        ("annotation-{}".format(i), i) for i in range(10)
+    )
+    expected_annotations["project"] = "x"
+
+    for ds in (dataset, DataSet.from_uri(dataset.uri)):
+        assert ds.get_annotations() == expected_annotations
+        assert sorted(ds.list_tags()) == ["a", "c"]
+        assert ds.list_overlay_names() == ["counts", "length"]
+        assert ds.get_overlay("length") == overlay
+        assert ds.get_overlay_column("counts").to_dict() == overlay
+
+    assert dataset._storage_broker.get_overlay_column("counts") is not None
+
+
+def test_metadata_batch_reads_identifiers_once(tmp_uri_fixture):  # NOQA
+    dataset = create_dataset(
+        tmp_uri_fixture,
+        "batch",
+        ITEMS,
+        annotations={"stale": "remove me"},
+        tags=["stale"],
+    )
+    overlay = dict((i, True) for i in dataset.identifiers)
+
+    calls = []
+    original = dataset._identifiers
+
+    def counting_identifiers():
+        calls.append(1)
+        return original()
+
+    dataset._identifiers = counting_identifiers
+    with dataset.metadata_batch():
+        for i in range(5):
+            dataset.put_overlay("overlay-{}".format(i), overlay)
+    assert len(calls) == 1
+    assert len(dataset.list_overlay_names()) == 5
+
+
+def test_metadata_batch_validation_and_exceptions(tmp_uri_fixture):  # NOQA
+    from dtoolcore import DtoolCoreInvalidNameError, DtoolCoreValueError
+
+    dataset = create_dataset(
+        tmp_uri_fixture,
+        "batch",
+        ITEMS,
+        annotations={"stale": "remove me"},
+        tags=["stale"],
+    )
+
+    # Invalid values are rejected straight away.
+    with dataset.metadata_batch():
+        with pytest.raises(DtoolCoreInvalidNameError):
+            dataset.put_annotation("not valid", 1)
+        with pytest.raises(DtoolCoreValueError):
+            dataset.put_overlay("partial", {"missing": 1})
+        dataset.put_annotation("valid", 1)
+    assert dataset.get_annotation("valid") == 1
+
+    # Nothing is written if the batch exits with an exception.
+    with pytest.raises(RuntimeError):
+        with dataset.metadata_batch():
+            dataset.put_annotation("discarded", 1)
+            dataset.put_tag("discarded")
+            raise RuntimeError()
+    assert "discarded" not in dataset.list_annotation_names()
+    assert "discarded" not in dataset.list_tags()
+
+    # Nested batches are committed with the outermost batch.
+    with dataset.metadata_batch():
+        with dataset.metadata_batch():
+            dataset.put_tag("nested")
+        assert "nested" not in dataset.list_tags()
+    assert "nested" in dataset.list_tags()
+
+
+def test_metadata_batch_consolidates_once(tmp_uri_fixture, monkeypatch):  # NOQA
+    from dtoolcore import DataSet
+
+    monkeypatch.setenv("DTOOL_CONSOLIDATED_METADATA", "true")
+    dataset = create_dataset(
+        tmp_uri_fixture,
+        "batch",
+        ITEMS,
+        annotations={"stale": "remove me"},
+        tags=["stale"],
+    )
+
+    calls = []
+    broker = dataset._storage_broker
+    original = broker.update_consolidated_metadata
+
+    def counting_update(**kwargs):
+        calls.append(1)
+        return original(**kwargs)
+
+    broker.update_consolidated_metadata = counting_update
+    with dataset.metadata_batch():
+        for i in range(5):
+            dataset.put_annotation("annotation-{}".format(i), i)
+            dataset.put_tag("tag-{}".format(i))
+    assert len(calls) == 1
+
+    reopened = DataSet.from_uri(dataset.uri)
+    assert reopened._consolidated_metadata is not None
+    assert len(reopened.list_tags()) == 6
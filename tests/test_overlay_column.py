@@ -0,0 +1,143 @@
+"""Test array backed overlay columns."""
+
+import os
+
+import pytest
+
+from . import tmp_uri_fixture  # NOQA
+from . import uri_to_path
+from . import create_dataset
+
+
+ITEMS = dict(
+    ("item_{}.txt".format(i), str(i).encode()) for i in range(5)
+)
+ITEM_METADATA = dict(
+    ("item_{}.txt".format(i), {
+        "is_even": i % 2 == 0,
+        "plate": i // 2,
+        "intensity": i / 10.0,
+        "name": "item_{}.txt".format(i),
+    })
+    for i in range(5)
+)
+
+
+def test_get_overlay_column(tmp_uri_fixture):  # NOQA
+    from dtoolcore import DtoolCoreKeyError, DtoolCoreTypeError
+
+    dataset = create_dataset(
+        tmp_uri_fixture, "columns", ITEMS, ITEM_METADATA
+    )
+
+    for overlay_name, typecode in [
+            ("is_even", "b"),
+            ("plate", "q"),
+            ("intensity", "d")]:
+        column = dataset.get_overlay_column(overlay_name)
+        assert column.typecode == typecode
+        assert len(column) == 5
+        assert list(column) == sorted(dataset.identifiers)
+        assert column.to_dict() == dataset.get_overlay(overlay_name)
+
+    column = dataset.get_overlay_column("is_even")
+    for identifier in dataset.identifiers:
+        expected = dataset.item_properties(identifier)["relpath"] in (
+            "item_0.txt", "item_2.txt", "item_4.txt")
+        assert column[identifier] is expected
+
+    with pytest.raises(DtoolCoreKeyError):
+        column["missing"]
+
+    with pytest.raises(DtoolCoreKeyError):
+        dataset.get_overlay_column("missing")
+
+    with pytest.raises(DtoolCoreTypeError):
+        dataset.get_overlay_column("name")
+
+
+def test_overlay_columns_are_persisted_and_refreshed(tmp_uri_fixture):  # NOQA
+    from dtoolcore import DataSet
+
+    dataset = create_dataset(
+        tmp_uri_fixture, "columns", ITEMS, ITEM_METADATA
+    )
+    dataset.get_overlay_column("intensity")
+
+    column_dir = os.path.join(
+        uri_to_path(dataset.uri),
+        ".dtool",
+        "overlay_columns"
+    )
+    assert os.path.isfile(os.path.join(column_dir, "intensity.json"))
+    assert os.path.isfile(os.path.join(column_dir, "intensity.bin"))
+
+    # A new dataset instance uses the persisted column rather than the
+    # overlay.
+    reopened = DataSet.from_uri(dataset.uri)
+
+    def fail(overlay_name):
+        raise AssertionError("Overlay read")
+    reopened._storage_broker.get_overlay = fail
+    column = reopened.get_overlay_column("intensity")
+    assert column.to_dict() == dataset.get_overlay("intensity")
+    del reopened._storage_broker.get_overlay
+
+    # Updating the overlay invalidates the column.
+    overlay = dict((i, 100.5) for i in reopened.identifiers)
+    reopened.put_overlay("intensity", overlay)
+    assert reopened.get_overlay_column("intensity").to_dict() == overlay
+    assert DataSet.from_uri(dataset.uri).get_overlay_column(
+        "intensity").to_dict() == overlay
+
+
+def test_put_overlay_columnar(tmp_uri_fixture):  # NOQA
+    from dtoolcore import DtoolCoreTypeError
+
+    dataset = create_dataset(
+        tmp_uri_fixture, "columns", ITEMS, ITEM_METADATA
+    )
+
+    overlay = dict((i, 7) for i in dataset.identifiers)
+    dataset.put_overlay("counts", overlay, columnar=True)
+    persisted = dataset._storage_broker.get_overlay_column("counts")
+    assert persisted["typecode"] == "q"
+    assert dataset.get_overlay_column("counts").to_dict() == overlay
+
+    # Overlays that cannot be stored as a column are not stored at all.
+    overlay = dict((i, "text") for i in dataset.identifiers)
+    with pytest.raises(DtoolCoreTypeError):
+        dataset.put_overlay("labels", overlay, columnar=True)
+    assert "labels" not in dataset.list_overlay_names()
+
+
+def test_overlay_column_from_bytes():
+    import array
+    import sys
+    from dtoolcore.overlaycolumn import OverlayColumn
+
+    identifiers = ["a", "b", "c"]
+    column = OverlayColumn.from_overlay(
+        {"a": 1, "b": 2.5, "c": 3},
+        identifiers
+    )
+    assert column.typecode == "d"
+
+    copied = OverlayColumn.from_bytes(
+        identifiers,
+        column.typecode,
+        column.to_bytes()
+    )
+    assert copied.to_dict() == {"a": 1.0, "b": 2.5, "c": 3.0}
+
+    # Data written on a machine with the other byte order is swapped.
+    swapped = array.array("d", column.values)
+    swapped.byteswap()
+    other = "big" if sys.byteorder == "little" else "little"
+    copied = OverlayColumn.from_bytes(
+        identifiers,
+        "d",
+        swapped.tobytes(),
+        other
+    )
+    assert copied.to_dict() == {"a": 1.0, "b": 2.5, "c": 3.0}
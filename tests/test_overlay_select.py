@@ -0,0 +1,100 @@
+"""Test selecting items by overlay value."""
+
+import os
+
+import pytest
+
+from . import tmp_uri_fixture  # NOQA
+from . import uri_to_path
+from . import create_dataset
+
+
+ITEMS = dict(
+    ("item_{}.txt".format(i), str(i).encode()) for i in range(10)
+)
+ITEM_METADATA = dict(
+    ("item_{}.txt".format(i), {
+        "is_even": i % 2 == 0,
+        "plate": i // 3,
+        "intensity": i / 10.0,
+    })
+    for i in range(10)
+)
+
+
+def _ids(dataset, *numbers):
+    from dtoolcore.utils import generate_identifier
+    return set(generate_identifier("item_{}.txt".format(i)) for i in numbers)
+
+
+def test_select(tmp_uri_fixture):  # NOQA
+    from dtoolcore import DtoolCoreKeyError
+    from dtoolcore.overlayindex import Eq, In, Range
+
+    dataset = create_dataset(
+        tmp_uri_fixture, "select", ITEMS, ITEM_METADATA
+    )
+
+    assert dataset.select(is_even=True) == _ids(dataset, 0, 2, 4, 6, 8)
+    assert dataset.select(plate=In([0, 3])) == _ids(dataset, 0, 1, 2, 9)
+    assert dataset.select(plate=Eq(1.0)) == _ids(dataset, 3, 4, 5)
+    assert dataset.select(intensity=Range(0.25, 0.5)) == \
+        _ids(dataset, 3, 4, 5)
+    assert dataset.select(intensity=Range(maximum=0.1)) == _ids(dataset, 0, 1)
+    assert dataset.select(
+        {"is_even": False},
+        plate=In([1, 2]),
+        intensity=Range(minimum=0.4)
+    ) == _ids(dataset, 5, 7)
+    assert dataset.select(is_even=True, plate=99) == set()
+    assert dataset.select() == set(dataset.identifiers)
+
+    with pytest.raises(DtoolCoreKeyError):
+        dataset.select(missing=True)
+
+
+def test_select_indexes_are_persisted_and_refreshed(tmp_uri_fixture):  # NOQA
+    from dtoolcore import DataSet
+
+    dataset = create_dataset(
+        tmp_uri_fixture, "select", ITEMS, ITEM_METADATA
+    )
+    dataset.select(plate=0)
+
+    index_fpath = os.path.join(
+        uri_to_path(dataset.uri),
+        ".dtool",
+        "overlay_indexes",
+        "plate.json"
+    )
+    assert os.path.isfile(index_fpath)
+    assert dataset._storage_broker.get_overlay_index("plate") is not None
+
+    # A new dataset instance uses the persisted index rather than the overlay.
+    reopened = DataSet.from_uri(dataset.uri)
+
+    def fail(overlay_name):
+        raise AssertionError("Overlay read")
+    reopened._storage_broker.get_overlay = fail
+    assert reopened.select(plate=0) == _ids(reopened, 0, 1, 2)
+    del reopened._storage_broker.get_overlay
+
+    # Updating the overlay invalidates the index.
+    overlay = dict((i, 0) for i in reopened.identifiers)
+    reopened.put_overlay("plate", overlay)
+    assert reopened.select(plate=0) == set(reopened.identifiers)
+    assert DataSet.from_uri(dataset.uri).select(plate=0) == \
+        set(reopened.identifiers)
+
+
+def test_overlay_index_round_trip():
+    from dtoolcore.overlayindex import OverlayIndex
+
+    overlay = {"a": 1, "b": "x", "c": 2.5, "d": None, "e": True}
+    index = OverlayIndex.from_overlay(overlay)
+    copied = OverlayIndex.from_dict(index.to_dict())
+    assert copied.eq("x") == {"b"}
+    assert copied.eq(None) == {"d"}
+    assert copied.eq(True) == {"e"}
+    assert copied.eq(1) == {"a"}
+    assert copied.range(0, 10) == {"a", "c"}
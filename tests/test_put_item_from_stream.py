@@ -0,0 +1,83 @@
+"""Test adding items to datasets from streams."""
+
+import io
+import os
+
+from . import tmp_uri_fixture  # NOQA
+from . import tmp_dir_fixture  # NOQA
+
+
+def test_put_item_from_stream(tmp_uri_fixture):  # NOQA
+    from dtoolcore import DataSet, create_proto_dataset
+    from dtoolcore.utils import generate_identifier
+
+    proto = create_proto_dataset("streamed", tmp_uri_fixture)
+    proto.put_item_from_stream(io.BytesIO(b"hello"), "greeting.txt")
+    proto.put_item_from_stream(b"world", "sub/dir/planet.txt")
+
+    journal = proto._storage_broker.get_item_journal()
+    identifier = generate_identifier("greeting.txt")
+    assert journal[identifier]["hash"] == "5d41402abc4b2a76b9719d911017c592"
+    assert journal[identifier]["size_in_bytes"] == 5
+
+    proto.freeze()
+
+    dataset = DataSet.from_uri(proto.uri)
+    assert len(dataset.identifiers) == 2
+    with open(dataset.item_content_abspath(identifier), "rb") as fh:
+        assert fh.read() == b"hello"
+    props = dataset.item_properties(generate_identifier("sub/dir/planet.txt"))
+    assert props["relpath"] == "sub/dir/planet.txt"
+    assert props["hash"] == "7d793037a0760186574b0282f2f435e7"
+
+
+def test_base_storage_broker_put_item_from_stream(tmp_dir_fixture):  # NOQA
+    from dtoolcore.storagebroker import BaseStorageBroker
+
+    class RecordingStorageBroker(BaseStorageBroker):
+        def __init__(self):
+            self.stored = {}
+
+        def put_item(self, fpath, relpath):
+            with open(fpath, "rb") as fh:
+                self.stored[relpath] = fh.read()
+            return relpath
+
+    broker = RecordingStorageBroker()
+    assert broker.put_item_from_stream(b"content", "a.txt") == "a.txt"
+    assert broker.stored == {"a.txt": b"content"}
+
+
+def test_dataset_creator_put_item_from_stream(tmp_uri_fixture):  # NOQA
+    from dtoolcore import DataSet, DataSetCreator
+
+    with DataSetCreator("creator", tmp_uri_fixture) as creator:
+        creator.put_item_from_stream(b"abc", "abc.txt")
+
+    dataset = DataSet.from_uri(creator.uri)
+    assert [p["relpath"] for p in dataset._manifest["items"].values()] == \
+        ["abc.txt"]
+
+
+def test_dedup_put_item_from_stream(tmp_dir_fixture):  # NOQA
+    from dtoolcore import DataSet, create_proto_dataset
+    from dtoolcore.utils import generate_identifier, IS_WINDOWS
+
+    if IS_WINDOWS:
+        return
+
+    base_uri = "dedup://" + tmp_dir_fixture
+    uris = []
+    for name in ("first", "second"):
+        proto = create_proto_dataset(name, base_uri)
+        proto.put_item_from_stream(b"shared", "shared.txt")
+        proto.freeze()
+        uris.append(proto.uri)
+
+    identifier = generate_identifier("shared.txt")
+    fpaths = [
+        DataSet.from_uri(uri).item_content_abspath(identifier) for uri in uris
+    ]
+    assert os.path.samefile(fpaths[0], fpaths[1])
+    with open(fpaths[0], "rb") as fh:
+        assert fh.read() == b"shared"
@@ -0,0 +1,53 @@
+"""Test the cached storage broker lookup."""
+
+from . import tmp_dir_fixture  # NOQA
+
+
+def test_storage_broker_lookup_is_cached(monkeypatch):
+    import dtoolcore
+
+    calls = []
+    original = dtoolcore._load_storage_broker_entry_points
+
+    def counting_load():
+        calls.append(1)
+        return original()
+
+    monkeypatch.setattr(
+        dtoolcore,
+        "_load_storage_broker_entry_points",
+        counting_load
+    )
+    monkeypatch.setattr(dtoolcore, "_STORAGE_BROKER_LOOKUP", None)
+
+    for _ in range(3):
+        lookup = dtoolcore._generate_storage_broker_lookup()
+    assert len(calls) == 1
+    assert "file" in lookup
+
+    refreshed = dtoolcore.refresh_storage_broker_lookup()
+    assert len(calls) == 2
+    assert "file" in refreshed
+
+
+def test_register_storage_broker(tmp_dir_fixture, monkeypatch):  # NOQA
+    import dtoolcore
+    from dtoolcore.storagebroker import DiskStorageBroker
+
+    class MemoDiskStorageBroker(DiskStorageBroker):
+        key = "memo"
+
+    monkeypatch.setattr(dtoolcore, "_REGISTERED_STORAGE_BROKERS", {})
+    monkeypatch.setattr(dtoolcore, "_STORAGE_BROKER_LOOKUP", None)
+
+    dtoolcore.register_storage_broker(MemoDiskStorageBroker)
+
+    proto = dtoolcore.create_proto_dataset(
+        "registered",
+        "memo://" + tmp_dir_fixture
+    )
+    assert proto.uri.startswith("memo://")
+    assert isinstance(proto._storage_broker, MemoDiskStorageBroker)
+
+    # Registered storage brokers survive a refresh of the lookup.
+    assert "memo" in dtoolcore.refresh_storage_broker_lookup()
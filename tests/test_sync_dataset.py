@@ -0,0 +1,97 @@
+"""Test the dtoolcore.sync function."""
+
+import os
+
+from . import uri_to_path
+from . import tmp_uri_fixture  # NOQA
+from . import TEST_SAMPLE_DATA
+from . import create_dataset
+
+
+def test_sync_reuses_reference_items(tmp_uri_fixture, monkeypatch):  # NOQA
+
+    import dtoolcore
+    from dtoolcore.storagebroker import DiskStorageBroker
+    from dtoolcore.utils import generate_identifier
+
+    for directory in ["src", "dest"]:
+        os.mkdir(os.path.join(uri_to_path(tmp_uri_fixture), directory))
+
+    v1_items = {
+        fname: os.path.join(TEST_SAMPLE_DATA, fname)
+        for fname in os.listdir(TEST_SAMPLE_DATA)
+    }
+    v1 = create_dataset(tmp_uri_fixture + "/src", "v1", v1_items)
+
+    changed_fpath = os.path.join(uri_to_path(tmp_uri_fixture), "changed.txt")
+    with open(changed_fpath, "w") as fh:
+        fh.write("changed content")
+    v2_items = dict(v1_items)
+    v2_items["tiny.png"] = changed_fpath
+    v2_items["renamed/random_bytes"] = v1_items["random_bytes"]
+    v2 = create_dataset(tmp_uri_fixture + "/src", "v2", v2_items)
+
+    # The previous version is already present at the destination.
+    reference_uri = dtoolcore.copy(v1.uri, tmp_uri_fixture + "/dest")
+    reference = dtoolcore.DataSet.from_uri(reference_uri)
+
+    hashed = []
+    get_hash = DiskStorageBroker.get_hash
+
+    def recording_get_hash(self, handle):
+        hashed.append(handle)
+        return get_hash(self, handle)
+
+    monkeypatch.setattr(DiskStorageBroker, "get_hash", recording_get_hash)
+    transferred = []
+    dest_uri = dtoolcore.sync(
+        v2.uri,
+        tmp_uri_fixture + "/dest",
+        reference_uri=reference_uri,
+        progress_callback=transferred.append
+    )
+    monkeypatch.undo()
+
+    # Only the item transferred from the source is hashed, the hashes of the
+    # reused items are taken from the manifest.
+    assert hashed == ["tiny.png"]
+    dest = dtoolcore.DataSet.from_uri(dest_uri)
+
+    assert set(dest.identifiers) == set(v2.identifiers)
+    for i in v2.identifiers:
+        assert dest.item_properties(i)["hash"] == v2.item_properties(i)["hash"]
+
+    def inode(dataset, relpath):
+        abspath = dataset.item_content_abspath(generate_identifier(relpath))
+        return os.stat(abspath).st_ino
+
+    # Unchanged items, also under a new name, are linked to the reference.
+    assert inode(dest, "another_file.txt") == \
+        inode(reference, "another_file.txt")
+    assert inode(dest, "renamed/random_bytes") == \
+        inode(reference, "random_bytes")
+
+    # Changed items are transferred from the source.
+    assert inode(dest, "tiny.png") != inode(reference, "tiny.png")
+    assert inode(dest, "tiny.png") != inode(v2, "tiny.png")
+
+
+def test_sync_without_reference(tmp_uri_fixture):  # NOQA
+
+    import dtoolcore
+
+    for directory in ["src", "dest"]:
+        os.mkdir(os.path.join(uri_to_path(tmp_uri_fixture), directory))
+
+    items = {
+        fname: os.path.join(TEST_SAMPLE_DATA, fname)
+        for fname in os.listdir(TEST_SAMPLE_DATA)
+    }
+    src = create_dataset(tmp_uri_fixture + "/src", "src", items)
+
+    dest_uri = dtoolcore.sync(src.uri, tmp_uri_fixture + "/dest")
+    dest = dtoolcore.DataSet.from_uri(dest_uri)
+    assert "link_mode" not in dest.admin_metadata
+    for i in src.identifiers:
+        assert dest.item_properties(i)["hash"] == \
+            src.item_properties(i)["hash"]
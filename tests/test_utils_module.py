@@ -4,6 +4,8 @@ import os
 import sys
 import json
 
+import pytest
+
 try:
     from unittest.mock import MagicMock
 except ImportError:
@@ -241,3 +243,211 @@ def test_handle_to_osrelpath():
     assert handle_to_osrelpath(
         "subdir/test.txt",
         is_windows=True) == "subdir\\test.txt"
+
+
+def test_config_value_is_true():
+    from dtoolcore.utils import config_value_is_true
+    assert config_value_is_true(True)
+    assert config_value_is_true("true")
+    assert config_value_is_true("Yes")
+    assert config_value_is_true("1")
+    assert not config_value_is_true(False)
+    assert not config_value_is_true("false")
+    assert not config_value_is_true("0")
+
+
+def test_get_io_hints(tmp_dir_fixture):  # NOQA
+    from dtoolcore.utils import get_io_hints
+
+    config_path = os.path.join(tmp_dir_fixture, "dtool.json")
+    assert get_io_hints(config_path) == (True, False)
+
+    with tmp_env_var("DTOOL_IO_HINTS", "false"):
+        with tmp_env_var("DTOOL_IO_DROP_CACHE", "true"):
+            assert get_io_hints(config_path) == (False, True)
+
+
+def test_get_io_hints_is_memoised(tmp_dir_fixture, monkeypatch):  # NOQA
+    import json
+    import dtoolcore.utils
+    from dtoolcore.utils import get_io_hints
+
+    config_path = os.path.join(tmp_dir_fixture, "dtool.json")
+    with open(config_path, "w") as fh:
+        json.dump({"DTOOL_IO_DROP_CACHE": True}, fh)
+    assert get_io_hints(config_path) == (True, True)
+
+    reads = []
+    original = dtoolcore.utils._get_config_dict_from_file
+
+    def counting_read(path=None):
+        reads.append(path)
+        return original(path)
+
+    monkeypatch.setattr(
+        dtoolcore.utils,
+        "_get_config_dict_from_file",
+        counting_read
+    )
+    for _ in range(3):
+        assert get_io_hints(config_path) == (True, True)
+    assert reads == []
+
+    # Changes to the configuration file are picked up.
+    with open(config_path, "w") as fh:
+        json.dump({"DTOOL_IO_DROP_CACHE": False, "padding": 1}, fh)
+    assert get_io_hints(config_path) == (True, False)
+    assert len(reads) == 2
+
+
+def test_open_for_sequential_read(tmp_dir_fixture):  # NOQA
+    from dtoolcore.utils import open_for_sequential_read, drop_from_page_cache
+
+    fpath = os.path.join(tmp_dir_fixture, "sample.txt")
+    with open(fpath, "w") as fh:
+        fh.write("hello")
+
+    for io_hints in (True, False):
+        with open_for_sequential_read(fpath, io_hints=io_hints) as fh:
+            assert fh.read() == b"hello"
+            drop_from_page_cache(fh)
+
+
+def test_copy_file(tmp_dir_fixture):  # NOQA
+    from dtoolcore.utils import copy_file
+
+    src = os.path.join(tmp_dir_fixture, "src.bin")
+    dest = os.path.join(tmp_dir_fixture, "dest.bin")
+    content = os.urandom(3 * 1024 * 1024 + 7)
+    with open(src, "wb") as fh:
+        fh.write(content)
+
+    with tmp_env_var("DTOOL_IO_DROP_CACHE", "true"):
+        copy_file(src, dest)
+
+    with open(dest, "rb") as fh:
+        assert fh.read() == content
+
+
+def _record_copied_chunks(monkeypatch, copied_chunks):
+    import dtoolcore.utils
+
+    original = dtoolcore.utils._copy_chunk
+
+    def copy_chunk(*args):
+        copied = original(*args)
+        copied_chunks.append(copied)
+        return copied
+
+    monkeypatch.setattr(dtoolcore.utils, "_copy_chunk", copy_chunk)
+
+
+def test_copy_file_chunking(tmp_dir_fixture, monkeypatch):  # NOQA
+    from dtoolcore.utils import copy_file
+
+    src = os.path.join(tmp_dir_fixture, "src.bin")
+    dest = os.path.join(tmp_dir_fixture, "dest.bin")
+    content = os.urandom(10000)
+    with open(src, "wb") as fh:
+        fh.write(content)
+
+    copied_chunks = []
+    progress = []
+    _record_copied_chunks(monkeypatch, copied_chunks)
+    copy_file(src, dest, chunk_size=4096, progress_callback=progress.append)
+    assert copied_chunks == [4096, 4096, 1808]
+    assert progress == copied_chunks
+
+    with open(dest, "rb") as fh:
+        assert fh.read() == content
+
+
+def test_copy_file_fallback(tmp_dir_fixture, monkeypatch):  # NOQA
+    import errno
+    import dtoolcore.utils
+    from dtoolcore.utils import copy_file
+
+    src = os.path.join(tmp_dir_fixture, "src.bin")
+    dest = os.path.join(tmp_dir_fixture, "dest.bin")
+    content = os.urandom(10000)
+    with open(src, "wb") as fh:
+        fh.write(content)
+
+    original = dtoolcore.utils._copy_chunk
+    methods_used = []
+
+    def unsupported_kernel_copy(method, *args):
+        methods_used.append(method)
+        if method != "read_write":
+            raise OSError(errno.EXDEV, "Cross-device link")
+        return original(method, *args)
+
+    monkeypatch.setattr(
+        dtoolcore.utils,
+        "_copy_chunk",
+        unsupported_kernel_copy
+    )
+    copy_file(src, dest)
+
+    assert methods_used[-1] == "read_write"
+    with open(dest, "rb") as fh:
+        assert fh.read() == content
+
+    # Genuine I/O errors are not hidden by falling back.
+    def permission_denied(method, *args):
+        raise OSError(errno.EPERM, "Operation not permitted")
+
+    monkeypatch.setattr(dtoolcore.utils, "_copy_chunk", permission_denied)
+    with pytest.raises(OSError):
+        copy_file(src, dest)
+
+
+def test_copy_file_short_copy_raises(tmp_dir_fixture, monkeypatch):  # NOQA
+    import dtoolcore.utils
+    from dtoolcore.utils import copy_file
+
+    src = os.path.join(tmp_dir_fixture, "src.bin")
+    dest = os.path.join(tmp_dir_fixture, "dest.bin")
+    with open(src, "wb") as fh:
+        fh.write(os.urandom(10000))
+
+    original = dtoolcore.utils._copy_chunk
+    methods_used = []
+
+    def source_truncated(method, infd, outfd, offset, count):
+        methods_used.append(method)
+        if offset >= 4096:
+            return 0
+        return original(method, infd, outfd, offset, min(count, 4096))
+
+    monkeypatch.setattr(dtoolcore.utils, "_copy_chunk", source_truncated)
+    with pytest.raises(IOError):
+        copy_file(src, dest)
+
+    # The kernel copy methods are retried in user space before giving up.
+    assert methods_used[-1] == "read_write"
+
+
+def test_copy_file_sparse(tmp_dir_fixture, monkeypatch):  # NOQA
+    from dtoolcore.utils import copy_file
+
+    src = os.path.join(tmp_dir_fixture, "sparse.bin")
+    dest = os.path.join(tmp_dir_fixture, "dest.bin")
+    size = 8 * 1024 * 1024
+    with open(src, "wb") as fh:
+        fh.seek(size // 2)
+        fh.write(b"data")
+        fh.truncate(size)
+
+    copied_chunks = []
+    _record_copied_chunks(monkeypatch, copied_chunks)
+    copy_file(src, dest)
+
+    assert os.path.getsize(dest) == size
+    with open(src, "rb") as fh_src, open(dest, "rb") as fh_dest:
+        assert fh_src.read() == fh_dest.read()
+
+    # Holes are skipped if the file system reports them.
+    src_stat = os.stat(src)
+    if hasattr(src_stat, "st_blocks") and src_stat.st_blocks * 512 < size:
+        assert sum(copied_chunks) < size
@@ -0,0 +1,107 @@
+"""Test verification of dataset content against the manifest."""
+
+import os
+import time
+
+import pytest
+
+from . import tmp_uri_fixture  # NOQA
+from . import create_dataset
+
+
+def test_verify_intact_dataset(tmp_uri_fixture):  # NOQA
+
+    dataset = create_dataset(tmp_uri_fixture, "test_verify")
+
+    assert list(dataset.verify()) == []
+    assert list(dataset.verify(mode="quick")) == []
+    assert list(dataset.verify(mode="sampled", fraction=0.5, seed=1)) == []
+    assert list(dataset.verify(mode="full", num_threads=1)) == []
+
+
+def test_verify_detects_problems(tmp_uri_fixture):  # NOQA
+
+    from dtoolcore.utils import generate_identifier
+
+    dataset = create_dataset(tmp_uri_fixture, "test_verify")
+
+    tiny_id = generate_identifier("tiny.png")
+    actc_id = generate_identifier("actually_a_png.txt")
+    missing_id = generate_identifier("another_file.txt")
+
+    # Same size, different content.
+    tiny_fpath = dataset.item_content_abspath(tiny_id)
+    with open(tiny_fpath, "rb") as fh:
+        content = fh.read()
+    time.sleep(0.01)
+    with open(tiny_fpath, "wb") as fh:
+        fh.write(content[::-1])
+
+    # Different size.
+    with open(dataset.item_content_abspath(actc_id), "ab") as fh:
+        fh.write(b"extra")
+
+    os.unlink(dataset.item_content_abspath(missing_id))
+
+    full = {(i, p) for i, p, _, _ in dataset.verify(num_threads=2)}
+    assert full == {
+        (tiny_id, "hash"),
+        (actc_id, "size"),
+        (actc_id, "hash"),
+        (missing_id, "missing"),
+    }
+
+    quick = {(i, p) for i, p, _, _ in dataset.verify(mode="quick")}
+    assert quick == {
+        (tiny_id, "utc_timestamp"),
+        (actc_id, "size"),
+        (actc_id, "utc_timestamp"),
+        (missing_id, "missing"),
+    }
+
+    # A byte budget of zero does not allow any item to be hashed.
+    assert list(dataset.verify(mode="sampled", max_bytes=0)) == []
+
+
+def test_verify_sampled(tmp_uri_fixture):  # NOQA
+
+    from dtoolcore.compare import _sample_identifiers
+
+    dataset = create_dataset(tmp_uri_fixture, "test_verify")
+    num_items = len(list(dataset.identifiers))
+
+    assert len(_sample_identifiers(dataset, fraction=1.0)) == num_items
+    assert len(_sample_identifiers(dataset, fraction=0.01)) == 1
+    assert _sample_identifiers(dataset, fraction=0.5, seed=3) == \
+        _sample_identifiers(dataset, fraction=0.5, seed=3)
+
+    max_bytes = 1000
+    sampled = _sample_identifiers(dataset, max_bytes=max_bytes)
+    total = sum(dataset.item_properties(i)["size_in_bytes"] for i in sampled)
+    assert total <= max_bytes
+
+
+def test_verify_invalid_arguments(tmp_uri_fixture):  # NOQA
+
+    from dtoolcore import DtoolCoreValueError
+
+    dataset = create_dataset(tmp_uri_fixture, "test_verify")
+
+    # The arguments are checked when verify is called, not when the
+    # results are iterated over.
+    with pytest.raises(DtoolCoreValueError):
+        dataset.verify(mode="bogus")
+
+    with pytest.raises(DtoolCoreValueError):
+        dataset.verify(mode="sampled")
+
+
+def test_verify_quick_does_not_fetch_content(tmp_uri_fixture):  # NOQA
+
+    dataset = create_dataset(tmp_uri_fixture, "test_verify")
+
+    def get_item_abspath(identifier):
+        raise AssertionError("Quick verification fetched item content")
+
+    dataset._storage_broker.get_item_abspath = get_item_abspath
+    assert list(dataset.verify(mode="quick")) == []